@@ -1,10 +1,272 @@
-from collections import Counter
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import pathname2url
+import argparse
+import atexit
+import contextlib
+import copy
+import csv
+import functools
+import inspect
+import json
+import mmap
+import re
 import sqlite3
 import os
-from math import ceil
+import stat
+import queue
+import sys
+import threading
+from itertools import accumulate
+from math import ceil, log, sqrt
 import datetime
+import calendar
 import time
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# when False the pauses between printed lines are skipped, used by the non-interactive command line
+PACING = True
+
+
+def pause(seconds):
+    """
+    waits between printed lines so the interactive menu can be read as it scrolls by
+
+    :param seconds: accepts INT/FLOAT
+    :return: returns nothing
+    """
+    if PACING:
+        time.sleep(seconds)
+
+
+class Profiler:
+    """
+    Collects where the time of a run goes: every SQL statement with the rows it returned and its wall time (execute
+    plus fetching), call counts and timings of the analytic functions with the rows they were given and the rows they
+    kept, and the time spent in named stages. Only active when enabled, by the EXPENSE_PROFILE environment variable or
+    the --profile command line option.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """
+        forgets everything collected so far
+
+        :return: returns nothing
+        """
+        self.started = time.perf_counter()
+        self.queries = {}
+        self.functions = {}
+        self.stages = {}
+        self._stack = []
+
+    def _stage_figures(self):
+        name = "/".join(self._stack) or "(none)"
+        return self.stages.setdefault(name, dict(seconds=0.0, queries=0, query_seconds=0.0, rows_fetched=0))
+
+    def record_query(self, statement, rows, seconds):
+        """
+        :param statement: SQL statement in STR
+        :param rows: rows returned in INT
+        :param seconds: wall time in FLOAT
+        :return: returns nothing
+        """
+        statement = re.sub(r"\s+", " ", statement).strip()
+        figures = self.queries.setdefault(statement, dict(calls=0, rows=0, seconds=0.0))
+        figures["rows"] += rows
+        figures["seconds"] += seconds
+        stage = self._stage_figures()
+        stage["rows_fetched"] += rows
+        stage["query_seconds"] += seconds
+
+    def count_query(self, statement):
+        """
+        counts a statement being executed, the rows and time are added by record_query as they are fetched
+
+        :param statement: SQL statement in STR
+        :return: returns nothing
+        """
+        figures = self.queries.setdefault(re.sub(r"\s+", " ", statement).strip(), dict(calls=0, rows=0, seconds=0.0))
+        figures["calls"] += 1
+        self._stage_figures()["queries"] += 1
+
+    def record_call(self, name, seconds, rows_in, rows_out):
+        """
+        :param name: function name in STR
+        :param seconds: wall time in FLOAT
+        :param rows_in: rows the function was given in INT, or None
+        :param rows_out: rows the function returned in INT, or None
+        :return: returns nothing
+        """
+        figures = self.functions.setdefault(name, dict(calls=0, seconds=0.0, rows_in=0, rows_out=0))
+        figures["calls"] += 1
+        figures["seconds"] += seconds
+        figures["rows_in"] += rows_in or 0
+        figures["rows_out"] += rows_out or 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        context manager timing a named stage, stages can be nested
+
+        :param name: stage name in STR
+        """
+        if not self.enabled:
+            yield
+            return
+        self._stack.append(name)
+        figures = self._stage_figures()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            figures["seconds"] += time.perf_counter() - started
+            self._stack.pop()
+
+    def report(self, top=10):
+        """
+        :param top: OPTIONAL number of statements listed in INT
+        :return: returns a DICTIONARY with the top statements by time, the functions, the stages and row totals
+        """
+        queries = sorted(({"statement": statement, **figures} for statement, figures in self.queries.items()),
+                         key=lambda entry: entry["seconds"], reverse=True)
+        return dict(seconds=round(time.perf_counter() - self.started, 6),
+                    rows=dict(fetched=sum(entry["rows"] for entry in queries),
+                              scanned=sum(figures["rows_in"] for figures in self.functions.values()),
+                              used=sum(figures["rows_out"] for figures in self.functions.values())),
+                    queries=queries[:top], functions=self.functions, stages=self.stages)
+
+    def dump(self, path, top=10):
+        """
+        writes the report as JSON
+
+        :param path: file name in STR
+        :return: returns nothing
+        """
+        with open(path, "w") as file:
+            json.dump(self.report(top), file, indent=2)
+
+    def summary(self, top=10):
+        """
+        :return: returns the report as readable text in STR
+        """
+        report = self.report(top)
+        lines = ["Profile: {:.3f}s, {} rows fetched from the database, {} rows scanned and {} kept by the analytics"
+                 .format(report["seconds"], report["rows"]["fetched"], report["rows"]["scanned"],
+                         report["rows"]["used"]), "", "Top queries:"]
+        for entry in report["queries"]:
+            lines.append("  {:9.4f}s {:6} calls {:9} rows  {}".format(entry["seconds"], entry["calls"], entry["rows"],
+                                                                      entry["statement"][:100]))
+        lines += ["", "Functions:"]
+        for name, figures in sorted(report["functions"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append("  {:9.4f}s {:6} calls {:9} rows in {:9} rows out  {}"
+                         .format(figures["seconds"], figures["calls"], figures["rows_in"], figures["rows_out"], name))
+        lines += ["", "Stages:"]
+        for name, figures in report["stages"].items():
+            lines.append("  {:9.4f}s {:6} queries {:9.4f}s in SQL {:9} rows  {}"
+                         .format(figures["seconds"], figures["queries"], figures["query_seconds"],
+                                 figures["rows_fetched"], name))
+        return "\n".join(lines)
+
+    def write(self, destination):
+        """
+        :param destination: "-" to print the summary to STDERR, otherwise the path of the JSON file to write
+        :return: returns nothing
+        """
+        if destination == "-":
+            print(self.summary(), file=sys.stderr)
+        else:
+            self.dump(destination)
+
+
+# EXPENSE_PROFILE=1 prints a profile summary when the program ends, any other value is a JSON file to write it to
+PROFILER = Profiler(os.environ.get("EXPENSE_PROFILE", "") not in ("", "0"))
+
+
+def profiled(function):
+    """
+    decorator counting the calls and time of an analytic function in PROFILER, along with the rows it was given (its
+    last positional argument) and the rows it returned
+
+    :param function: accepts a function
+    :return: returns the wrapped function
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return function(*args, **kwargs)
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        rows_in = len(args[-1]) if args and hasattr(args[-1], "__len__") and not isinstance(args[-1], str) else None
+        rows_out = len(result) if isinstance(result, (list, ExpenseColumns)) else None
+        PROFILER.record_call(function.__qualname__, elapsed, rows_in, rows_out)
+        return result
+    return wrapper
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    cursor recording every statement it runs in PROFILER, with the rows fetched and the time taken
+    """
+
+    _statement = None
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        if self._statement is not None:
+            rows = len(result) if isinstance(result, list) else int(result is not None and result is not self)
+            PROFILER.record_query(self._statement, rows, time.perf_counter() - started)
+        return result
+
+    def execute(self, sql, parameters=()):
+        self._statement = sql
+        PROFILER.count_query(sql)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        self._statement = sql
+        PROFILER.count_query(sql)
+        return self._timed(super().executemany, sql, parameters)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    connection handing out ProfiledCursors, used for every connection opened while profiling is enabled
+    """
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
 
 def leap_year(year):
     """
@@ -48,237 +310,1520 @@ def week_of_month(dt):
     return int(ceil(adjusted_dom/7.0))
 
 
-def find_average(data):
+def to_cents(amount):
     """
-    averages total amounts from database dumps
+    converts a dollar amount to the amount of cents stored in the database
 
-    :param data: accepts multi-dimensional iterable data type
-    :return: returns the average in a FLOAT
+    :param amount: accepts INT, FLOAT or STR
+    :return: returns the amount of cents in INT
     """
-    total = 0
-    amount = len(data)
-    for entry in data:
-        total += entry[0]
-    average = total / amount
-    return round(average, 2)
+    return int(round(float(amount) * 100))
 
 
-def summing_it(data):
+def day_ordinal(date):
     """
-    Calculates sum of database dumps
+    converts a date to the day ordinal stored in the database, 0001-01-01 being day 1
 
-    :param data: accepts multi-dimensional iterable data type
-    :return: returns total amount in a FLOAT
+    :param date: accepts DATE object or STR in YYYY-MM-DD format
+    :return: returns the day ordinal in INT
     """
-    if data is None:
-        print("Something's gone horribly wrong.")
+    if isinstance(date, datetime.date):
+        return date.toordinal()
+    year, month, day = (int(part) for part in str(date).split("-"))
+    if year < datetime.MINYEAR:
+        # no expense can be dated before year 1, so every day of year 0 maps to the day before the first possible one
         return 0
-    total = 0
-    for entry in data:
-        total += entry[0]
-    return round(total, 2)
+    return datetime.date(year, month, day).toordinal()
 
 
-def parse_by_category(category, data):
+def year_bounds(year):
     """
-    filters database content by category from dumps
+    calculates the first and last day of a year in the format dates are stored in the database
 
-    :param category: accepts string
-    :param data: accepts multi-dimensional iterable data type
-    :return: returns filtered multi-dimensional LIST containing TUPLES
+    :param year: accepts INT from 0-9999
+    :return: returns a TUPLE of two STR in YYYY-MM-DD format
     """
-    new_dat = []
-    for entry in data:
-        if entry[1] == category:
-            new_dat.append(entry)
-    return new_dat
+    return "{:04d}-01-01".format(year), "{:04d}-12-31".format(year)
 
 
-def parse_by_year(year, data):
+def month_bounds(month, year):
     """
-    filters database content by year from dumps
+    calculates the first and last day of a month in the format dates are stored in the database
 
+    :param month: accepts INT from 1-12
     :param year: accepts INT from 0-9999
-    :param data: accepts multi-dimensional iterable data type
-    :return: returns filtered multi-dimensional LIST containing TUPLES
+    :return: returns a TUPLE of two STR in YYYY-MM-DD format
     """
-    new_dat = []
-    for entry in data:
-        date = datetime.datetime.strptime(entry[3], "%Y-%m-%d")
-        if date.year == year:
-            new_dat.append(entry)
-    return new_dat
+    last_day = calendar.monthrange(year, month)[1]
+    return "{:04d}-{:02d}-01".format(year, month), "{:04d}-{:02d}-{:02d}".format(year, month, last_day)
 
 
-def parse_by_month(month, data):
+def week_of_month_bounds(week, month, year):
     """
-    filters database content by month from dumps
+    calculates the first and last day of a week of the month, using the same week numbering as week_of_month
 
+    :param week: accepts INT from 1-5
     :param month: accepts INT from 1-12
-    :param data: accepts multi-dimensional iterable data type
-    :return: returns filtered multi-dimensional LIST containing TUPLES
+    :param year: accepts INT from 0-9999
+    :return: returns a TUPLE of two STR in YYYY-MM-DD format, or None if the month has no such week
     """
-    new_dat = []
-    for entry in data:
-        date = datetime.datetime.strptime(entry[3], "%Y-%m-%d")
-        if date.month == month:
-            new_dat.append(entry)
-    return new_dat
+    first_weekday, last_day = calendar.monthrange(year, month)
+    first = max(1, (week - 1) * 7 - first_weekday + 1)
+    last = min(last_day, week * 7 - first_weekday)
+    if first > last:
+        return None
+    return "{:04d}-{:02d}-{:02d}".format(year, month, first), "{:04d}-{:02d}-{:02d}".format(year, month, last)
 
 
-def parse_by_week_of_month(week, data):
+# first month of the fiscal year, fiscal years are named after the calendar year they end in
+FISCAL_YEAR_START = 1
+
+
+def last_days_bounds(days, today=None):
     """
-    filters data by week of the month
+    calculates the first and last day of the last days days, today included
 
-    :param week: accepts INT from 1-5
-    :param data: accepts multi-dimensional iterable data type
-    :return: returns filtered multi-dimensional LIST containing TUPLES
+    :param days: accepts INT of at least 1
+    :param today: OPTIONAL accepts DATE object, defaults to today
+    :return: returns a TUPLE of two STR in YYYY-MM-DD format
     """
-    new_dat = []
-    for entry in data:
-        date = datetime.datetime.strptime(entry[3], "%Y-%m-%d")
-        if week_of_month(date) == week:
-            new_dat.append(entry)
-    return new_dat
+    today = today or datetime.date.today()
+    return str(today - datetime.timedelta(days=days - 1)), str(today)
 
 
-def category_breakdown(data):
+def fiscal_year_bounds(year, start_month=FISCAL_YEAR_START):
     """
-    takes iterable data type (raw database dumps) and analyzes the categories and the amount of instances of each
+    calculates the first and last day of a fiscal year
 
-    :param data: accepts multi-dimensional iterable data type
-    :return: DICTIONARY of CATEGORY as STR: NUMBER OF INSTANCES in INT for all the categories in the original iterable
+    :param year: accepts INT from 1-9999, the calendar year the fiscal year ends in
+    :param start_month: OPTIONAL first month of the fiscal year in INT from 1-12
+    :return: returns a TUPLE of two STR in YYYY-MM-DD format
     """
-    categories = []
-    for entry in data:
-        categories.append(entry[1])
-    cat_set = set(categories)
-    cat_amount = Counter(categories)
-    cat_dict = {}
-    for word in cat_set:
-        new_dic = {word: cat_amount[word]}
-        cat_dict.update(new_dic)
-    return cat_dict
+    if start_month == 1:
+        return year_bounds(year)
+    return month_bounds(start_month, year - 1)[0], month_bounds(start_month - 1, year)[1]
 
 
-def compare_month_year_diff_averages(monthly, yearly):
+def fiscal_quarter_bounds(quarter, year, start_month=FISCAL_YEAR_START):
     """
-    Compares two sets of iterable data types which contain categories and category averages and determines which
-    is greater or if they are the same and outputs a new list with the difference between the two.
+    calculates the first and last day of a quarter of a fiscal year
 
-    :param monthly: accepts multi-dimensional iterable data type
-    :param yearly: accepts multi-dimensional iterable data type
-    :return: returns a LIST containing LISTS containing 3 indexes which are category in STR format,
-            the difference between the monthly and yearly average in FLOAT,
-            and a STR which indicates if the monthly average is higher, lower or the same as the yearly average.
+    :param quarter: accepts INT from 1-4
+    :param year: accepts INT from 1-9999, the calendar year the fiscal year ends in
+    :param start_month: OPTIONAL first month of the fiscal year in INT from 1-12
+    :return: returns a TUPLE of two STR in YYYY-MM-DD format
     """
-    new_dat = []
-    counter = 0
-    for entry in monthly:
-        if entry[1] > yearly[counter][1]:
-            diff = round(entry[1] - yearly[counter][1], 2)
-            new_dat.append([entry[0], diff, "above"])
-        elif entry[1] < yearly[counter][1]:
-            diff = round(yearly[counter][1] - entry[1], 2)
-            new_dat.append([entry[0], diff, "below"])
-        elif entry[1] == yearly[counter][1]:
-            new_dat.append([entry[0], entry[1], "and it is the same as"])
-        counter += 1
-    return new_dat
+    # months from january of the year before the fiscal year ends to the first month of the quarter
+    offset = (start_month - 1 if start_month != 1 else 12) + (quarter - 1) * 3
+    first_year, first_month = divmod(offset, 12)
+    last_year, last_month = divmod(offset + 2, 12)
+    return (month_bounds(first_month + 1, year - 1 + first_year)[0],
+            month_bounds(last_month + 1, year - 1 + last_year)[1])
 
 
-def final_data_display(data):
+class DateIndex:
     """
-    function for displaying formatted database information to the user.
-
-    :param data: accepts multi-dimensional iterable data type
-    :return: returns nothing, displays data via print
+    Expenses sorted by date, with the running total of their amounts in cents. Any date range is found with two
+    binary searches, so its count, total and average cost O(log n) and listing it costs only the rows listed.
+    Expenses dated after the last one are appended in O(1), earlier ones shift the rows after them.
     """
-    for entry in data:
-        print("\n Amount: ${}\n Category: {}\n Note: {}\n Date: {}".format(entry[0], entry[1], entry[2], entry[3]))
-        time.sleep(.5)
-    total = summing_it(data)
-    print()
-    print("Total amount spent: $" + str(total))
-    time.sleep(.5)
 
+    def __init__(self, rows=()):
+        """
+        :param rows: OPTIONAL accepts multi-dimensional iterable data type of database dumps, in any order
+        """
+        self.days = []
+        self.rows = []
+        # prefix[i] is the sum in cents of the first i expenses
+        self.prefix = array("q", [0])
+        self.add(rows)
 
-def category_display_and_choice():
-    """
-    function that displays a menu of the available categories to the user and forces them to choose one.
+    def __len__(self):
+        return len(self.rows)
 
-    :return: returns the user's choice of category in STR format
-    """
-    categories = user.grab_categories()
-    print("Please choose a category by number. The Categories are: ")
-    counter = 1
-    for entry in categories:
-        print(str(counter) + ". " + entry)
-        counter += 1
-    while True:
-        try:
-            choice_category = int(input("Please choose a category by number [1, 2 etc]: "))
-            if choice_category in range(1, counter):
-                break
-            else:
-                print("Please select an appropriate value.")
-        except ValueError:
-            print("Please select an appropriate value.")
-    return categories[choice_category - 1]
+    def add(self, rows):
+        """
+        adds expenses to the index
 
+        :param rows: accepts multi-dimensional iterable data type of database dumps, or the TUPLES accepted by
+                User._insert_expenses
+        :return: returns nothing
+        """
+        entries = []
+        for entry in rows:
+            day, cents = day_ordinal(entry[3]), to_cents(entry[0])
+            entries.append((day, cents, cents / 100.0, entry[1], entry[2], str(datetime.date.fromordinal(day))))
+        if not entries:
+            return
+        entries.sort(key=lambda entry: entry[0])
+        start = bisect_right(self.days, entries[0][0])
+        if start < len(self.days):
+            # merges the new expenses with the ones they are dated among, keeping the order of equal days
+            tail = [(self.days[index], self.prefix[index + 1] - self.prefix[index]) + row
+                    for index, row in enumerate(self.rows[start:], start)]
+            entries = sorted(tail + entries, key=lambda entry: entry[0])
+            del self.days[start:], self.rows[start:], self.prefix[start + 1:]
+        self.extend_sorted(entries)
+
+    def extend_sorted(self, rows):
+        """
+        appends expenses dated on or after the last one without sorting or converting them
 
-def user_input_year():
-    """
-    Function for coercing proper date value from the user
+        :param rows: accepts iterable of TUPLES (DAY as INT, CENTS as INT, AMOUNT, CATEGORY, NOTE, DATE) sorted by day
+        :return: returns nothing
+        """
+        total = self.prefix[-1]
+        for entry in rows:
+            total += entry[1]
+            self.days.append(entry[0])
+            self.rows.append(entry[2:])
+            self.prefix.append(total)
+
+    def _span(self, start, end):
+        """
+        :return: returns a TUPLE of the indexes of the first expense in the range and of the one after the range
+        """
+        low = 0 if start is None else bisect_left(self.days, day_ordinal(start))
+        high = len(self.days) if end is None else bisect_right(self.days, day_ordinal(end))
+        return low, max(low, high)
 
-    :return: returns an INT between 0 and 9999
-    """
-    while True:
-        try:
-            year = int(input("Please choose a year [0-9999]: "))
-            if year in range(0, 10000):
-                break
-            else:
-                print("Please select an appropriate value.")
-        except ValueError:
-            print("Please select an appropriate value.")
-    return year
+    def between(self, start=None, end=None):
+        """
+        :param start: OPTIONAL first day included, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: OPTIONAL last day included, accepts DATE object or STR in YYYY-MM-DD format
+        :return: returns a LIST of the TUPLES in the range, oldest first
+        """
+        low, high = self._span(start, end)
+        return self.rows[low:high]
 
+    def count(self, start=None, end=None):
+        """
+        :return: returns the number of expenses in the range in INT
+        """
+        low, high = self._span(start, end)
+        return high - low
 
-def user_input_month():
-    """
-    Function for coercing proper date value from the user
+    def total(self, start=None, end=None):
+        """
+        :return: returns the sum of the amounts in the range as FLOAT
+        """
+        low, high = self._span(start, end)
+        return (self.prefix[high] - self.prefix[low]) / 100.0
 
-    :return: returns an INT between 1 and 12
-    """
-    while True:
-        try:
-            month = int(input("Please choose a month [1-12]: "))
-            if month in range(1, 13):
-                break
-            else:
-                print("Please select an appropriate value.")
-        except ValueError:
-            print("Please select an appropriate value.")
-    return month
+    def average(self, start=None, end=None):
+        """
+        :return: returns the mean of the amounts in the range as FLOAT, raises ZeroDivisionError if it is empty
+        """
+        low, high = self._span(start, end)
+        return round((self.prefix[high] - self.prefix[low]) / 100.0 / (high - low), 2)
 
 
-def user_input_day(month, year):
-    """
-        Function for coercing proper day, date value from the user
+# widths in days of the moving windows of User.trends
+TREND_WINDOWS = (7, 30, 90)
 
-    :param month: accepts an INT between 1 and 12
-    :param year: accepts an INT between 0 and 9999
-    :return: returns an INT between 1 and 31
+# one point of a trend series: the total in dollars, number of expenses and average expense of the window ending on
+# date, and the total divided by the days of the window
+TrendPoint = namedtuple("TrendPoint", ["date", "total", "count", "average", "daily_average"])
+
+# spending of a category in a month against the month before and the same month a year before, the changes are
+# percentages, or None if there was no spending to compare against
+MonthChange = namedtuple("MonthChange", ["category", "year", "month", "total", "previous_total", "month_change",
+                                         "year_ago_total", "year_change"])
+
+
+class DailyTotals:
     """
-    is_leap_year = leap_year(year)
-    while True:
-        try:
-            day = int(input("Please choose a day [1-31]: "))
-            if day == 31 and (month == 4 or month == 6 or month == 9 or month == 11):
-                print("Wait a second...That month doesn't have a 31st day...Let's try again")
-                continue
-            elif month == 2 and day > 28:
+    Spending of every day of a range, with the running totals of its cents and number of expenses. The spending of
+    any window of days is the difference of two running totals, so a whole moving window series costs O(n) in the
+    days of the range, however wide the window is.
+    """
+
+    def __init__(self, start, end, days=(), history=0):
+        """
+        :param start: first day of the series, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: last day of the series, accepts DATE object or STR in YYYY-MM-DD format
+        :param days: OPTIONAL accepts iterable of TUPLES (DAY as INT ordinal, COUNT as INT, CENTS as INT) in any order,
+                a day may appear more than once
+        :param history: OPTIONAL number of days before start in INT included in days, so the moving windows at the
+                start of the series are full
+        """
+        self.first = day_ordinal(start)
+        self.start = self.first - history
+        size = max(0, day_ordinal(end) - self.start + 1)
+        counts = [0] * size
+        cents = [0] * size
+        for day, count, total in days:
+            index = day - self.start
+            if 0 <= index < size:
+                counts[index] += count
+                cents[index] += total
+        # counts[i] and cents[i] are the sums of the first i days
+        self.counts = array("q", accumulate(counts, initial=0))
+        self.cents = array("q", accumulate(cents, initial=0))
+
+    def __len__(self):
+        return max(0, len(self.cents) - 1 - (self.first - self.start))
+
+    def _point(self, index, low, days):
+        """
+        :return: returns the TrendPoint of the days from index low to index, both included
+        """
+        cents = self.cents[index + 1] - self.cents[low]
+        count = self.counts[index + 1] - self.counts[low]
+        return TrendPoint(date=str(datetime.date.fromordinal(self.start + index)), total=cents / 100.0, count=count,
+                          average=round(cents / 100.0 / count, 2) if count else 0.0,
+                          daily_average=round(cents / 100.0 / days, 2))
+
+    def moving(self, window):
+        """
+        :param window: accepts INT of at least 1, the days in the window, the day of the point included
+        :return: returns a LIST with a TrendPoint for every day of the series, windows reaching before the loaded
+                history are shortened
+        """
+        return [self._point(index, max(0, index - window + 1), min(window, index + 1))
+                for index in range(self.first - self.start, len(self.cents) - 1)]
+
+    def daily(self):
+        """
+        :return: returns a LIST with the TrendPoint of every day of the series on its own
+        """
+        return self.moving(1)
+
+    def cumulative(self):
+        """
+        :return: returns a LIST with a TrendPoint for every day of the series, totaling the spending from the first
+                day of the series
+        """
+        first = self.first - self.start
+        return [self._point(index, first, index - first + 1) for index in range(first, len(self.cents) - 1)]
+
+
+def _percent_change(total, base):
+    """
+    :return: returns the change from base to total as a percentage of base in FLOAT, or None if base is 0 or None
+    """
+    if not base:
+        return None
+    return round((total - base) / base * 100, 2)
+
+
+@profiled
+def month_changes(groups):
+    """
+    computes the month over month and year over year change of the spending of every category in one pass over
+    monthly totals
+
+    :param groups: accepts iterable of TUPLES (CATEGORY as STR, YEAR as INT, MONTH as INT, TOTAL as FLOAT)
+    :return: returns a LIST of MonthChange sorted by category, year and month, for every month a category has
+            spending in. The spending of all the categories together is listed under the category ""
+    """
+    totals = {}
+    for category, year, month, total in groups:
+        for key in ((category, year, month), ("", year, month)):
+            totals[key] = totals.get(key, 0) + total
+    changes = []
+    for category, year, month in sorted(totals):
+        total = round(totals[category, year, month], 2)
+        previous = totals.get((category, year, month - 1) if month > 1 else (category, year - 1, 12))
+        year_ago = totals.get((category, year - 1, month))
+        changes.append(MonthChange(category=category, year=year, month=month, total=total,
+                                   previous_total=round(previous or 0, 2),
+                                   month_change=_percent_change(total, previous),
+                                   year_ago_total=round(year_ago or 0, 2),
+                                   year_change=_percent_change(total, year_ago)))
+    return changes
+
+
+# percentages of a budget reported when a write takes the spending past them
+BUDGET_THRESHOLDS = (50, 80, 100)
+
+# a budget against the spending of its period, amounts in dollars. month is None for a yearly budget, budget,
+# remaining and percentage are None for a category without a budget. crossed lists the BUDGET_THRESHOLDS the write
+# which produced it went past, it is empty when it wasn't produced by a write
+BudgetStatus = namedtuple("BudgetStatus", ["category", "period", "year", "month", "budget", "spent", "remaining",
+                                           "percentage", "crossed"])
+
+
+def budget_status(category, period, year, month, budget, spent, before=None):
+    """
+    :param category: accepts STR
+    :param period: "month" or "year" in STR
+    :param year: accepts INT from 0-9999
+    :param month: accepts INT from 1-12, or None for a yearly budget
+    :param budget: the budget in cents as INT, or None
+    :param spent: the spending of the period in cents as INT
+    :param before: OPTIONAL the spending of the period in cents before a write as INT
+    :return: returns a BudgetStatus
+    """
+    if budget is None:
+        return BudgetStatus(category, period, year, month, None, spent / 100.0, None, None, [])
+    crossed = [] if before is None else [threshold for threshold in BUDGET_THRESHOLDS
+                                         if before * 100 < budget * threshold <= spent * 100]
+    return BudgetStatus(category, period, year, month, budget / 100.0, spent / 100.0, (budget - spent) / 100.0,
+                        round(spent / budget * 100, 2) if budget else 0.0, crossed)
+
+
+# upper bounds in dollars of the amount buckets counted by StreamingStats, the last bucket has no upper bound
+HISTOGRAM_EDGES = (10, 25, 50, 100, 250, 500, 1000)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative accuracy (the DDSketch algorithm). Amounts are counted in logarithmic
+    buckets, bucket i holding the amounts between gamma ** (i - 1) and gamma ** i, so every quantile is within
+    accuracy of its true value while memory only grows with the log of the range of the amounts. Sketches of
+    different months or users are merged by adding their bucket counts.
+    """
+
+    def __init__(self, accuracy=0.01):
+        """
+        :param accuracy: OPTIONAL relative accuracy of the quantiles in FLOAT
+        """
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, amount):
+        """
+        :param amount: accepts INT/FLOAT
+        :return: returns nothing
+        """
+        self.count += 1
+        if amount > 0:
+            key = ceil(log(amount) / self._log_gamma)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif amount < 0:
+            key = ceil(log(-amount) / self._log_gamma)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zeros += 1
+
+    def merge(self, other):
+        """
+        adds the counts of another sketch with the same accuracy to this one
+
+        :param other: accepts QuantileSketch
+        :return: returns nothing
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError("sketches of different accuracy can't be merged")
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, fraction):
+        """
+        :param fraction: accepts FLOAT between 0 and 1, 0.5 for the median
+        :return: returns the estimated quantile as FLOAT, or None if the sketch is empty
+        """
+        if self.count == 0:
+            return None
+        rank = fraction * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def as_dict(self):
+        """
+        :return: returns the sketch as a DICTIONARY which can be written as JSON and read back with from_dict
+        """
+        return dict(accuracy=self.accuracy, positive=self.positive, negative=self.negative, zeros=self.zeros,
+                    count=self.count)
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        :param values: accepts a DICTIONARY from as_dict, also after a round trip through JSON
+        :return: returns a QuantileSketch
+        """
+        sketch = cls(values["accuracy"])
+        sketch.positive = {int(key): count for key, count in values["positive"].items()}
+        sketch.negative = {int(key): count for key, count in values["negative"].items()}
+        sketch.zeros = values["zeros"]
+        sketch.count = values["count"]
+        return sketch
+
+
+class StreamingStats:
+    """
+    Spending statistics computed in a single pass at constant memory: count, total, min and max, the mean and
+    standard deviation with Welford's algorithm, quantiles from a QuantileSketch and a histogram over HISTOGRAM_EDGES.
+    Statistics of different periods or users are combined with merge without going back to the rows.
+    """
+
+    def __init__(self, accuracy=0.01):
+        """
+        :param accuracy: OPTIONAL relative accuracy of the quantiles in FLOAT
+        """
+        self.count = 0
+        self.cents = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(accuracy)
+        self.histogram = [0] * (len(HISTOGRAM_EDGES) + 1)
+
+    def add(self, amount):
+        """
+        :param amount: dollar amount in INT/FLOAT
+        :return: returns nothing
+        """
+        self.count += 1
+        self.cents += to_cents(amount)
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (amount - self.mean)
+        self.min = amount if self.min is None else min(self.min, amount)
+        self.max = amount if self.max is None else max(self.max, amount)
+        self.sketch.add(amount)
+        self.histogram[bisect_right(HISTOGRAM_EDGES, amount)] += 1
+
+    def merge(self, other):
+        """
+        adds the statistics of other to this one, using the parallel form of Welford's algorithm
+
+        :param other: accepts StreamingStats
+        :return: returns nothing
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.cents += other.cents
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        self.histogram = [mine + theirs for mine, theirs in zip(self.histogram, other.histogram)]
+
+    def std(self):
+        """
+        :return: returns the population standard deviation as FLOAT, 0 with less than two amounts
+        """
+        return sqrt(self._m2 / self.count) if self.count > 1 else 0.0
+
+    def summary(self):
+        """
+        :return: returns a DICTIONARY of the statistics rounded to cents, the quantiles are within the accuracy of
+                the sketch. The histogram is keyed by bucket labels such as "10-25" and "1000+".
+        """
+        def cents(value):
+            return None if value is None else round(value, 2)
+
+        def quantile(fraction):
+            # an estimate can be past the smallest or largest amount by up to the accuracy of the sketch
+            value = self.sketch.quantile(fraction)
+            return None if value is None else cents(min(max(value, self.min), self.max))
+
+        labels = ["<{}".format(HISTOGRAM_EDGES[0])]
+        labels += ["{}-{}".format(low, high) for low, high in zip(HISTOGRAM_EDGES, HISTOGRAM_EDGES[1:])]
+        labels += ["{}+".format(HISTOGRAM_EDGES[-1])]
+        return dict(count=self.count, total=self.cents / 100.0, mean=cents(self.mean if self.count else None),
+                    std=cents(self.std()), min=cents(self.min), max=cents(self.max),
+                    median=quantile(0.5), p90=quantile(0.9), p99=quantile(0.99),
+                    histogram=dict(zip(labels, self.histogram)))
+
+    def as_dict(self):
+        """
+        :return: returns the full state as a DICTIONARY which can be written as JSON and read back with from_dict
+        """
+        return dict(count=self.count, cents=self.cents, mean=self.mean, m2=self._m2, min=self.min, max=self.max,
+                    sketch=self.sketch.as_dict(), histogram=self.histogram)
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        :param values: accepts a DICTIONARY from as_dict
+        :return: returns a StreamingStats
+        """
+        stats = cls(values["sketch"]["accuracy"])
+        stats.count, stats.cents, stats.min, stats.max = values["count"], values["cents"], values["min"], values["max"]
+        stats.mean, stats._m2 = values["mean"], values["m2"]
+        stats.sketch = QuantileSketch.from_dict(values["sketch"])
+        stats.histogram = list(values["histogram"])
+        return stats
+
+
+# an expense is unusual when it is more than ANOMALY_Z standard deviations above the mean amount of its category,
+# once the category has ANOMALY_MIN_COUNT expenses. The deviation counts as at least a tenth of the mean, so a
+# category whose amounts never vary doesn't flag every cent above them
+ANOMALY_Z = 3.0
+ANOMALY_MIN_COUNT = 10
+
+# a category spikes when its spending of a week goes past ANOMALY_SPIKE times its weekly average, once
+# ANOMALY_MIN_WEEKS weeks are behind it. The weekly average is exponentially weighted, the newest week weighing
+# ANOMALY_ALPHA, so it follows changes of habit within a few weeks
+ANOMALY_SPIKE = 2.0
+ANOMALY_MIN_WEEKS = 4
+ANOMALY_ALPHA = 0.2
+
+# an unusual expense or week found by a write, amounts in dollars. kind is "amount" for an expense far above the
+# norm of its category, expected being the mean amount and score the number of standard deviations, or "week" for
+# the expense which took the spending of its week past the spike, amount and expected being the spending of the
+# week and the weekly average and score their ratio
+Anomaly = namedtuple("Anomaly", ["kind", "category", "amount", "date", "expected", "score"])
+
+
+class SpendingNorm:
+    """
+    Online norm of the spending of one category, one row of ANOMALY_STATE: the count, mean and sum of squared
+    deviations of its amounts with Welford's algorithm, and the exponentially weighted average of its weekly
+    spending. Weeks start on Monday and are numbered from the day ordinals, see day_ordinal. Every expense updates
+    the norm in constant time and space without going back to the rows.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, week=None, week_cents=0, weeks=0, week_average=0.0):
+        """
+        :param count: OPTIONAL number of expenses in INT
+        :param mean: OPTIONAL mean amount in cents as FLOAT
+        :param m2: OPTIONAL sum of squared deviations from the mean in cents as FLOAT
+        :param week: OPTIONAL number of the latest week in INT, None before the first expense
+        :param week_cents: OPTIONAL spending of the latest week in cents as INT
+        :param weeks: OPTIONAL number of weeks before the latest in INT, empty weeks included
+        :param week_average: OPTIONAL weighted average of the spending of the weeks before the latest in cents as
+                FLOAT
+        """
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.week = week
+        self.week_cents = week_cents
+        self.weeks = weeks
+        self.week_average = week_average
+
+    def std(self):
+        """
+        :return: returns the population standard deviation of the amounts in cents as FLOAT
+        """
+        return sqrt(self.m2 / self.count) if self.count > 1 else 0.0
+
+    def _close_weeks(self, week):
+        """
+        folds the weeks before week into the weekly average, the ones without expenses as weeks of no spending
+
+        :param week: accepts INT later than self.week
+        :return: returns nothing
+        """
+        if self.weeks:
+            self.week_average = ANOMALY_ALPHA * self.week_cents + (1 - ANOMALY_ALPHA) * self.week_average
+        else:
+            self.week_average = float(self.week_cents)
+        empty = week - self.week - 1
+        self.week_average *= (1 - ANOMALY_ALPHA) ** empty
+        self.weeks += 1 + empty
+        self.week = week
+        self.week_cents = 0
+
+    def add(self, cents, day):
+        """
+        checks an expense against the norm and then adds it. A backdated expense of a week before the latest counts
+        towards the amounts but not towards the weekly average, which only moves forward.
+
+        :param cents: amount in cents as INT
+        :param day: day ordinal in INT, see day_ordinal
+        :return: returns a LIST of TUPLES (kind, expected in cents as FLOAT, score as FLOAT), see Anomaly
+        """
+        found = []
+        if self.count >= ANOMALY_MIN_COUNT:
+            deviation = max(self.std(), self.mean / 10)
+            if deviation and cents - self.mean > ANOMALY_Z * deviation:
+                found.append(("amount", self.mean, (cents - self.mean) / deviation))
+        self.count += 1
+        delta = cents - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (cents - self.mean)
+        week = (day - 1) // 7
+        if self.week is None:
+            self.week = week
+        elif week > self.week:
+            self._close_weeks(week)
+        if week == self.week:
+            before = self.week_cents
+            self.week_cents += cents
+            limit = ANOMALY_SPIKE * self.week_average
+            if self.weeks >= ANOMALY_MIN_WEEKS and self.week_average and before <= limit < self.week_cents:
+                found.append(("week", self.week_average, self.week_cents / self.week_average))
+        return found
+
+    def merge(self, other):
+        """
+        adds the norm of other to this one, for categories which are merged. The amounts are combined with the
+        parallel form of Welford's algorithm and the weekly averages, which are linear in the spending, are added
+        once both are at the same week.
+
+        :param other: accepts SpendingNorm
+        :return: returns nothing
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.__init__(*other.row())
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        other = SpendingNorm(*other.row())
+        if other.week < self.week:
+            other._close_weeks(self.week)
+        elif other.week > self.week:
+            self._close_weeks(other.week)
+        self.week_cents += other.week_cents
+        self.week_average += other.week_average
+        self.weeks = max(self.weeks, other.weeks)
+
+    def row(self):
+        """
+        :return: returns the norm as a TUPLE of the ANOMALY_STATE columns after CATEGORY_ID
+        """
+        return self.count, self.mean, self.m2, self.week, self.week_cents, self.weeks, self.week_average
+
+
+class ExpenseColumns:
+    """
+    Columnar in-memory snapshot of expenses. Amounts (in cents), dates (as day ordinals plus year, month and day of
+    month) and categories (as INT codes into a list of names) are each kept in a compact array. When NumPy is
+    installed sums, means, group-bys and filters run vectorized over zero-copy views of the arrays, otherwise they
+    loop over them.
+
+    Iterating over a snapshot yields the same (AMOUNT, CATEGORY, NOTE, DATE) TUPLES as User.grab_data, so it can be
+    passed to any function which accepts database dumps.
+    """
+
+    def __init__(self, rows=()):
+        """
+        :param rows: OPTIONAL accepts multi-dimensional iterable data type of database dumps
+        """
+        self.cents = array("q")
+        self.days = array("l")
+        self.years = array("H")
+        self.months = array("B")
+        self.month_days = array("B")
+        self.codes = array("l")
+        self.notes = []
+        self.categories = []
+        self.category_codes = {}
+        self.append(rows)
+
+    def __len__(self):
+        return len(self.cents)
+
+    def __iter__(self):
+        for cents, code, note, day in zip(self.cents, self.codes, self.notes, self.days):
+            yield cents / 100.0, self.categories[code], note, str(datetime.date.fromordinal(day))
+
+    def _code(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self.category_codes[category] = code
+        return code
+
+    def append(self, rows):
+        """
+        adds rows to the end of the snapshot
+
+        :param rows: accepts multi-dimensional iterable data type of database dumps
+        :return: returns nothing
+        """
+        for entry in rows:
+            date = datetime.date.fromisoformat(str(entry[3]))
+            self.cents.append(to_cents(entry[0]))
+            self.days.append(date.toordinal())
+            self.years.append(date.year)
+            self.months.append(date.month)
+            self.month_days.append(date.day)
+            self.codes.append(self._code(entry[1]))
+            self.notes.append(entry[2])
+
+    def rename_category(self, category, new_category):
+        """
+        renames a category, merging it into new_category if that one is already present
+
+        :param category: accepts STR
+        :param new_category: accepts STR
+        :return: returns nothing
+        """
+        code = self.category_codes.pop(category, None)
+        if code is None:
+            return
+        new_code = self.category_codes.get(new_category)
+        if new_code is None:
+            self.categories[code] = new_category
+            self.category_codes[new_category] = code
+            return
+        if numpy is not None:
+            codes = self._vector(self.codes)
+            codes[codes == code] = new_code
+        else:
+            for index, entry in enumerate(self.codes):
+                if entry == code:
+                    self.codes[index] = new_code
+
+    @staticmethod
+    def _vector(column):
+        # columns are arrays, or memoryviews of a mapped snapshot
+        return numpy.frombuffer(column, dtype=column.typecode if isinstance(column, array) else column.format)
+
+    def _select(self, mask):
+        """
+        builds a new snapshot containing only the rows where mask is true
+
+        :param mask: accepts a NumPy boolean array, or a LIST of INT row indexes without NumPy
+        :return: returns a new ExpenseColumns sharing the category codes of this one
+        """
+        selected = ExpenseColumns()
+        selected.categories = list(self.categories)
+        selected.category_codes = dict(self.category_codes)
+        columns = ("cents", "days", "years", "months", "month_days", "codes")
+        if numpy is not None:
+            indexes = numpy.flatnonzero(mask)
+            for name in columns:
+                target = getattr(selected, name)
+                target.frombytes(self._vector(getattr(self, name))[indexes].astype(target.typecode).tobytes())
+        else:
+            indexes = mask
+            for name in columns:
+                column = getattr(self, name)
+                getattr(selected, name).extend(column[index] for index in indexes)
+        selected.notes = [self.notes[index] for index in indexes]
+        return selected
+
+    def _where(self, column, value):
+        if numpy is not None:
+            return self._select(self._vector(column) == value)
+        return self._select([index for index, entry in enumerate(column) if entry == value])
+
+    def where_category(self, category):
+        """
+        :param category: accepts STR
+        :return: returns a new ExpenseColumns with only the rows of the category
+        """
+        code = self.category_codes.get(category)
+        if code is None:
+            return self._select(numpy.zeros(len(self), dtype=bool) if numpy is not None else [])
+        return self._where(self.codes, code)
+
+    def where_year(self, year):
+        """
+        :param year: accepts INT from 0-9999
+        :return: returns a new ExpenseColumns with only the rows of the year
+        """
+        return self._where(self.years, year)
+
+    def where_month(self, month):
+        """
+        :param month: accepts INT from 1-12
+        :return: returns a new ExpenseColumns with only the rows of the month
+        """
+        return self._where(self.months, month)
+
+    def where_week_of_month(self, week):
+        """
+        :param week: accepts INT from 1-5, numbered the same as week_of_month
+        :return: returns a new ExpenseColumns with only the rows of the week of the month
+        """
+        # the ordinal of a monday is 1 modulo 7, so (day - month_day) % 7 is the weekday of the 1st of the month
+        if numpy is not None:
+            days = self._vector(self.days)
+            month_days = self._vector(self.month_days).astype(numpy.int64)
+            return self._select((month_days + (days - month_days) % 7 + 6) // 7 == week)
+        return self._select([index for index, (day, month_day) in enumerate(zip(self.days, self.month_days))
+                             if (month_day + (day - month_day) % 7 + 6) // 7 == week])
+
+    def between(self, start, end):
+        """
+        :param start: accepts DATE object, first day included
+        :param end: accepts DATE object, last day included
+        :return: returns a new ExpenseColumns with only the rows in the date range
+        """
+        start, end = start.toordinal(), end.toordinal()
+        if numpy is not None:
+            days = self._vector(self.days)
+            return self._select((days >= start) & (days <= end))
+        return self._select([index for index, day in enumerate(self.days) if start <= day <= end])
+
+    def total(self):
+        """
+        :return: returns the sum of the amounts as FLOAT
+        """
+        if numpy is not None:
+            return int(self._vector(self.cents).sum()) / 100.0
+        return sum(self.cents) / 100.0
+
+    def mean(self):
+        """
+        :return: returns the mean of the amounts as FLOAT, raises ZeroDivisionError if the snapshot is empty
+        """
+        return self.total() / len(self)
+
+    def category_totals(self):
+        """
+        group-by over the categories
+
+        :return: returns a DICTIONARY of CATEGORY as STR: LIST of [COUNT as INT, TOTAL as FLOAT] for every category
+                present in the snapshot
+        """
+        if numpy is not None:
+            codes = self._vector(self.codes)
+            counts = numpy.bincount(codes, minlength=len(self.categories))
+            totals = numpy.bincount(codes, weights=self._vector(self.cents), minlength=len(self.categories))
+            return {self.categories[code]: [int(counts[code]), int(totals[code]) / 100.0]
+                    for code in numpy.flatnonzero(counts)}
+        grouped = {}
+        for cents, code in zip(self.cents, self.codes):
+            figures = grouped.setdefault(code, [0, 0])
+            figures[0] += 1
+            figures[1] += cents
+        return {self.categories[code]: [count, total / 100.0] for code, (count, total) in grouped.items()}
+
+    def grouped_totals(self):
+        """
+        group-by over categories and months
+
+        :return: returns a LIST of TUPLES (CATEGORY as STR, MONTH as INT, COUNT as INT, TOTAL as FLOAT), the format
+                accepted by build_monthly_report
+        """
+        if numpy is not None:
+            keys = self._vector(self.codes) * 13 + self._vector(self.months)
+            size = len(self.categories) * 13
+            counts = numpy.bincount(keys, minlength=size)
+            totals = numpy.bincount(keys, weights=self._vector(self.cents), minlength=size)
+            return [(self.categories[key // 13], int(key % 13), int(counts[key]), int(totals[key]) / 100.0)
+                    for key in numpy.flatnonzero(counts)]
+        grouped = {}
+        for cents, code, month in zip(self.cents, self.codes, self.months):
+            figures = grouped.setdefault((code, month), [0, 0])
+            figures[0] += 1
+            figures[1] += cents
+        return [(self.categories[code], month, count, total / 100.0)
+                for (code, month), (count, total) in grouped.items()]
+
+
+@profiled
+def find_average(data):
+    """
+    averages total amounts from database dumps
+
+    :param data: accepts multi-dimensional iterable data type
+    :return: returns the average in a FLOAT
+    """
+    if isinstance(data, ExpenseColumns):
+        return round(data.mean(), 2)
+    total = 0
+    amount = 0
+    for entry in data:
+        total += entry[0]
+        amount += 1
+    average = total / amount
+    return round(average, 2)
+
+
+@profiled
+def summing_it(data):
+    """
+    Calculates sum of database dumps
+
+    :param data: accepts multi-dimensional iterable data type
+    :return: returns total amount in a FLOAT
+    """
+    if data is None:
+        print("Something's gone horribly wrong.")
+        return 0
+    if isinstance(data, ExpenseColumns):
+        return round(data.total(), 2)
+    total = 0
+    for entry in data:
+        total += entry[0]
+    return round(total, 2)
+
+
+def iter_by_category(category, data):
+    """
+    lazily filters database content by category, see parse_by_category
+
+    :param category: accepts string
+    :param data: accepts iterable data type, including generators
+    :return: yields the matching TUPLES
+    """
+    for entry in data:
+        if entry[1] == category:
+            yield entry
+
+
+def iter_by_year(year, data):
+    """
+    lazily filters database content by year, see parse_by_year
+
+    :param year: accepts INT from 0-9999
+    :param data: accepts iterable data type, including generators
+    :return: yields the matching TUPLES
+    """
+    for entry in data:
+        date = datetime.datetime.strptime(entry[3], "%Y-%m-%d")
+        if date.year == year:
+            yield entry
+
+
+def iter_by_month(month, data):
+    """
+    lazily filters database content by month, see parse_by_month
+
+    :param month: accepts INT from 1-12
+    :param data: accepts iterable data type, including generators
+    :return: yields the matching TUPLES
+    """
+    for entry in data:
+        date = datetime.datetime.strptime(entry[3], "%Y-%m-%d")
+        if date.month == month:
+            yield entry
+
+
+def iter_by_week_of_month(week, data):
+    """
+    lazily filters database content by week of the month, see parse_by_week_of_month
+
+    :param week: accepts INT from 1-5
+    :param data: accepts iterable data type, including generators
+    :return: yields the matching TUPLES
+    """
+    for entry in data:
+        date = datetime.datetime.strptime(entry[3], "%Y-%m-%d")
+        if week_of_month(date) == week:
+            yield entry
+
+
+@profiled
+def parse_by_category(category, data):
+    """
+    filters database content by category from dumps
+
+    :param category: accepts string
+    :param data: accepts multi-dimensional iterable data type
+    :return: returns filtered multi-dimensional LIST containing TUPLES
+    """
+    if isinstance(data, ExpenseColumns):
+        return data.where_category(category)
+    return list(iter_by_category(category, data))
+
+
+@profiled
+def parse_by_year(year, data):
+    """
+    filters database content by year from dumps
+
+    :param year: accepts INT from 0-9999
+    :param data: accepts multi-dimensional iterable data type
+    :return: returns filtered multi-dimensional LIST containing TUPLES
+    """
+    if isinstance(data, ExpenseColumns):
+        return data.where_year(year)
+    return list(iter_by_year(year, data))
+
+
+@profiled
+def parse_by_month(month, data):
+    """
+    filters database content by month from dumps
+
+    :param month: accepts INT from 1-12
+    :param data: accepts multi-dimensional iterable data type
+    :return: returns filtered multi-dimensional LIST containing TUPLES
+    """
+    if isinstance(data, ExpenseColumns):
+        return data.where_month(month)
+    return list(iter_by_month(month, data))
+
+
+@profiled
+def parse_by_week_of_month(week, data):
+    """
+    filters data by week of the month
+
+    :param week: accepts INT from 1-5
+    :param data: accepts multi-dimensional iterable data type
+    :return: returns filtered multi-dimensional LIST containing TUPLES
+    """
+    if isinstance(data, ExpenseColumns):
+        return data.where_week_of_month(week)
+    return list(iter_by_week_of_month(week, data))
+
+
+@profiled
+def category_breakdown(data):
+    """
+    takes iterable data type (raw database dumps) and analyzes the categories and the amount of instances of each
+
+    :param data: accepts multi-dimensional iterable data type
+    :return: DICTIONARY of CATEGORY as STR: NUMBER OF INSTANCES in INT for all the categories in the original iterable
+    """
+    if isinstance(data, ExpenseColumns):
+        return {category: figures[0] for category, figures in data.category_totals().items()}
+    categories = []
+    for entry in data:
+        categories.append(entry[1])
+    cat_set = set(categories)
+    cat_amount = Counter(categories)
+    cat_dict = {}
+    for word in cat_set:
+        new_dic = {word: cat_amount[word]}
+        cat_dict.update(new_dic)
+    return cat_dict
+
+
+@profiled
+def category_totals(data):
+    """
+    calculates the amount of transactions and the total amount spent for every category in one pass over the data
+
+    :param data: accepts multi-dimensional iterable data type
+    :return: DICTIONARY of CATEGORY as STR: LIST of [COUNT as INT, TOTAL as FLOAT]
+    """
+    if isinstance(data, ExpenseColumns):
+        return data.category_totals()
+    totals = {}
+    for entry in data:
+        figures = totals.setdefault(entry[1], [0, 0])
+        figures[0] += 1
+        figures[1] += entry[0]
+    return totals
+
+
+def _rollup_average(totals):
+    """
+    averages the transaction amount over rollup totals
+
+    :param totals: accepts DICTIONARY of CATEGORY as STR: LIST of [COUNT as INT, TOTAL as FLOAT]
+    :return: returns the average in a FLOAT
+    """
+    count = sum(figures[0] for figures in totals.values())
+    total = sum(figures[1] for figures in totals.values())
+    return round(total / count, 2)
+
+
+@profiled
+def category_statistics(data):
+    """
+    computes the spending statistics of every category in one pass over database dumps, so a cursor stream is never
+    held in memory
+
+    :param data: accepts multi-dimensional iterable data type, including generators
+    :return: returns a DICTIONARY of CATEGORY as STR: StreamingStats
+    """
+    statistics = {}
+    for entry in data:
+        figures = statistics.get(entry[1])
+        if figures is None:
+            figures = statistics[entry[1]] = StreamingStats()
+        figures.add(entry[0])
+    return statistics
+
+
+@profiled
+def compare_month_year_diff_averages(monthly, yearly):
+    """
+    Compares two sets of iterable data types which contain categories and category averages and determines which
+    is greater or if they are the same and outputs a new list with the difference between the two.
+
+    :param monthly: accepts multi-dimensional iterable data type
+    :param yearly: accepts multi-dimensional iterable data type
+    :return: returns a LIST containing LISTS containing 3 indexes which are category in STR format,
+            the difference between the monthly and yearly average in FLOAT,
+            and a STR which indicates if the monthly average is higher, lower or the same as the yearly average.
+    """
+    new_dat = []
+    counter = 0
+    for entry in monthly:
+        if entry[1] > yearly[counter][1]:
+            diff = round(entry[1] - yearly[counter][1], 2)
+            new_dat.append([entry[0], diff, "above"])
+        elif entry[1] < yearly[counter][1]:
+            diff = round(yearly[counter][1] - entry[1], 2)
+            new_dat.append([entry[0], diff, "below"])
+        elif entry[1] == yearly[counter][1]:
+            new_dat.append([entry[0], entry[1], "and it is the same as"])
+        counter += 1
+    return new_dat
+
+
+# per category figures of a monthly report
+CategoryFigures = namedtuple("CategoryFigures", ["count", "total", "percentage", "month_average", "year_average"])
+
+# every figure printed by User.monthly_report, categories is a DICTIONARY of CATEGORY as STR: CategoryFigures
+MonthlyReport = namedtuple("MonthlyReport", ["month", "year", "total", "count", "average",
+                                             "year_total", "year_count", "year_average", "categories"])
+
+
+@profiled
+def build_monthly_report(month, year, groups):
+    """
+    Computes every figure of a monthly report in a single pass over grouped totals for the year, instead of
+    rescanning the raw data once per figure and category.
+
+    :param month: accepts INT from 1-12
+    :param year: accepts INT from 0-9999
+    :param groups: accepts iterable of TUPLES (CATEGORY as STR, MONTH as INT, COUNT as INT, TOTAL as INT/FLOAT)
+            covering the year
+    :return: returns a MonthlyReport
+    """
+    month_figures = {}
+    year_figures = {}
+    for category, group_month, count, total in groups:
+        figures = year_figures.setdefault(category, [0, 0])
+        figures[0] += count
+        figures[1] += total
+        if group_month == month:
+            figures = month_figures.setdefault(category, [0, 0])
+            figures[0] += count
+            figures[1] += total
+
+    def average(total, count):
+        if count == 0:
+            return 0.0
+        return round(total / count, 2)
+
+    month_count = sum(figures[0] for figures in month_figures.values())
+    month_total = sum(figures[1] for figures in month_figures.values())
+    year_count = sum(figures[0] for figures in year_figures.values())
+    year_total = sum(figures[1] for figures in year_figures.values())
+
+    categories = {}
+    for category in sorted(month_figures):
+        count, total = month_figures[category]
+        categories[category] = CategoryFigures(count=count,
+                                               total=round(total, 2),
+                                               percentage=round((total / month_total) * 100, 2) if month_total else 0.0,
+                                               month_average=average(total, count),
+                                               year_average=average(year_figures[category][1],
+                                                                    year_figures[category][0]))
+    return MonthlyReport(month=month, year=year, total=round(month_total, 2), count=month_count,
+                         average=average(month_total, month_count), year_total=round(year_total, 2),
+                         year_count=year_count, year_average=average(year_total, year_count), categories=categories)
+
+
+# number of rows read from the database at a time by User.iter_data
+FETCH_SIZE = 1000
+
+# date formats accepted when importing expenses from a file, the first one is the format stored in the database
+IMPORT_DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y")
+
+# result of User.bulk_import
+ImportResult = namedtuple("ImportResult", ["imported", "rejected", "seconds", "rows_per_second", "duplicates"])
+
+# what a write does with an expense which repeats one already logged: "allow" saves it without looking, "flag" saves
+# it and reports it in User.duplicates and "reject" reports it without saving it
+DUPLICATE_POLICIES = ("allow", "flag", "reject")
+
+# an expense of a write found to repeat another, index is its position in the rows written. duplicate_of is the id of
+# the expense it repeats, or None when it repeats an earlier expense of the same write
+Duplicate = namedtuple("Duplicate", ["index", "amount", "category", "note", "date", "duplicate_of", "rejected"])
+
+# expenses with the same amount at most this many days apart are listed as near duplicates
+NEAR_DUPLICATE_DAYS = 3
+
+
+def normalize_expense(amount, category, note, date):
+    """
+    validates and normalizes a single expense the same way the menu does when it is typed in by hand
+
+    :param amount: accepts STR, INT or FLOAT
+    :param category: accepts STR
+    :param note: accepts STR, may be empty
+    :param date: accepts DATE object or STR in one of the IMPORT_DATE_FORMATS
+    :return: returns a TUPLE of (AMOUNT as FLOAT, CATEGORY as STR, NOTE as STR, DATE as STR in YYYY-MM-DD format),
+            raises ValueError with the reason if the expense is malformed
+    """
+    try:
+        amount = round(float(amount), 2)
+    except (TypeError, ValueError):
+        raise ValueError("amount {!r} is not a number".format(amount))
+    category = (category or "").strip()
+    if not category:
+        raise ValueError("category is empty")
+    if not isinstance(date, datetime.date):
+        text = (date or "").strip()
+        for date_format in IMPORT_DATE_FORMATS:
+            try:
+                date = datetime.datetime.strptime(text, date_format).date()
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError("date {!r} is not a valid date".format(text))
+    return amount, category.capitalize(), (note or "").strip(), str(date)
+
+
+def normalize_note(note):
+    """
+    :param note: accepts STR or None
+    :return: returns the note in STR as it is compared when looking for duplicates, without case, leading or
+            trailing spaces and with runs of whitespace made single spaces
+    """
+    return " ".join((note or "").split()).casefold()
+
+
+def near_duplicate_groups(rows, days=NEAR_DUPLICATE_DAYS):
+    """
+    Sort and sweep pass grouping expenses of the same amount whose dates are at most days apart, so every expense is
+    compared with its neighbours in (CENTS, DAY) order instead of with every other expense. An expense joins the
+    group of the one before it when the gap to it is small enough, so a group can span more than days in all.
+
+    :param rows: accepts iterable of TUPLES (CENTS as INT, DAY as INT, ...) sorted by CENTS and DAY
+    :param days: OPTIONAL largest gap in days between neighbours of a group in INT
+    :return: yields a LIST of the rows of every group of more than one expense
+    """
+    group = []
+    for entry in rows:
+        if group and (entry[0] != group[-1][0] or entry[1] - group[-1][1] > days):
+            if len(group) > 1:
+                yield group
+            group = []
+        group.append(entry)
+    if len(group) > 1:
+        yield group
+
+
+def read_expense_file(path, delimiter=None):
+    """
+    Generator which streams the rows of a CSV (or tab, semicolon or pipe separated) file one at a time.
+    Rows are expected as AMOUNT, CATEGORY, NOTE, DATE (or AMOUNT, CATEGORY, DATE without a note). A header row naming
+    those columns may be present, in which case the columns can be in any order.
+
+    :param path: accepts STR path to the file
+    :param delimiter: OPTIONAL accepts single character STR, guessed from the start of the file if not given
+    :return: yields TUPLES of (LINE NUMBER as INT, LIST of field STR, the fields in AMOUNT, CATEGORY, NOTE, DATE order
+            as a TUPLE or None if the row has the wrong number of fields)
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if delimiter is None:
+            sample = file.read(4096)
+            file.seek(0)
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+            except csv.Error:
+                delimiter = ","
+        reader = csv.reader(file, delimiter=delimiter)
+        first_row = True
+        columns = None
+        for fields in reader:
+            if not "".join(fields).strip():
+                continue
+            if first_row:
+                first_row = False
+                names = [field.strip().lower() for field in fields]
+                if "amount" in names and "category" in names and "date" in names:
+                    columns = [names.index("amount"), names.index("category"),
+                               names.index("note") if "note" in names else None, names.index("date")]
+                    continue
+            if columns:
+                if len(fields) < len(names):
+                    yield reader.line_num, fields, None
+                    continue
+                yield reader.line_num, fields, tuple("" if index is None else fields[index] for index in columns)
+            elif len(fields) == 4:
+                yield reader.line_num, fields, tuple(fields)
+            elif len(fields) == 3:
+                yield reader.line_num, fields, (fields[0], fields[1], "", fields[2])
+            else:
+                yield reader.line_num, fields, None
+
+
+class ExpenseStream:
+    """
+    Lazy pipeline over database content. Filters wrap the underlying iterable in another generator and aggregations
+    consume it in a single pass, so rows are read from the cursor as they are needed and never held in memory all at
+    once. A stream can only be consumed once, call list() to explicitly materialize it.
+
+    user.stream().year(2020).month(4).sum()
+    """
+
+    def __init__(self, data):
+        """
+        :param data: accepts iterable data type of database dumps, usually User.iter_data()
+        """
+        self.data = data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def category(self, category):
+        """
+        :param category: accepts STR
+        :return: returns a new ExpenseStream with only the rows of the category
+        """
+        return ExpenseStream(iter_by_category(category, self.data))
+
+    def year(self, year):
+        """
+        :param year: accepts INT from 0-9999
+        :return: returns a new ExpenseStream with only the rows of the year
+        """
+        return ExpenseStream(iter_by_year(year, self.data))
+
+    def month(self, month):
+        """
+        :param month: accepts INT from 1-12
+        :return: returns a new ExpenseStream with only the rows of the month
+        """
+        return ExpenseStream(iter_by_month(month, self.data))
+
+    def week_of_month(self, week):
+        """
+        :param week: accepts INT from 1-5
+        :return: returns a new ExpenseStream with only the rows of the week of the month
+        """
+        return ExpenseStream(iter_by_week_of_month(week, self.data))
+
+    def sum(self):
+        """
+        :return: returns total amount in a FLOAT
+        """
+        return summing_it(self.data)
+
+    def average(self):
+        """
+        :return: returns the average in a FLOAT
+        """
+        return find_average(self.data)
+
+    def breakdown(self):
+        """
+        :return: DICTIONARY of CATEGORY as STR: NUMBER OF INSTANCES in INT, see category_breakdown
+        """
+        return category_breakdown(self.data)
+
+    def totals(self):
+        """
+        :return: DICTIONARY of CATEGORY as STR: LIST of [COUNT as INT, TOTAL as FLOAT], see category_totals
+        """
+        return category_totals(self.data)
+
+    def list(self):
+        """
+        :return: returns multi-dimensional LIST containing TUPLES
+        """
+        return list(self.data)
+
+
+def final_data_display(data):
+    """
+    function for displaying formatted database information to the user.
+
+    :param data: accepts multi-dimensional iterable data type
+    :return: returns nothing, displays data via print
+    """
+    total = 0
+    for entry in data:
+        print("\n Amount: ${}\n Category: {}\n Note: {}\n Date: {}".format(entry[0], entry[1], entry[2], entry[3]))
+        total += entry[0]
+        pause(.5)
+    print()
+    print("Total amount spent: $" + str(round(total, 2)))
+    pause(.5)
+
+
+def category_display_and_choice():
+    """
+    function that displays a menu of the available categories to the user and forces them to choose one.
+
+    :return: returns the user's choice of category in STR format
+    """
+    categories = user.grab_categories()
+    print("Please choose a category by number. The Categories are: ")
+    counter = 1
+    for entry in categories:
+        print(str(counter) + ". " + entry)
+        counter += 1
+    while True:
+        try:
+            choice_category = int(input("Please choose a category by number [1, 2 etc]: "))
+            if choice_category in range(1, counter):
+                break
+            else:
+                print("Please select an appropriate value.")
+        except ValueError:
+            print("Please select an appropriate value.")
+    return categories[choice_category - 1]
+
+
+def user_input_year(minimum=0):
+    """
+    Function for coercing proper date value from the user
+
+    :param minimum: OPTIONAL smallest year accepted in INT, 1 where the year is made into a DATE object
+    :return: returns an INT between minimum and 9999
+    """
+    while True:
+        try:
+            year = int(input("Please choose a year [{}-9999]: ".format(minimum)))
+            if year in range(minimum, 10000):
+                break
+            else:
+                print("Please select an appropriate value.")
+        except ValueError:
+            print("Please select an appropriate value.")
+    return year
+
+
+def user_input_month():
+    """
+    Function for coercing proper date value from the user
+
+    :return: returns an INT between 1 and 12
+    """
+    while True:
+        try:
+            month = int(input("Please choose a month [1-12]: "))
+            if month in range(1, 13):
+                break
+            else:
+                print("Please select an appropriate value.")
+        except ValueError:
+            print("Please select an appropriate value.")
+    return month
+
+
+def user_input_day(month, year):
+    """
+        Function for coercing proper day, date value from the user
+
+    :param month: accepts an INT between 1 and 12
+    :param year: accepts an INT between 0 and 9999
+    :return: returns an INT between 1 and 31
+    """
+    is_leap_year = leap_year(year)
+    while True:
+        try:
+            day = int(input("Please choose a day [1-31]: "))
+            if day == 31 and (month == 4 or month == 6 or month == 9 or month == 11):
+                print("Wait a second...That month doesn't have a 31st day...Let's try again")
+                continue
+            elif month == 2 and day > 28:
                 if is_leap_year and day == 29:
                     break
                 else:
@@ -293,98 +1838,1224 @@ def user_input_day(month, year):
     return day
 
 
-def user_input_week():
-    """
-    Function for coercing proper date value from the user
+def user_input_week():
+    """
+    Function for coercing proper date value from the user
+
+    :return: returns an INT between 1-5
+    """
+    while True:
+        try:
+            week = int(input("Please choose a week [1-5]: "))
+            if week in range(1, 6):
+                break
+            else:
+                print("Please select an appropriate value.")
+        except ValueError:
+            print("Please select an appropriate value.")
+    return week
+
+
+def view_func(arg=""):
+    """
+    function mainly for displaying data to the end-user in the menu. The argument passed to the function determines
+    which variables the user is prompted for and conversely the granularity of the data sorted.
+
+    :param arg: week or month, hard-coded in the menu functions
+    :return: returns nothing data is displayed via print
+    """
+    year = user_input_year()
+    if arg == "month" or arg == "week":
+        month = user_input_month()
+        if arg == "week":
+            week = user_input_week()
+            raw_data = user.grab_week_of_month(week, month, year)
+        else:
+            raw_data = user.grab_month(month, year)
+    else:
+        raw_data = user.grab_year(year)
+    while True:
+        try:
+            choose_category = input("Would you like to see the expenses for a specific category? [y/n]: ")
+            if choose_category.lower() == "y" or choose_category.lower() == "n":
+                break
+            else:
+                print("Please select an appropriate value.")
+        except ValueError:
+            print("Please select an appropriate value.")
+
+    if choose_category.lower() == "y":
+        chosen_category = category_display_and_choice()
+        display_data = parse_by_category(chosen_category, raw_data)
+        if len(display_data) == 0:
+            print()
+            print("I'm sorry Dave, There doesn't appear to be any entries for the chosen category in the date range.")
+            pause(.5)
+        final_data_display(display_data)
+
+    elif choose_category.lower() == "n":
+        if len(raw_data) == 0:
+            print()
+            print("I'm sorry Dave, There doesn't appear to be any entries for the chosen date range.")
+            pause(.5)
+        final_data_display(raw_data)
+
+
+# version of the database layout stored in PRAGMA user_version. Database files from before the layout was versioned
+# report 0 and are treated as version 1, which stored AMOUNT in dollars and DATE as YYYY-MM-DD text. Version 2 stored
+# the category name in every expense, version 3 keeps the names in the CATEGORIES table, version 4 adds the full
+# text search index, version 5 the budgets, version 6 the write counter, version 7 the duplicate index and version 8
+# the anomaly state
+SCHEMA_VERSION = 8
+
+# rows copied per transaction when an existing database is migrated
+MIGRATION_BATCH_SIZE = 10000
+
+# columns selected from EXPENSE_ROWS to build the (AMOUNT, CATEGORY, NOTE, DATE) TUPLES returned by the User
+# methods, 1721424.5 is the julian day of day ordinal 0
+ROW_COLUMNS = """CENTS / 100.0, NAME, NOTE, date(DAY + 1721424.5)"""
+
+# expenses along with the name of their category
+EXPENSE_ROWS = """EXPENSES LEFT JOIN CATEGORIES ON CATEGORIES.ID = CATEGORY_ID"""
+
+# matches the expenses of the category named by the parameter, using EXPENSES_CATEGORY_IDX
+CATEGORY_CONDITION = """CATEGORY_ID = (SELECT ID FROM CATEGORIES WHERE NAME = ?)"""
+
+
+def _expenses_table(name, version=SCHEMA_VERSION):
+    """
+    builds the statement creating an expenses table. Amounts are stored in cents and dates as day ordinals, with the
+    year, month, day of the month and week of the month (numbered like week_of_month) generated from the ordinal.
+
+    :param name: name of the table in STR
+    :param version: OPTIONAL layout version in INT, before version 3 the category name is stored in the table
+    :return: returns the statement in STR
+    """
+    category = "CATEGORY text" if version < 3 else "CATEGORY_ID integer REFERENCES CATEGORIES (ID)"
+    return """CREATE TABLE {} (ID integer PRIMARY KEY, CENTS integer NOT NULL, {}, NOTE text,
+                  DAY integer NOT NULL,
+                  YEAR integer GENERATED ALWAYS AS (CAST(strftime('%Y', DAY + 1721424.5) AS INTEGER)) VIRTUAL,
+                  MONTH integer GENERATED ALWAYS AS (CAST(strftime('%m', DAY + 1721424.5) AS INTEGER)) VIRTUAL,
+                  MONTH_DAY integer GENERATED ALWAYS AS (CAST(strftime('%d', DAY + 1721424.5) AS INTEGER)) VIRTUAL,
+                  WEEK integer GENERATED ALWAYS AS ((MONTH_DAY + (DAY - MONTH_DAY) % 7 + 6) / 7) VIRTUAL)""" \
+        .format(name, category)
+
+
+def _rollup_change(row, sign):
+    """
+    builds the statements a rollup trigger runs to add (sign 1) or remove (sign -1) an expense row from the rollups
+
+    :param row: NEW or OLD in STR, the trigger row
+    :param sign: 1 or -1 in INT
+    :return: returns the statements in STR
+    """
+    values = dict(row=row, sign=sign)
+    return """
+        INSERT INTO ROLLUP_DAILY VALUES ({row}.YEAR, {row}.MONTH, {row}.MONTH_DAY, {row}.CATEGORY_ID, {sign},
+                                         {sign} * {row}.CENTS)
+            ON CONFLICT DO UPDATE SET COUNT = COUNT + {sign}, TOTAL = TOTAL + {sign} * {row}.CENTS;
+        INSERT INTO ROLLUP_MONTHLY VALUES ({row}.YEAR, {row}.MONTH, {row}.CATEGORY_ID, {sign}, {sign} * {row}.CENTS)
+            ON CONFLICT DO UPDATE SET COUNT = COUNT + {sign}, TOTAL = TOTAL + {sign} * {row}.CENTS;
+        DELETE FROM ROLLUP_DAILY WHERE COUNT = 0 AND YEAR = {row}.YEAR AND MONTH = {row}.MONTH AND DAY = {row}.MONTH_DAY
+            AND CATEGORY_ID = {row}.CATEGORY_ID;
+        DELETE FROM ROLLUP_MONTHLY WHERE COUNT = 0 AND YEAR = {row}.YEAR AND MONTH = {row}.MONTH
+            AND CATEGORY_ID = {row}.CATEGORY_ID;""".format(**values)
+
+
+# finds the expenses an expense could be a duplicate of with one lookup, only their notes are left to compare.
+# SQLite keeps it current on every write, renames and merges of categories included
+DUPLICATE_INDEX = """CREATE INDEX IF NOT EXISTS {}EXPENSES_DUPLICATE_IDX ON EXPENSES (DAY, CENTS, CATEGORY_ID)"""
+
+# category names are stored once in CATEGORIES, so renaming a category changes a single row. The expenses table is
+# followed by its indexes, EXPENSES_CATEGORY_IDX serves the per-category queries of a date range
+EXPENSES_SCHEMA = [
+    """CREATE TABLE CATEGORIES (ID integer PRIMARY KEY, NAME text NOT NULL UNIQUE)""",
+    _expenses_table("EXPENSES"),
+    """CREATE INDEX EXPENSES_DAY_IDX ON EXPENSES (DAY)""",
+    """CREATE INDEX EXPENSES_CATEGORY_IDX ON EXPENSES (CATEGORY_ID, DAY)""",
+    DUPLICATE_INDEX.format(""),
+]
+
+# rollup tables holding the count and sum in cents of the expenses of every (year, month, day, category) and
+# (year, month, category), kept current by triggers so every write path updates them in the same transaction
+ROLLUP_SCHEMA = [
+    """CREATE TABLE ROLLUP_DAILY (YEAR integer, MONTH integer, DAY integer, CATEGORY_ID integer, COUNT integer,
+                                  TOTAL integer, PRIMARY KEY (YEAR, MONTH, DAY, CATEGORY_ID))""",
+    """CREATE TABLE ROLLUP_MONTHLY (YEAR integer, MONTH integer, CATEGORY_ID integer, COUNT integer,
+                                    TOTAL integer, PRIMARY KEY (YEAR, MONTH, CATEGORY_ID))""",
+    """CREATE TRIGGER ROLLUP_INSERT AFTER INSERT ON EXPENSES BEGIN {} END""".format(_rollup_change("NEW", 1)),
+    """CREATE TRIGGER ROLLUP_DELETE AFTER DELETE ON EXPENSES BEGIN {} END""".format(_rollup_change("OLD", -1)),
+    """CREATE TRIGGER ROLLUP_UPDATE AFTER UPDATE OF CENTS, CATEGORY_ID, DAY ON EXPENSES BEGIN {} {} END"""
+    .format(_rollup_change("OLD", -1), _rollup_change("NEW", 1)),
+]
+
+
+def _search_sync(table, source, column):
+    """
+    builds the triggers keeping an external content FTS5 table in step with its source table
+
+    :param table: name of the FTS5 table in STR
+    :param source: name of the indexed table in STR
+    :param column: name of the indexed column in STR
+    :return: returns a LIST of statements in STR
+    """
+    values = dict(table=table, source=source, column=column)
+    insert = """INSERT INTO {table} (rowid, {column}) VALUES (NEW.ID, NEW.{column});""".format(**values)
+    delete = """INSERT INTO {table} ({table}, rowid, {column}) VALUES ('delete', OLD.ID, OLD.{column});""" \
+        .format(**values)
+    return [
+        """CREATE TRIGGER {table}_INSERT AFTER INSERT ON {source} BEGIN {insert} END"""
+        .format(insert=insert, **values),
+        """CREATE TRIGGER {table}_DELETE AFTER DELETE ON {source} BEGIN {delete} END"""
+        .format(delete=delete, **values),
+        """CREATE TRIGGER {table}_UPDATE AFTER UPDATE OF {column} ON {source} BEGIN {delete} {insert} END"""
+        .format(insert=insert, delete=delete, **values),
+    ]
+
+
+# full text indexes of the notes and the category names. They are external content tables, so the text is only
+# stored in EXPENSES and CATEGORIES, and triggers keep them in sync. Only created when SQLite has FTS5, otherwise
+# User.search falls back to LIKE
+SEARCH_SCHEMA = [
+    """CREATE VIRTUAL TABLE EXPENSES_FTS USING fts5 (NOTE, content = 'EXPENSES', content_rowid = 'ID',
+                                                     prefix = '2 3')""",
+    """CREATE VIRTUAL TABLE CATEGORIES_FTS USING fts5 (NAME, content = 'CATEGORIES', content_rowid = 'ID')""",
+] + _search_sync("EXPENSES_FTS", "EXPENSES", "NOTE") + _search_sync("CATEGORIES_FTS", "CATEGORIES", "NAME")
+
+
+# monthly and yearly spending limits of the categories in cents. The spending they are checked against is read from
+# ROLLUP_MONTHLY, whose triggers already count every insert, backdated insert, delete and recategorization in the
+# same transaction, so no other counter is kept
+BUDGET_SCHEMA = [
+    """CREATE TABLE BUDGETS (CATEGORY_ID integer NOT NULL REFERENCES CATEGORIES (ID),
+                             PERIOD text NOT NULL CHECK (PERIOD IN ('month', 'year')), CENTS integer NOT NULL,
+                             PRIMARY KEY (CATEGORY_ID, PERIOD))""",
+]
+
+
+# the SpendingNorm of every category, updated by every write of User in the same transaction. It is derived from the
+# expenses like the rollups, but can't be kept by triggers, and backfill_anomalies rebuilds it from them. Writes to it
+# aren't counted in DATA_VERSION, no cached result depends on it
+ANOMALY_SCHEMA = [
+    """CREATE TABLE ANOMALY_STATE (CATEGORY_ID integer PRIMARY KEY REFERENCES CATEGORIES (ID),
+                                   COUNT integer NOT NULL, MEAN real NOT NULL, M2 real NOT NULL, WEEK integer,
+                                   WEEK_CENTS integer NOT NULL, WEEKS integer NOT NULL, WEEK_AVERAGE real NOT NULL)""",
+]
+
+
+def _version_bump(table):
+    """
+    builds the triggers counting the writes to a table in DATA_VERSION
+
+    :param table: name of the table in STR
+    :return: returns a LIST of statements in STR
+    """
+    return ["""CREATE TRIGGER {table}_VERSION_{event} AFTER {event} ON {table} BEGIN
+                   UPDATE DATA_VERSION SET VERSION = VERSION + 1; END""".format(table=table, event=event)
+            for event in ("INSERT", "UPDATE", "DELETE")]
+
+
+# one row counting the writes to the database, which tells a ResultCache whether its results are still current. The
+# triggers count the writes of every connection, other programs included. Writes to the partitions of the partitioned
+# layout can't fire triggers in the main database, they are counted by User. The counter starts at a random number so
+# the cache left behind by a deleted database file never matches a new database of the same name
+VERSION_SCHEMA = [
+    """CREATE TABLE DATA_VERSION (ID integer PRIMARY KEY CHECK (ID = 1), VERSION integer NOT NULL)""",
+    """INSERT INTO DATA_VERSION VALUES (1, abs(random() >> 16))""",
+] + _version_bump("EXPENSES") + _version_bump("CATEGORIES") + _version_bump("BUDGETS")
+
+
+def fts5_available(conn):
+    """
+    :param conn: accepts sqlite3 connection
+    :return: returns True if the SQLite library was built with FTS5
+    """
+    return bool(conn.execute("""SELECT sqlite_compileoption_used('ENABLE_FTS5')""").fetchone()[0])
+
+
+def search_terms(text):
+    """
+    splits a search into its terms. Words match whole words, words ending in * match every word starting with them
+    and text between double quotes is matched as a phrase.
+
+    :param text: accepts STR, e.g. 'dent* "root canal"'
+    :return: returns a LIST of TUPLES (TERM as STR, PREFIX as BOOLEAN)
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        term = phrase if phrase else word
+        prefix = not phrase and term.endswith("*")
+        term = " ".join(re.findall(r"\w+", term))
+        if term:
+            terms.append((term, prefix))
+    return terms
+
+
+def database_path(username):
+    """
+    :param username: accepts STR, either a user name or the path of a .db file
+    :return: returns the file name of the user's database in STR
+    """
+    if username.endswith(".db") or os.path.dirname(username):
+        return username
+    return username.capitalize() + ".db"
+
+
+def schema_version(conn):
+    """
+    :param conn: accepts sqlite3 connection
+    :return: returns the layout version of the database in INT, 0 for an empty database
+    """
+    version = conn.execute("""PRAGMA user_version""").fetchone()[0]
+    if version == 0 and conn.execute("""SELECT 1 FROM sqlite_master WHERE name = 'EXPENSES'""").fetchone():
+        return 1
+    return version
+
+
+def begin_write(conn):
+    """
+    opens a write transaction. BEGIN IMMEDIATE takes the write lock up front and waits out the busy_timeout of the
+    connection while another one is writing, where a deferred BEGIN fails with "database is locked" as soon as its
+    snapshot is older than the other connection's commit. The schema is then read inside the transaction, where no
+    other connection can change it anymore, because SQLite fails the first write through the FTS5 triggers after
+    another connection changed the schema (a vacuum, a migration or a new index) with "no such table".
+
+    :param conn: accepts sqlite3 connection or cursor
+    :return: returns nothing
+    """
+    conn.execute("""BEGIN IMMEDIATE""")
+    conn.execute("""SELECT COUNT(*) FROM main.sqlite_master""").fetchone()
+
+
+def rebuild_rollups(conn, schema="main"):
+    """
+    recomputes the rollup tables from the raw expenses
+
+    :param conn: accepts sqlite3 connection
+    :param schema: OPTIONAL name of the attached database in STR, for the year partitions
+    :return: returns nothing, commits to database
+    """
+    conn.execute("""DELETE FROM {}.ROLLUP_DAILY""".format(schema))
+    conn.execute("""DELETE FROM {}.ROLLUP_MONTHLY""".format(schema))
+    conn.execute("""INSERT INTO {0}.ROLLUP_DAILY
+                    SELECT YEAR, MONTH, MONTH_DAY, CATEGORY_ID, COUNT(*), SUM(CENTS) FROM {0}.EXPENSES
+                    GROUP BY 1, 2, 3, 4""".format(schema))
+    conn.execute("""INSERT INTO {0}.ROLLUP_MONTHLY
+                    SELECT YEAR, MONTH, CATEGORY_ID, SUM(COUNT), SUM(TOTAL) FROM {0}.ROLLUP_DAILY GROUP BY 1, 2, 3"""
+                 .format(schema))
+    conn.commit()
+
+
+def _migrate_v1_to_v2(conn, batch_size):
+    """
+    moves the original layout (AMOUNT in dollars, DATE as text) to amounts in cents and day ordinals. Rows are copied
+    into a new table batch_size at a time with one transaction per batch, and the copy picks up where it stopped if
+    the migration was interrupted. The old table is only replaced once every row has been copied.
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: number of rows per transaction in INT
+    :return: returns nothing, commits to database
+    """
+    conn.execute(_expenses_table("EXPENSES_V2", 2).replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+    conn.commit()
+    last = conn.execute("""SELECT COALESCE(MAX(ID), 0) FROM EXPENSES_V2""").fetchone()[0]
+    while True:
+        rows = conn.execute("""SELECT rowid, AMOUNT, CATEGORY, NOTE, DATE FROM EXPENSES WHERE rowid > ?
+                               ORDER BY rowid LIMIT ?""", (last, batch_size)).fetchall()
+        if not rows:
+            break
+        converted = []
+        for rowid, amount, category, note, date in rows:
+            try:
+                converted.append((rowid, to_cents(amount), category, note, day_ordinal(date)))
+            except (TypeError, ValueError):
+                raise ValueError("expense {} has an unreadable amount {!r} or date {!r}".format(rowid, amount, date))
+        conn.executemany("""INSERT INTO EXPENSES_V2 (ID, CENTS, CATEGORY, NOTE, DAY) VALUES (?, ?, ?, ?, ?)""",
+                         converted)
+        conn.commit()
+        last = rows[-1][0]
+
+    begin_write(conn)
+    # dropping the old table also drops its index and the rollup triggers. The rollups are rebuilt by the migration
+    # to version 3, which keys them by category id
+    conn.execute("""DROP TABLE EXPENSES""")
+    conn.execute("""ALTER TABLE EXPENSES_V2 RENAME TO EXPENSES""")
+    conn.execute("""CREATE INDEX EXPENSES_DAY_IDX ON EXPENSES (DAY)""")
+    conn.execute("""DROP TABLE IF EXISTS ROLLUP_DAILY""")
+    conn.execute("""DROP TABLE IF EXISTS ROLLUP_MONTHLY""")
+
+
+def _migrate_v2_to_v3(conn, batch_size):
+    """
+    moves the category names out of the expenses into the CATEGORIES table, the expenses referencing them by id. Rows
+    are copied into a new table batch_size at a time like _migrate_v1_to_v2, then the old table is replaced and the
+    rollups are rebuilt by category id.
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: number of rows per transaction in INT
+    :return: returns nothing, commits to database
+    """
+    conn.execute(EXPENSES_SCHEMA[0].replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+    # categories get their ids in the order they were first used
+    conn.execute("""INSERT OR IGNORE INTO CATEGORIES (NAME)
+                    SELECT CATEGORY FROM EXPENSES WHERE CATEGORY IS NOT NULL GROUP BY CATEGORY ORDER BY MIN(ID)""")
+    conn.execute(_expenses_table("EXPENSES_V3").replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+    conn.commit()
+    last = conn.execute("""SELECT COALESCE(MAX(ID), 0) FROM EXPENSES_V3""").fetchone()[0]
+    while True:
+        conn.execute("""INSERT INTO EXPENSES_V3 (ID, CENTS, CATEGORY_ID, NOTE, DAY)
+                        SELECT EXPENSES.ID, CENTS, CATEGORIES.ID, NOTE, DAY
+                        FROM EXPENSES LEFT JOIN CATEGORIES ON NAME = CATEGORY
+                        WHERE EXPENSES.ID > ? ORDER BY EXPENSES.ID LIMIT ?""", (last, batch_size))
+        conn.commit()
+        copied = conn.execute("""SELECT COALESCE(MAX(ID), 0) FROM EXPENSES_V3""").fetchone()[0]
+        if copied == last:
+            break
+        last = copied
+
+    begin_write(conn)
+    conn.execute("""DROP TABLE EXPENSES""")
+    conn.execute("""ALTER TABLE EXPENSES_V3 RENAME TO EXPENSES""")
+    for sql in EXPENSES_SCHEMA[2:]:
+        conn.execute(sql)
+    conn.execute("""DROP TABLE IF EXISTS ROLLUP_DAILY""")
+    conn.execute("""DROP TABLE IF EXISTS ROLLUP_MONTHLY""")
+    for sql in ROLLUP_SCHEMA:
+        conn.execute(sql)
+    rebuild_rollups(conn)
+
+
+def _migrate_v3_to_v4(conn, batch_size):
+    """
+    creates the full text search index of the notes and category names and fills it in one transaction. Nothing is
+    created when SQLite has no FTS5.
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: not used, the index is built in one statement
+    :return: returns nothing, commits to database
+    """
+    if not fts5_available(conn):
+        return
+    begin_write(conn)
+    for sql in SEARCH_SCHEMA:
+        conn.execute(sql)
+    conn.execute("""INSERT INTO EXPENSES_FTS (EXPENSES_FTS) VALUES ('rebuild')""")
+    conn.execute("""INSERT INTO CATEGORIES_FTS (CATEGORIES_FTS) VALUES ('rebuild')""")
+    conn.commit()
+
+
+def _migrate_v4_to_v5(conn, batch_size):
+    """
+    creates the budget table
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: not used, no rows are copied
+    :return: returns nothing, commits to database
+    """
+    begin_write(conn)
+    for sql in BUDGET_SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+
+
+def _migrate_v5_to_v6(conn, batch_size):
+    """
+    creates the write counter
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: not used, no rows are copied
+    :return: returns nothing, commits to database
+    """
+    begin_write(conn)
+    for sql in VERSION_SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+
+
+def _migrate_v6_to_v7(conn, batch_size):
+    """
+    creates the duplicate index, the partitions get theirs when they are next attached for writing
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: not used, no rows are copied
+    :return: returns nothing, commits to database
+    """
+    begin_write(conn)
+    conn.execute(DUPLICATE_INDEX.format(""))
+    conn.commit()
+
+
+def _migrate_v7_to_v8(conn, batch_size):
+    """
+    creates the anomaly state, empty until User.backfill_anomalies replays the expenses already logged
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: not used, no rows are copied
+    :return: returns nothing, commits to database
+    """
+    begin_write(conn)
+    for sql in ANOMALY_SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+
+
+# MIGRATIONS[version] upgrades a database from version to version + 1
+MIGRATIONS = {
+    1: _migrate_v1_to_v2,
+    2: _migrate_v2_to_v3,
+    3: _migrate_v3_to_v4,
+    4: _migrate_v4_to_v5,
+    5: _migrate_v5_to_v6,
+    6: _migrate_v6_to_v7,
+    7: _migrate_v7_to_v8,
+}
+
+
+def upgrade_database(conn, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    creates the tables of a new database, or migrates an existing database in place to SCHEMA_VERSION
+
+    :param conn: accepts sqlite3 connection
+    :param batch_size: OPTIONAL number of rows per transaction when copying rows in INT
+    :return: returns the version the database was at before in INT, 0 for a new database
+    """
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise sqlite3.OperationalError("database layout {} is newer than this program".format(version))
+    if version == 0:
+        begin_write(conn)
+        for sql in EXPENSES_SCHEMA + ROLLUP_SCHEMA + BUDGET_SCHEMA + VERSION_SCHEMA + ANOMALY_SCHEMA + \
+                (SEARCH_SCHEMA if fts5_available(conn) else []):
+            conn.execute(sql)
+        conn.execute("""PRAGMA user_version = {}""".format(SCHEMA_VERSION))
+        conn.commit()
+        return 0
+    previous = version
+    while version < SCHEMA_VERSION:
+        MIGRATIONS[version](conn, batch_size)
+        version += 1
+        conn.execute("""PRAGMA user_version = {}""".format(version))
+        conn.commit()
+    return previous
+
+
+# files of a snapshot with the struct format of their values, in the order of ExpenseColumns. Category codes are the
+# ids of the CATEGORIES table, 0 for an expense without a category
+SNAPSHOT_COLUMNS = [("cents", "q"), ("days", "i"), ("years", "H"), ("months", "B"), ("month_days", "B"),
+                    ("codes", "i")]
+
+# layout of the snapshot files, a snapshot of another layout is rebuilt
+SNAPSHOT_VERSION = 1
+
+
+class NoteHeap:
+    """
+    read-only sequence of the notes of a snapshot, decoded from the UTF-8 heap when they are read
+    """
+
+    def __init__(self, offsets, heap):
+        """
+        :param offsets: accepts memoryview of INT, note i is heap[offsets[i]:offsets[i + 1]]
+        :param heap: accepts memoryview of bytes
+        """
+        self.offsets = offsets
+        self.heap = heap
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return str(self.heap[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class MappedColumns(ExpenseColumns):
+    """
+    ExpenseColumns backed by the memory mapped files of a snapshot written by refresh_snapshot. The columns are
+    read-only memoryviews of the files, so loading costs nothing per row and the pages are shared with every other
+    process reading the same snapshot. Filters return ordinary in-memory ExpenseColumns.
+    """
+
+    def __init__(self, directory, categories):
+        """
+        :param directory: snapshot directory in STR
+        :param categories: accepts DICTIONARY of category id as INT: NAME as STR
+        """
+        super().__init__()
+        with open(os.path.join(directory, "meta.json")) as file:
+            meta = json.load(file)
+        rows = meta["rows"]
+        self._maps = []
+        for name, code in SNAPSHOT_COLUMNS:
+            setattr(self, name, self._map(directory, name, rows * array(code).itemsize).cast(code))
+        offsets = self._map(directory, "note_offsets", (rows + 1) * 8).cast("q")
+        self.notes = NoteHeap(offsets, self._map(directory, "notes", offsets[-1]))
+        self.high_water = meta["high_water"]
+        self.categories = [None] * (max(categories, default=0) + 1)
+        for code, category in categories.items():
+            self.categories[code] = category
+            self.category_codes[category] = code
+
+    def _map(self, directory, name, size):
+        """
+        :return: returns a read-only memoryview of the first size bytes of a snapshot file
+        """
+        if size == 0:
+            return memoryview(b"")
+        with open(os.path.join(directory, name + ".bin"), "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)[:size]
+
+    def append(self, rows):
+        if rows:
+            raise TypeError("a mapped snapshot is read-only, refresh it with refresh_snapshot instead")
+
+
+def snapshot_path(path):
+    """
+    :param path: path of a user database in STR
+    :return: returns the path of the snapshot directory of the database in STR
+    """
+    return os.path.splitext(path)[0] + ".snapshot"
+
+
+def invalidate_snapshot(directory):
+    """
+    makes the next refresh_snapshot rewrite the snapshot from scratch, needed when existing rows change
+
+    :param directory: snapshot directory in STR
+    :return: returns nothing
+    """
+    try:
+        os.remove(os.path.join(directory, "meta.json"))
+    except FileNotFoundError:
+        pass
+
+
+def refresh_snapshot(conn, directory, chunk_size=100000):
+    """
+    Writes a columnar snapshot of the expenses to a directory of fixed-width binary files, one per column plus the
+    notes as a UTF-8 heap with an offset file. A snapshot remembers the highest expense id it holds, later refreshes
+    append only the rows added since. It is rewritten from scratch when expenses below that mark were deleted or
+    after invalidate_snapshot; updates made to existing rows outside of User.fix_wrong_category aren't detected.
+
+    :param conn: accepts sqlite3 connection
+    :param directory: snapshot directory in STR, created if missing
+    :param chunk_size: OPTIONAL number of rows read at a time in INT
+    :return: returns the number of rows added to the snapshot in INT
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, "meta.json")
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+    except (FileNotFoundError, ValueError):
+        meta = None
+    if meta is not None and (meta.get("version") != SNAPSHOT_VERSION or meta.get("byteorder") != sys.byteorder
+                             or conn.execute("""SELECT COUNT(*) FROM EXPENSES WHERE ID <= ?""",
+                                             (meta["high_water"],)).fetchone()[0] != meta["rows"]):
+        meta = None
+    if meta is None:
+        # a new snapshot is written next to the old files and moved over them, so mappings of the old one stay valid
+        meta = dict(version=SNAPSHOT_VERSION, byteorder=sys.byteorder, rows=0, high_water=0)
+        for name in [name for name, code in SNAPSHOT_COLUMNS] + ["note_offsets", "notes"]:
+            with open(os.path.join(directory, name + ".bin.new"), "wb") as file:
+                if name == "note_offsets":
+                    file.write(array("q", [0]).tobytes())
+            os.replace(os.path.join(directory, name + ".bin.new"), os.path.join(directory, name + ".bin"))
+
+    files = {}
+    try:
+        # cuts off whatever an interrupted refresh wrote after the rows recorded in meta.json
+        for name, code in SNAPSHOT_COLUMNS + [("note_offsets", "q")]:
+            files[name] = open(os.path.join(directory, name + ".bin"), "r+b")
+            files[name].truncate((meta["rows"] + (name == "note_offsets")) * array(code).itemsize)
+        files["note_offsets"].seek(-8, os.SEEK_END)
+        heap_size = array("q", files["note_offsets"].read(8))[0]
+        files["notes"] = open(os.path.join(directory, "notes.bin"), "r+b")
+        files["notes"].truncate(heap_size)
+        for file in files.values():
+            file.seek(0, os.SEEK_END)
+
+        added = 0
+        cursor = conn.execute("""SELECT ID, CENTS, DAY, YEAR, MONTH, MONTH_DAY, COALESCE(CATEGORY_ID, 0), NOTE
+                                 FROM EXPENSES WHERE ID > ? ORDER BY ID""", (meta["high_water"],))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            for (name, code), values in zip(SNAPSHOT_COLUMNS, columns[1:7]):
+                files[name].write(array(code, values).tobytes())
+            notes = [(note or "").encode("utf-8") for note in columns[7]]
+            offsets = array("q", accumulate(map(len, notes), initial=heap_size))
+            heap_size = offsets[-1]
+            files["note_offsets"].write(offsets[1:].tobytes())
+            files["notes"].write(b"".join(notes))
+            added += len(rows)
+            meta["high_water"] = rows[-1][0]
+    finally:
+        for file in files.values():
+            file.close()
+
+    meta["rows"] += added
+    with open(meta_path + ".new", "w") as file:
+        json.dump(meta, file)
+    os.replace(meta_path + ".new", meta_path)
+    return added
+
+
+def load_snapshot(conn, directory):
+    """
+    brings the snapshot of a database up to date and maps it
+
+    :param conn: accepts sqlite3 connection
+    :param directory: snapshot directory in STR
+    :return: returns a MappedColumns
+    """
+    refresh_snapshot(conn, directory)
+    return MappedColumns(directory, dict(conn.execute("""SELECT ID, NAME FROM CATEGORIES""").fetchall()))
+
+
+# tables which in the partitioned layout are split into one attached file per year, the categories and search
+# indexes stay in the main database
+PARTITIONED_TABLES = ["EXPENSES", "ROLLUP_DAILY", "ROLLUP_MONTHLY"]
+
+# file name of a year partition
+PARTITION_FILE = re.compile(r"^(\d{4})\.db$")
+
+
+def partition_directory(path):
+    """
+    :param path: path of a user database in STR
+    :return: returns the path of the directory holding the year partitions of the database in STR
+    """
+    return os.path.splitext(path)[0] + "_partitions"
+
+
+def partition_path(path, year):
+    """
+    :param path: path of a user database in STR
+    :param year: accepts INT from 1-9999
+    :return: returns the path of the partition file of the year in STR
+    """
+    return os.path.join(partition_directory(path), "{:04d}.db".format(year))
+
+
+def database_uri(path):
+    """
+    :param path: path of a database file in STR
+    :return: returns the URI file name of the database in STR, query parameters can be appended to it
+    """
+    return "file:" + pathname2url(os.path.abspath(path))
+
+
+def vacuum_database(path):
+    """
+    compacts a database file over a connection of its own, which needs no free ATTACH slot and doesn't see the TEMP
+    views of User
+
+    :param path: path of the database file in STR
+    :return: returns nothing
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("""VACUUM""")
+    finally:
+        conn.close()
+
+
+def ordinal_year(day):
+    """
+    :param day: accepts day ordinal in INT, see day_ordinal
+    :return: returns the year of the day in INT, day 0 counts as year 1
+    """
+    return datetime.date.fromordinal(max(1, day)).year
+
+
+def create_partition(path):
+    """
+    creates the file of a year partition with the expenses table, its indexes and the rollups. The file is built
+    under another name and linked into place, so a connection never attaches a partition without its tables and two
+    connections creating the same partition don't clash.
+
+    :param path: path of the partition file in STR
+    :return: returns nothing
+    """
+    temporary = "{}.{}-{}.new".format(path, os.getpid(), threading.get_ident())
+    conn = sqlite3.connect(temporary)
+    try:
+        begin_write(conn)
+        for sql in EXPENSES_SCHEMA[1:] + ROLLUP_SCHEMA:
+            conn.execute(sql)
+        conn.execute("""PRAGMA user_version = {}""".format(SCHEMA_VERSION))
+        conn.commit()
+    finally:
+        conn.close()
+    try:
+        os.link(temporary, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temporary)
+
+
+# results kept by the ResultCache of a User unless told otherwise
+CACHE_SIZE = 256
+
+
+def cache_path(path):
+    """
+    :param path: path of a user database in STR
+    :return: returns the path of the file the results cache of the database is saved to in STR
+    """
+    return os.path.splitext(path)[0] + ".cache"
+
+
+def _cache_encode(value):
+    """
+    :param value: accepts a cached result or key
+    :return: returns the value as plain JSON, every DICTIONARY in it standing for one of the tagged values
+            _cache_decode rebuilds, raises TypeError for a value which can't be saved
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, list):
+        return [_cache_encode(entry) for entry in value]
+    if isinstance(value, tuple):
+        if globals().get(type(value).__name__) is type(value) and hasattr(value, "_fields"):
+            return {"namedtuple": [type(value).__name__, [_cache_encode(entry) for entry in value]]}
+        return {"tuple": [_cache_encode(entry) for entry in value]}
+    if isinstance(value, dict):
+        # as pairs, so keys which aren't STR come back as they were
+        return {"dict": [[_cache_encode(key), _cache_encode(entry)] for key, entry in value.items()]}
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return {"date": value.isoformat()}
+    if isinstance(value, StreamingStats):
+        return {"StreamingStats": value.as_dict()}
+    raise TypeError("{} results aren't saved".format(type(value).__name__))
+
+
+def _cache_decode(value):
+    """
+    :param value: accepts plain JSON from _cache_encode
+    :return: returns the value rebuilt, namedtuples are looked up by name among the namedtuples of this module.
+            Raises KeyError or ValueError for a value _cache_encode doesn't write
+    """
+    if isinstance(value, list):
+        return [_cache_decode(entry) for entry in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) != 1:
+        raise ValueError("expected one tag but got {}".format(", ".join(value)))
+    tag, content = next(iter(value.items()))
+    if tag == "tuple":
+        return tuple(_cache_decode(entry) for entry in content)
+    if tag == "namedtuple":
+        name, fields = content
+        kind = globals()[name]
+        if not (isinstance(kind, type) and issubclass(kind, tuple) and hasattr(kind, "_fields")):
+            raise KeyError(name)
+        return kind(*(_cache_decode(entry) for entry in fields))
+    if tag == "dict":
+        return {_cache_decode(key): _cache_decode(entry) for key, entry in content}
+    if tag == "date":
+        return datetime.date.fromisoformat(content)
+    if tag == "StreamingStats":
+        return StreamingStats.from_dict(content)
+    raise KeyError(tag)
+
+
+class ResultCache:
+    """
+    Least recently used cache of analytics results keyed on the method and its arguments. Every result belongs to the
+    data version it was computed at, see User.data_version, and the whole cache is emptied when the version moves on,
+    so a result is never served after the data it was computed from changed. It can be saved to a JSON file and
+    loaded again, so the next run of a command or batch job starts with the results of the last one.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        """
+        :param size: OPTIONAL largest number of results kept in INT
+        """
+        self.size = size
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._changed = False
+        # the threads of a User opened with concurrent share its cache
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key, version):
+        """
+        :param key: accepts a hashable key
+        :param version: the current data version in INT
+        :return: returns a TUPLE of (True, result) when the key was cached at this version, (False, None) otherwise
+        """
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+            if key not in self._results:
+                self.misses += 1
+                return False, None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return True, self._results[key]
+
+    def put(self, key, version, result):
+        """
+        :param key: accepts a hashable key
+        :param version: the data version the result was computed at in INT
+        :param result: accepts any result, those _cache_encode can't write are left out by save
+        :return: returns nothing, evicts the least recently used result when full
+        """
+        with self._lock:
+            if version != self.version or self.size < 1:
+                return
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+            self._changed = True
+
+    def clear(self):
+        """
+        :return: returns nothing
+        """
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        if self._results:
+            self._changed = True
+        self._results.clear()
+
+    def save(self, path):
+        """
+        writes the cache to a file as JSON if it changed since it was loaded or last saved
 
-    :return: returns an INT between 1-5
-    """
-    while True:
+        :param path: path of the file in STR
+        :return: returns nothing
+        """
+        if not self._changed:
+            return
+        with self._lock:
+            items = list(self._results.items())
+            version = self.version
+        results = []
+        for key, result in items:
+            try:
+                results.append([_cache_encode(key), _cache_encode(result)])
+            except TypeError:
+                continue
+        with open(path + ".new", "w", encoding="utf-8") as file:
+            json.dump(dict(version=version, results=results), file)
+        os.replace(path + ".new", path)
+        self._changed = False
+
+    @classmethod
+    def load(cls, path, size=CACHE_SIZE):
+        """
+        :param path: path of a file written by save in STR
+        :param size: OPTIONAL largest number of results kept in INT
+        :return: returns the saved ResultCache, or an empty one when the file is missing or unreadable
+        """
+        cache = cls(size)
         try:
-            week = int(input("Please choose a week [1-5]: "))
-            if week in range(1, 6):
-                break
-            else:
-                print("Please select an appropriate value.")
-        except ValueError:
-            print("Please select an appropriate value.")
-    return week
+            with open(path, encoding="utf-8") as file:
+                saved = json.load(file)
+            if not isinstance(saved, dict) or not isinstance(saved["results"], list):
+                raise ValueError("not a saved cache")
+            for key, result in saved["results"][-size:] if size > 0 else []:
+                key = _cache_decode(key)
+                if not isinstance(key, tuple):
+                    raise ValueError("cache keys are TUPLES")
+                cache._results[key] = _cache_decode(result)
+            cache.version = saved["version"]
+        except (OSError, ValueError, KeyError):
+            # missing, truncated or written by another version of the program
+            cache = cls(size)
+        return cache
+
+
+def _cache_key(arguments):
+    """
+    :param arguments: accepts the TUPLE of arguments of a cached method
+    :return: returns the arguments as a TUPLE, raises TypeError when one isn't a plain STR, INT, FLOAT, DATE or None.
+            Data handed in to a method is never cached, its key would cost as much as the data and keep it alive
+    """
+    for value in arguments:
+        if not (value is None or isinstance(value, (str, int, float, datetime.date))):
+            raise TypeError("{} arguments aren't cached".format(type(value).__name__))
+    return tuple(arguments)
 
 
-def view_func(arg=""):
+def cached(method):
     """
-    function mainly for displaying data to the end-user in the menu. The argument passed to the function determines
-    which variables the user is prompted for and conversely the granularity of the data sorted.
+    decorator keeping the results of a User analytics method in the user's ResultCache. The key is built from the
+    arguments with the defaults filled in, so a default like the current month is part of the key, and the results
+    are copied in and out so a caller changing a result doesn't change the cached one. A call with anything but plain
+    values for arguments, see _cache_key, runs the method without the cache.
 
-    :param arg: week or month, hard-coded in the menu functions
-    :return: returns nothing data is displayed via print
+    :param method: accepts a method of User
+    :return: returns the wrapped method
     """
-    year = user_input_year()
-    raw_data = parse_by_year(year, user.grab_data())
-    if arg == "month" or arg == "week":
-        month = user_input_month()
-        raw_data = parse_by_month(month, raw_data)
-        if arg == "week":
-            week = user_input_week()
-            raw_data = parse_by_week_of_month(week, raw_data)
-    while True:
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
         try:
-            choose_category = input("Would you like to see the expenses for a specific category? [y/n]: ")
-            if choose_category.lower() == "y" or choose_category.lower() == "n":
-                break
-            else:
-                print("Please select an appropriate value.")
-        except ValueError:
-            print("Please select an appropriate value.")
+            key = (method.__name__,) + _cache_key(arguments.args[1:] + tuple(arguments.kwargs.values()))
+        except TypeError:
+            return method(self, *args, **kwargs)
+        version = self.data_version()
+        found, result = self.cache.get(key, version)
+        if found:
+            return copy.deepcopy(result)
+        result = method(self, *args, **kwargs)
+        self.cache.put(key, version, copy.deepcopy(result))
+        return result
+    return wrapper
 
-    if choose_category.lower() == "y":
-        chosen_category = category_display_and_choice()
-        display_data = parse_by_category(chosen_category, raw_data)
-        if len(display_data) == 0:
-            print()
-            print("I'm sorry Dave, There doesn't appear to be any entries for the chosen category in the date range.")
-            time.sleep(.5)
-        final_data_display(display_data)
 
-    elif choose_category.lower() == "n":
-        if len(raw_data) == 0:
-            print()
-            print("I'm sorry Dave, There doesn't appear to be any entries for the chosen date range.")
-            time.sleep(.5)
-        final_data_display(raw_data)
+class ConnectionManager:
+    """
+    The connections of a User shared between threads. The database is switched to WAL, so reading never waits for a
+    write and a write never waits for the readers. Every thread reads over a read-only connection of its own, opened
+    on first use, while the writes of every thread take turns on the one writer connection. A thread holding the
+    write lock reads over the writer, so it sees what it wrote before committing.
+    """
+
+    def __init__(self, path, writer, prepare=None, workers=None):
+        """
+        :param path: path of the database file in STR
+        :param writer: accepts the sqlite3 connection every write goes through, opened with check_same_thread False
+        :param prepare: OPTIONAL function called with a reader connection and the SET of its attached schemas before
+                it is handed out, used to attach the year partitions
+        :param workers: OPTIONAL number of threads of map in INT, defaults to the number of cores
+        """
+        self.path = path
+        self.writer = writer
+        self.prepare = prepare
+        self.workers = workers or os.cpu_count()
+        self.lock = threading.RLock()
+        self.writer.execute("""PRAGMA journal_mode = WAL""")
+        # waits for the write lock instead of failing right away when another program is writing
+        self.writer.execute("""PRAGMA busy_timeout = 5000""")
+        self._writer_cursor = writer.cursor()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._executor = None
+
+    def reader(self):
+        """
+        :return: returns the read-only connection of the calling thread, opening it on first use
+        """
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            # autocommit, so a reader never holds on to an old snapshot of the database in an open transaction
+            conn = sqlite3.connect(database_uri(self.path) + "?mode=ro", uri=True, check_same_thread=False,
+                                   isolation_level=None,
+                                   factory=ProfiledConnection if PROFILER.enabled else sqlite3.Connection)
+            conn.execute("""PRAGMA busy_timeout = 5000""")
+            local.conn = conn
+            local.cursor = conn.cursor()
+            local.attached = set()
+            with self._readers_lock:
+                self._readers.append(conn)
+        if self.prepare is not None:
+            self.prepare(conn, local.attached)
+        return conn
+
+    def cursor(self):
+        """
+        :return: returns the writer's cursor while the calling thread holds the write lock, the cursor of its
+                read-only connection otherwise
+        """
+        if getattr(self._local, "writing", 0):
+            return self._writer_cursor
+        self.reader()
+        return self._local.cursor
+
+    @contextlib.contextmanager
+    def writing(self):
+        """
+        holds the write lock, waiting for the thread holding it. It can be taken again by the thread holding it.
+
+        :return: returns a context manager giving the writer connection
+        """
+        with self.lock:
+            self._local.writing = getattr(self._local, "writing", 0) + 1
+            try:
+                yield self.writer
+            finally:
+                self._local.writing -= 1
+
+    def map(self, function, items):
+        """
+        calls a function for every item over a pool of threads kept between calls, so the threads and their reader
+        connections are reused
+
+        :param function: accepts a function of one item
+        :param items: accepts iterable of items
+        :return: returns a LIST of the results in the order of the items
+        """
+        with self._readers_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return list(self._executor.map(function, items))
+
+    def close(self):
+        """
+        stops the threads of map and closes every reader connection, the writer belongs to the User
+
+        :return: returns nothing
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+        self._local = threading.local()
+
+
+def serialized(method):
+    """
+    decorator running a User method which writes to the database under the write lock of the user's
+    ConnectionManager, so the writes of different threads take turns. Without a ConnectionManager it does nothing.
+
+    :param method: accepts a method of User
+    :return: returns the wrapped method
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.connections is None:
+            return method(self, *args, **kwargs)
+        with self.connections.writing():
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class User:
     started = False
 
-    def __init__(self, username):
+    def __init__(self, username, columnar=False, interactive=True, check_same_thread=True, snapshot=False,
+                 write_behind=False, partitioned=False, cache_size=CACHE_SIZE, persistent_cache=False, concurrent=False,
+                 duplicates="flag"):
         """
         Initializes a user object and creates a database file with username argument if one doesn't already exist.
 
-        :param username: will be used for filename of database
+        :param username: will be used for filename of database, a path to a .db file is used as is
+        :param columnar: OPTIONAL BOOLEAN, when True the analytics run on an in-memory ExpenseColumns snapshot
+        :param interactive: OPTIONAL BOOLEAN, when False confirmations and error messages aren't printed
+        :param check_same_thread: OPTIONAL BOOLEAN, False allows the object to be handed between threads as long as
+                only one thread uses it at a time
+        :param snapshot: OPTIONAL BOOLEAN, when True the analytics run on the memory mapped snapshot of the database,
+                see refresh_snapshot
+        :param write_behind: OPTIONAL BOOLEAN, when True logged expenses are committed in groups by a WriteBehindQueue
+                and only show up in the analytics after flush
+        :param partitioned: OPTIONAL BOOLEAN, when True the expenses of every year are stored in their own attached
+                file, see attach_partitions. A database whose partition directory exists is always opened partitioned
+        :param cache_size: OPTIONAL number of analytics results kept in the ResultCache in INT, 0 turns it off
+        :param persistent_cache: OPTIONAL BOOLEAN, when True the cache is loaded from the cache file of the database
+                and written back by save_cache
+        :param concurrent: OPTIONAL BOOLEAN, when True the user can be shared by threads, which read over read-only
+                connections of their own and take turns writing, see ConnectionManager
+        :param duplicates: OPTIONAL one of DUPLICATE_POLICIES in STR, what logging an expense which was already
+                logged does
         """
-        if not os.path.exists(username.capitalize() + ".db"):
-            try:
-                # Create table
-                conn = sqlite3.connect(username.capitalize() + ".db")
-                c = conn.cursor()
-                sql = '''CREATE TABLE EXPENSES (AMOUNT integer, CATEGORY text, NOTE text, DATE date)'''
-                c.execute(sql)
-                c.close()
-            except sqlite3.OperationalError or ConnectionError as e:
-                print(e)
-                User(input("Please try again.\nPlease enter your name"))
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError("duplicates must be one of {}".format(", ".join(DUPLICATE_POLICIES)))
+        self.columnar = columnar or snapshot
+        self.snapshot = snapshot
+        self.interactive = interactive
+        self._columns = None
+        self._date_index = None
+        self.writer = None
+        # DICTIONARY of YEAR as INT: name of the attached partition in STR, None unless partitioned
+        self.partitions = None
+        # years whose partition is archived and attached read-only
+        self.archived = set()
+        # False once every expense of the main database has been moved to the partitions
+        self._main_rows = True
+        # LIST of BudgetStatus of the budgets the last write touched
+        self.budget_alerts = []
+        # LIST of Anomaly of the unusual expenses and weeks of the last write
+        self.anomalies = []
+        # the sqlite3.OperationalError the last log_current_expenses or log_previous_expenses failed with, or None
+        self.write_error = None
+        self.duplicate_policy = duplicates
+        # LIST of Duplicate of the expenses of the last write which repeat ones already logged
+        self.duplicates = []
+        self.path = database_path(username)
+        self.persistent_cache = persistent_cache
+        if not cache_size:
+            self.cache = None
+        elif persistent_cache:
+            self.cache = ResultCache.load(cache_path(self.path), cache_size)
+        else:
+            self.cache = ResultCache(cache_size)
+        # the write counter as last read by the calling thread, see data_version
+        self._versions_seen = threading.local()
+        # ConnectionManager of a concurrent user, None otherwise
+        self.connections = None
+        partitioned = partitioned or os.path.isdir(partition_directory(self.path))
 
         # creates properties for database connection and a changes the started variable which is necessary to break
         #   the while loop prompting the user for a username in the main control flow of the program
         try:
-            self.user_db = sqlite3.connect(username.capitalize() + ".db")
-            self.c = self.user_db.cursor()
+            # opened by URI so archived partitions can be attached read-only
+            self.user_db = sqlite3.connect(database_uri(self.path), uri=True,
+                                           check_same_thread=check_same_thread and not concurrent,
+                                           factory=ProfiledConnection if PROFILER.enabled else sqlite3.Connection)
+            self._cursor = self.user_db.cursor()
+            # creates the tables for a new user or brings an older database file up to date
+            upgrade_database(self.user_db)
+            if partitioned:
+                os.makedirs(partition_directory(self.path), exist_ok=True)
+                self.partitions = {}
+                self.c.execute("""SELECT EXISTS (SELECT 1 FROM main.EXPENSES)""")
+                self._main_rows = bool(self.c.fetchone()[0])
+                self.attach_partitions()
+            if write_behind:
+                self.writer = WriteBehindQueue(self.path, duplicates=duplicates)
+            if concurrent:
+                self.connections = ConnectionManager(self.path, self.user_db,
+                                                     self._prepare_reader if partitioned else None)
             self.started = True
-        except sqlite3.OperationalError or ConnectionError as e:
+        except (sqlite3.OperationalError, ConnectionError) as e:
             print(e)
             print("Please try again")
 
+    @property
+    def c(self):
+        """
+        :return: returns the cursor of the calling thread, see ConnectionManager.cursor, which is the cursor of the
+                one connection unless the user is concurrent
+        """
+        if self.connections is None:
+            return self._cursor
+        return self.connections.cursor()
+
     def log_current_expenses(self, amount, category, note=""):
         """
         Accepts parameters and commits them to DB file
@@ -392,20 +3063,31 @@ class User:
         :param amount: Dollar amount in INT/FLOAT
         :param category: Expense category in STR
         :param note: Optional message in STR
-        :return: returns nothing, commits info to database
+        :return: returns True if the expense was committed to the database, or queued in write-behind mode,
+                False otherwise, e.g. when it was rejected as a duplicate
         """
 
         date = datetime.date.today()
-        sql = """INSERT INTO EXPENSES VALUES ({},'{}','{}','{}');""".format(amount, category.capitalize(), note, date)
         try:
-            self.c.execute(sql)
-            self.user_db.commit()
+            self._log_expense(amount, category.capitalize(), note, date)
+        except sqlite3.OperationalError as e:
+            self.write_error = e
+            if self.interactive:
+                print("ERROR, You broke something, please try again.")
+                pause(1.5)
+            return False
+        self.write_error = None
+        if self.interactive:
+            print_duplicates(self.duplicates)
+        if any(duplicate.rejected for duplicate in self.duplicates):
+            return False
+        if self.interactive:
             print("Success!")
-            time.sleep(.5)
+            print_budget_alerts(self.budget_alerts)
+            print_anomalies(self.anomalies)
+            pause(.5)
             print()
-        except sqlite3.OperationalError:
-            print("ERROR, You broke something, please try again.")
-            time.sleep(1.5)
+        return True
 
     def log_previous_expenses(self, amount, category, day, month, year, note=""):
         """
@@ -417,46 +3099,968 @@ class User:
         :param month: month expense was incurred in INT
         :param year: year expense was incurred in INT
         :param note: Optional message in STR
-        :return: returns nothing, commits info to database
+        :return: returns True if the expense was committed to the database, or queued in write-behind mode,
+                False otherwise, e.g. when it was rejected as a duplicate
         """
         date = before_at(day, month, year)
-        sql = """INSERT INTO EXPENSES VALUES ({},'{}','{}','{}');""".format(amount, category.capitalize(), note, date)
         try:
-            self.c.execute(sql)
-            self.user_db.commit()
+            self._log_expense(amount, category.capitalize(), note, date)
+        except sqlite3.OperationalError as e:
+            self.write_error = e
+            if self.interactive:
+                print("ERROR, You broke something, please try again.")
+            return False
+        self.write_error = None
+        if self.interactive:
+            print_duplicates(self.duplicates)
+        if any(duplicate.rejected for duplicate in self.duplicates):
+            return False
+        if self.interactive:
             print("Success!")
-            time.sleep(.5)
+            print_budget_alerts(self.budget_alerts)
+            print_anomalies(self.anomalies)
+            pause(.5)
             print()
-        except sqlite3.OperationalError:
-            print(print("ERROR, You broke something, please try again."))
+        return True
+
+    @serialized
+    def attach_partitions(self, years=()):
+        """
+        Attaches the year partitions which aren't attached yet, creating the ones of years which don't exist, and
+        recreates the TEMP views named after PARTITIONED_TABLES which put the main database and every partition
+        together, so queries which don't know their years read every partition. A partition whose file isn't
+        writable is archived and attached read-only. Partitions created by other connections are picked up on the
+        next call.
+
+        :param years: OPTIONAL accepts iterable of years as INT whose partitions are created if missing
+        :return: returns nothing
+        """
+        directory = partition_directory(self.path)
+        for year in years:
+            if year not in self.partitions and not os.path.exists(partition_path(self.path, year)):
+                create_partition(partition_path(self.path, year))
+        attached = False
+        for entry in sorted(os.listdir(directory)):
+            match = PARTITION_FILE.match(entry)
+            if not match or int(match.group(1)) in self.partitions:
+                continue
+            year = int(match.group(1))
+            path = os.path.join(directory, entry)
+            if not os.stat(path).st_mode & stat.S_IWUSR:
+                self.archived.add(year)
+                path = database_uri(path) + "?mode=ro"
+            self.c.execute("""ATTACH DATABASE ? AS P{}""".format(year), (path,))
+            self.partitions[year] = "P{}".format(year)
+            if year not in self.archived:
+                # partitions created before the duplicate index
+                self.c.execute(DUPLICATE_INDEX.format("P{}.".format(year)))
+            attached = True
+        if attached:
+            self._create_views()
+
+    def _create_views(self):
+        """
+        recreates the TEMP views named after PARTITIONED_TABLES over the main database and every partition
+
+        :return: returns nothing
+        """
+        for table in PARTITIONED_TABLES:
+            self.c.execute("""DROP VIEW IF EXISTS temp.{}""".format(table))
+            self.c.execute("""CREATE TEMP VIEW {} AS {}""".format(table, " UNION ALL ".join(
+                """SELECT * FROM {}.{}""".format(schema, table) for schema in self._schemas())))
+
+    def _prepare_reader(self, conn, attached):
+        """
+        attaches to a reader connection of a concurrent user the partitions attached since it was last handed out,
+        see ConnectionManager
+
+        :param conn: accepts the sqlite3 connection of the reader
+        :param attached: accepts SET of the names of the partitions attached to it, updated in place
+        :return: returns nothing
+        """
+        if len(attached) == len(self.partitions):
+            return
+        for year, schema in sorted(self.partitions.items()):
+            if schema not in attached:
+                conn.execute("""ATTACH DATABASE ? AS {}""".format(schema),
+                             (database_uri(partition_path(self.path, year)) + "?mode=ro",))
+                attached.add(schema)
+        for table in PARTITIONED_TABLES:
+            conn.execute("""DROP VIEW IF EXISTS temp.{}""".format(table))
+            conn.execute("""CREATE TEMP VIEW {} AS {}""".format(table, " UNION ALL ".join(
+                """SELECT * FROM {}.{}""".format(schema, table) for schema in self._schemas())))
+
+    def _schemas(self, first_year=None, last_year=None):
+        """
+        :param first_year: OPTIONAL accepts INT, partitions of earlier years are left out
+        :param last_year: OPTIONAL accepts INT, partitions of later years are left out
+        :return: returns a LIST of the names of the attached databases holding expenses of the years, main included
+                unless every expense has been moved to the partitions
+        """
+        schemas = ["main"] if self._main_rows or (first_year is None and last_year is None) else []
+        for year in sorted(self.partitions or ()):
+            if (first_year is None or year >= first_year) and (last_year is None or year <= last_year):
+                schemas.append(self.partitions[year])
+        return schemas or ["main"]
+
+    def _source(self, table, first_year=None, last_year=None):
+        """
+        partition pruning, only the partitions of the years a query touches are read
+
+        :param table: one of PARTITIONED_TABLES in STR
+        :param first_year: OPTIONAL first year the query touches in INT
+        :param last_year: OPTIONAL last year the query touches in INT
+        :return: returns what to select the table from in STR, the table itself unless partitioned
+        """
+        if self.partitions is None or (first_year is None and last_year is None):
+            return table
+        return "(" + " UNION ALL ".join("""SELECT * FROM {}.{}""".format(schema, table)
+                                        for schema in self._schemas(first_year, last_year)) + ") AS " + table
+
+    def _expense_rows(self, start=None, end=None):
+        """
+        :param start: OPTIONAL first day the query touches, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: OPTIONAL last day the query touches, accepts DATE object or STR in YYYY-MM-DD format
+        :return: returns EXPENSE_ROWS reading only the partitions of the days
+        """
+        return EXPENSE_ROWS.replace("EXPENSES", self._source("EXPENSES", *self._years(start, end)), 1)
+
+    @staticmethod
+    def _years(start=None, end=None):
+        """
+        :return: returns a TUPLE of the years of start and end as INT, None for a day which isn't given
+        """
+        return (None if start is None else ordinal_year(day_ordinal(start)),
+                None if end is None else ordinal_year(day_ordinal(end)))
+
+    def data_version(self):
+        """
+        returns the write counter of the database, see VERSION_SCHEMA. It is read over the connection of the calling
+        thread, the one its results are computed over, so a reader of a concurrent user never files a result of its
+        older snapshot under the counter of a write another thread hasn't committed yet. The counter is only read
+        again once that connection changed rows or PRAGMA data_version says another connection committed, so an
+        unchanged database costs one pragma per check.
+
+        :return: returns the write counter in INT
+        """
+        conn = self.c.connection
+        seen = getattr(self._versions_seen, "connections", None)
+        if seen is None:
+            # DICTIONARY of connection: ((total_changes, PRAGMA data_version), counter)
+            seen = self._versions_seen.connections = {}
+        changes = (conn.total_changes, conn.execute("""PRAGMA data_version""").fetchone()[0])
+        if conn not in seen or seen[conn][0] != changes:
+            seen[conn] = (changes, conn.execute("""SELECT VERSION FROM DATA_VERSION""").fetchone()[0])
+        return seen[conn][1]
+
+    def save_cache(self):
+        """
+        writes the results cache to the cache file of the database, see cache_path, when the user was opened with
+        persistent_cache
+
+        :return: returns nothing
+        """
+        if self.persistent_cache and self.cache is not None:
+            self.cache.save(cache_path(self.path))
+
+    def _log_expense(self, amount, category, note, date):
+        """
+        inserts one expense, or queues it in write-behind mode
+        """
+        if self.writer is not None:
+            # the budgets, duplicates and anomalies are checked by the background thread
+            self.budget_alerts = []
+            self.duplicates = []
+            self.anomalies = []
+            self.writer.put(amount, category, note, date)
+        else:
+            self._insert_expenses([(amount, category, note, date)])
+
+    def flush(self):
+        """
+        in write-behind mode, waits until every logged expense is committed and drops the in-memory analytics built
+        before, since they don't hold the expenses committed by the background thread
+
+        :return: returns nothing
+        """
+        if self.writer is None:
+            return
+        self.writer.flush()
+        if self.partitions is not None:
+            self.attach_partitions()
+        self._columns = None
+        self._date_index = None
+
+    @serialized
+    def _insert_expenses(self, rows):
+        """
+        inserts expenses in a single transaction, the duplicates among them are handled by the duplicate policy and
+        left in self.duplicates
+
+        :param rows: accepts LIST of TUPLES (AMOUNT as INT/FLOAT, CATEGORY as STR, NOTE as STR,
+                DATE as DATE object or STR in YYYY-MM-DD format)
+        :return: returns nothing, commits to database
+        """
+        self.duplicates = []
+        sql = """INSERT INTO EXPENSES (CENTS, CATEGORY_ID, NOTE, DAY) VALUES (?, ?, ?, ?)"""
+        if self.partitions is not None:
+            # partitions can only be attached outside of a transaction
+            self.attach_partitions(set(ordinal_year(day_ordinal(entry[3])) for entry in rows))
+        try:
+            begin_write(self.c)
+            self.c.executemany("""INSERT OR IGNORE INTO CATEGORIES (NAME) VALUES (?)""",
+                               [(name,) for name in set(entry[1] for entry in rows)])
+            self.c.execute("""SELECT NAME, ID FROM CATEGORIES""")
+            category_ids = dict(self.c.fetchall())
+            values = [(to_cents(entry[0]), category_ids.get(entry[1]), entry[2], day_ordinal(entry[3]))
+                      for entry in rows]
+            if self.duplicate_policy != "allow":
+                rows, values = self._screen_duplicates(rows, values)
+            if self.partitions is None:
+                self.c.executemany(sql, values)
+            else:
+                self._insert_partitioned(values)
+            added = {}
+            for cents, category_id, note, day in values:
+                date = datetime.date.fromordinal(max(1, day))
+                added[category_id, date.year, date.month] = added.get((category_id, date.year, date.month), 0) + cents
+            self.budget_alerts = self._budget_changes(added)
+            self.anomalies = self._anomaly_changes(rows, values)
+            self.user_db.commit()
+        except (sqlite3.Error, ValueError):
+            # a bad amount or date must not leave the transaction open either
+            self.user_db.rollback()
+            raise
+        if self.snapshot:
+            # picked up by the next incremental refresh
+            self._columns = None
+        elif self._columns is not None:
+            self._columns.append(rows)
+        if self._date_index is not None:
+            self._date_index.add(rows)
+
+    def _screen_duplicates(self, rows, values):
+        """
+        looks up every expense of a write among the expenses already logged and the earlier expenses of the write,
+        inside the transaction of _insert_expenses. An expense is a duplicate of one with the same day, amount,
+        category and normalize_note note, which takes one lookup of EXPENSES_DUPLICATE_IDX and a set lookup.
+
+        :param rows: accepts the LIST of rows given to _insert_expenses
+        :param values: accepts LIST of TUPLES (CENTS as INT, CATEGORY_ID as INT, NOTE as STR, DAY as INT) of the rows
+        :return: returns a TUPLE of the rows and the values to insert, the duplicates are added to self.duplicates
+        """
+        reject = self.duplicate_policy == "reject"
+        sources = {}
+        seen = set()
+        kept_rows = []
+        kept_values = []
+        for index, (entry, value) in enumerate(zip(rows, values)):
+            cents, category_id, note, day = value
+            key = (day, cents, category_id, normalize_note(note))
+            duplicate = key in seen
+            duplicate_of = None
+            if not duplicate:
+                year = ordinal_year(day)
+                if year not in sources:
+                    sources[year] = """SELECT ID, NOTE FROM """ + self._source("EXPENSES", year, year) + \
+                        """ WHERE DAY = ? AND CENTS = ? AND CATEGORY_ID IS ?"""
+                self.c.execute(sources[year], (day, cents, category_id))
+                for expense_id, existing in self.c.fetchall():
+                    if normalize_note(existing) == key[3]:
+                        duplicate = True
+                        duplicate_of = expense_id
+                        break
+            if duplicate:
+                self.duplicates.append(Duplicate(index, cents / 100.0, entry[1], note,
+                                                 str(datetime.date.fromordinal(max(1, day))), duplicate_of, reject))
+                if reject:
+                    continue
+            seen.add(key)
+            kept_rows.append(entry)
+            kept_values.append(value)
+        return kept_rows, kept_values
+
+    def _read_norms(self, category_ids):
+        """
+        :param category_ids: accepts iterable of category ids as INT
+        :return: returns a DICTIONARY of CATEGORY_ID as INT: SpendingNorm of the categories which have one
+        """
+        category_ids = list(category_ids)
+        if not category_ids:
+            return {}
+        self.c.execute("""SELECT * FROM ANOMALY_STATE WHERE CATEGORY_ID IN ({})"""
+                       .format(", ".join("?" * len(category_ids))), category_ids)
+        return {entry[0]: SpendingNorm(*entry[1:]) for entry in self.c.fetchall()}
+
+    def _anomaly_changes(self, rows, values):
+        """
+        checks the expenses of a write against the norms of their categories and adds them to the norms, after the
+        write and in its transaction. The cost is one read and one write per category written to, whatever the
+        number of expenses.
+
+        :param rows: accepts the LIST of rows inserted by _insert_expenses
+        :param values: accepts LIST of TUPLES (CENTS as INT, CATEGORY_ID as INT, NOTE as STR, DAY as INT) of the rows
+        :return: returns a LIST of Anomaly
+        """
+        norms = self._read_norms(set(entry[1] for entry in values if entry[1] is not None))
+        anomalies = []
+        for entry, (cents, category_id, note, day) in zip(rows, values):
+            if category_id is None:
+                continue
+            norm = norms.setdefault(category_id, SpendingNorm())
+            for kind, expected, score in norm.add(cents, day):
+                anomalies.append(Anomaly(kind, entry[1], (cents if kind == "amount" else norm.week_cents) / 100.0,
+                                         str(datetime.date.fromordinal(max(1, day))), round(expected / 100.0, 2),
+                                         round(score, 1)))
+        self.c.executemany("""INSERT OR REPLACE INTO ANOMALY_STATE VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                           [(category_id,) + norm.row() for category_id, norm in norms.items()])
+        return anomalies
+
+    @serialized
+    def backfill_anomalies(self):
+        """
+        rebuilds the anomaly state by replaying every expense in date order in one streaming pass, which holds one
+        SpendingNorm per category in memory. Seeds the state of a database which had expenses before it was kept,
+        and brings it back in line after expenses were deleted.
+
+        :return: returns the number of expenses replayed in INT
+        """
+        norms = {}
+        replayed = 0
+        cursor = self.c.connection.cursor()
+        try:
+            cursor.execute("""SELECT CATEGORY_ID, CENTS, DAY FROM EXPENSES WHERE CATEGORY_ID IS NOT NULL
+                              ORDER BY DAY, ID""")
+            while True:
+                chunk = cursor.fetchmany(FETCH_SIZE)
+                if not chunk:
+                    break
+                for category_id, cents, day in chunk:
+                    norm = norms.get(category_id)
+                    if norm is None:
+                        norm = norms[category_id] = SpendingNorm()
+                    norm.add(cents, day)
+                replayed += len(chunk)
+        finally:
+            cursor.close()
+        try:
+            begin_write(self.c)
+            self.c.execute("""DELETE FROM ANOMALY_STATE""")
+            self.c.executemany("""INSERT INTO ANOMALY_STATE VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                               [(category_id,) + norm.row() for category_id, norm in norms.items()])
+            self.user_db.commit()
+        except sqlite3.Error:
+            self.user_db.rollback()
+            raise
+        return replayed
+
+    def _period_spend(self, category_id, year, month=None):
+        """
+        :param category_id: accepts INT
+        :param year: accepts INT from 0-9999
+        :param month: OPTIONAL accepts INT from 1-12, the whole year if not given
+        :return: returns the spending of a category in a month or year in cents as INT, read from at most 12 rollup
+                rows
+        """
+        sql = """SELECT COALESCE(SUM(TOTAL), 0) FROM """ + self._source("ROLLUP_MONTHLY", year, year) + \
+            """ WHERE YEAR = ? AND CATEGORY_ID = ?"""
+        params = [year, category_id]
+        if month is not None:
+            sql += """ AND MONTH = ?"""
+            params.append(month)
+        self.c.execute(sql, params)
+        return self.c.fetchone()[0]
+
+    def _budget_changes(self, added):
+        """
+        checks the budgets of the categories a write changed, after the write and in its transaction. The cost
+        depends on the number of budgets and periods touched and not on the number of expenses.
+
+        :param added: accepts DICTIONARY of TUPLE (CATEGORY_ID, YEAR, MONTH): cents the write added as INT
+        :return: returns a LIST of BudgetStatus of every budget of the periods written to
+        """
+        category_ids = sorted(set(key[0] for key in added if key[0] is not None))
+        if not category_ids:
+            return []
+        self.c.execute("""SELECT CATEGORY_ID, NAME, PERIOD, BUDGETS.CENTS FROM BUDGETS
+                          JOIN CATEGORIES ON CATEGORIES.ID = CATEGORY_ID WHERE CATEGORY_ID IN ({})
+                          ORDER BY NAME, PERIOD""".format(", ".join("?" * len(category_ids))), category_ids)
+        statuses = []
+        for category_id, name, period, budget in self.c.fetchall():
+            periods = {}
+            for (key_id, year, month), cents in added.items():
+                if key_id == category_id:
+                    key = (year, month if period == "month" else None)
+                    periods[key] = periods.get(key, 0) + cents
+            for (year, month), cents in sorted(periods.items()):
+                spent = self._period_spend(category_id, year, month)
+                statuses.append(budget_status(name, period, year, month, budget, spent, spent - cents))
+        return statuses
+
+    @serialized
+    def set_budget(self, category, amount, period="month"):
+        """
+        sets the monthly or yearly budget of a category, creating the category if it doesn't exist
+
+        :param category: accepts STR
+        :param amount: Dollar amount in INT/FLOAT, None removes the budget
+        :param period: OPTIONAL "month" or "year" in STR
+        :return: returns nothing, commits to database
+        """
+        if period not in ("month", "year"):
+            raise ValueError("a budget is either monthly or yearly")
+        try:
+            begin_write(self.c)
+            self.c.execute("""INSERT OR IGNORE INTO CATEGORIES (NAME) VALUES (?)""", (category.capitalize(),))
+            self.c.execute("""SELECT ID FROM CATEGORIES WHERE NAME = ?""", (category.capitalize(),))
+            category_id = self.c.fetchone()[0]
+            if amount is None:
+                self.c.execute("""DELETE FROM BUDGETS WHERE CATEGORY_ID = ? AND PERIOD = ?""", (category_id, period))
+            else:
+                self.c.execute("""INSERT OR REPLACE INTO BUDGETS VALUES (?, ?, ?)""",
+                               (category_id, period, to_cents(amount)))
+            self.user_db.commit()
+        except sqlite3.Error:
+            self.user_db.rollback()
+            raise
+
+    def budget_status(self, year=None, month=None):
+        """
+        lists every category with its budgets against the spending of the month and year, read from the monthly
+        rollups without scanning the expenses
+
+        :param year: OPTIONAL accepts INT from 0-9999, defaults to this year
+        :param month: OPTIONAL accepts INT from 1-12, defaults to this month
+        :return: returns a LIST of BudgetStatus, one for every budget and one for every category without a budget
+                against its spending of the month
+        """
+        today = datetime.date.today()
+        year = today.year if year is None else year
+        month = today.month if month is None else month
+        self.c.execute("""SELECT NAME, PERIOD, BUDGETS.CENTS,
+                                 (SELECT COALESCE(SUM(TOTAL), 0) FROM """ + self._source("ROLLUP_MONTHLY", year, year) +
+                       """ WHERE YEAR = ? AND CATEGORY_ID = CATEGORIES.ID
+                           AND (MONTH = ? OR PERIOD = 'year'))
+                          FROM CATEGORIES LEFT JOIN BUDGETS ON CATEGORY_ID = CATEGORIES.ID ORDER BY NAME, PERIOD""",
+                       (year, month))
+        return [budget_status(name, period or "month", year, month if period != "year" else None, budget, spent)
+                for name, period, budget, spent in self.c.fetchall()]
+
+    def _insert_partitioned(self, values):
+        """
+        routes expenses to the partitions of their years, inside the transaction of _insert_expenses. Ids keep
+        increasing across every partition, so an id names one expense and the snapshot can still be refreshed by id,
+        and the search index in the main database is updated here since its triggers only see the main table.
+
+        :param values: accepts LIST of TUPLES (CENTS as INT, CATEGORY_ID as INT, NOTE as STR, DAY as INT)
+        :return: returns nothing
+        """
+        self.c.execute("""SELECT MAX(ID) FROM ({})""".format(" UNION ALL ".join(
+            """SELECT MAX(ID) AS ID FROM {}.EXPENSES""".format(schema) for schema in self._schemas())))
+        first_id = (self.c.fetchone()[0] or 0) + 1
+        years = {}
+        for number, entry in enumerate(values, first_id):
+            years.setdefault(ordinal_year(entry[3]), []).append((number,) + entry)
+        for year, entries in years.items():
+            self.c.executemany("""INSERT INTO {}.EXPENSES (ID, CENTS, CATEGORY_ID, NOTE, DAY) VALUES (?, ?, ?, ?, ?)"""
+                               .format(self.partitions[year]), entries)
+        self.c.execute("""SELECT 1 FROM main.sqlite_master WHERE name = 'EXPENSES_FTS'""")
+        if self.c.fetchone():
+            self.c.executemany("""INSERT INTO EXPENSES_FTS (rowid, NOTE) VALUES (?, ?)""",
+                               [(number, entry[2]) for number, entry in enumerate(values, first_id)])
+        self.c.execute("""UPDATE main.DATA_VERSION SET VERSION = VERSION + 1""")
+
+    def bulk_import(self, path, batch_size=1000, reject_path=None, delimiter=None):
+        """
+        Streams expenses from a file into the database. Rows are validated like menu entries and inserted with
+        executemany in batches, one transaction per batch, so a large file costs one commit per batch instead of one
+        per expense. Malformed rows, and duplicates when the duplicate policy is "reject", are written to a reject
+        file along with the reason and do not stop the import.
+
+        :param path: accepts STR path to the file, see read_expense_file for the accepted layouts
+        :param batch_size: OPTIONAL number of rows per transaction in INT
+        :param reject_path: OPTIONAL STR path of the reject file, defaults to the import file name plus .rejects.csv
+        :param delimiter: OPTIONAL accepts single character STR, guessed from the file if not given
+        :return: returns an ImportResult
+        """
+        if reject_path is None:
+            reject_path = path + ".rejects.csv"
+        imported = 0
+        rejected = 0
+        duplicates = 0
+        reject_file = None
+        reject_writer = None
+        batch = []
+        # (line number, fields) of every row of the batch, for the duplicates rejected when it is inserted
+        lines = []
+        started = time.perf_counter()
+
+        def reject(line_number, fields, reason):
+            nonlocal reject_file, reject_writer, rejected
+            if reject_writer is None:
+                reject_file = open(reject_path, "w", newline="", encoding="utf-8")
+                reject_writer = csv.writer(reject_file)
+            reject_writer.writerow([line_number] + fields + [reason])
+            rejected += 1
+
+        def commit_batch():
+            nonlocal imported, duplicates
+            self._insert_expenses(batch)
+            imported += len(batch)
+            duplicates += len(self.duplicates)
+            for duplicate in self.duplicates:
+                if duplicate.rejected:
+                    imported -= 1
+                    reject(*lines[duplicate.index], "duplicate of " + (
+                        "expense {}".format(duplicate.duplicate_of) if duplicate.duplicate_of is not None
+                        else "an earlier row"))
+            del batch[:]
+            del lines[:]
+
+        try:
+            for line_number, fields, row in read_expense_file(path, delimiter):
+                try:
+                    if row is None:
+                        raise ValueError("expected AMOUNT, CATEGORY, NOTE, DATE but got {} fields".format(len(fields)))
+                    batch.append(normalize_expense(*row))
+                    lines.append((line_number, fields))
+                except ValueError as e:
+                    reject(line_number, fields, str(e))
+                    continue
+                if len(batch) >= batch_size:
+                    commit_batch()
+            if batch:
+                commit_batch()
+        finally:
+            if reject_file is not None:
+                reject_file.close()
+        seconds = time.perf_counter() - started
+        return ImportResult(imported=imported, rejected=rejected, seconds=round(seconds, 3),
+                            rows_per_second=round(imported / seconds, 1) if seconds else float(imported),
+                            duplicates=duplicates)
+
+    def iter_data(self, category=None, start=None, end=None, chunk_size=FETCH_SIZE):
+        """
+        Generator which reads expenses from the table in chunks of chunk_size rows with its own cursor, so the whole
+        table is never held in memory and other queries can run while it is being consumed.
+
+        :param category: OPTIONAL accepts STR
+        :param start: OPTIONAL first day included, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: OPTIONAL last day included, accepts DATE object or STR in YYYY-MM-DD format
+        :param chunk_size: OPTIONAL number of rows fetched at a time in INT
+        :return: yields TUPLES of (AMOUNT, CATEGORY, NOTE, DATE)
+        """
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("DAY >= ?")
+            params.append(day_ordinal(start))
+        if end is not None:
+            conditions.append("DAY <= ?")
+            params.append(day_ordinal(end))
+        if category:
+            conditions.append(CATEGORY_CONDITION)
+            params.append(category)
+        sql = """SELECT """ + ROW_COLUMNS + """ FROM """ + self._expense_rows(start, end)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        cursor = self.c.connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for entry in rows:
+                    yield entry
+        finally:
+            cursor.close()
+
+    def stream(self, category=None, start=None, end=None):
+        """
+        starts a lazy ExpenseStream pipeline over the table, see iter_data for the parameters
+
+        :return: returns an ExpenseStream
+        """
+        return ExpenseStream(self.iter_data(category, start, end))
 
     def grab_data(self, category=None):
         """
-        grabs either all data from table or all data from a specific category if specified
+        grabs either all data from table or all data from a specific category if specified
+
+        :param category: accepts STR
+        :return: returns multi-dimensional iterable data type of LIST containing TUPLES
+        """
+        return list(self.iter_data(category))
+
+    def grab_date_range(self, start, end, category=None):
+        """
+        grabs all data between two dates (both inclusive) using the index on DAY instead of scanning the whole table,
+        optionally only for a specific category
+
+        :param start: accepts DATE object or STR in YYYY-MM-DD format
+        :param end: accepts DATE object or STR in YYYY-MM-DD format
+        :param category: OPTIONAL accepts STR
+        :return: returns multi-dimensional iterable data type of LIST containing TUPLES
+        """
+        return list(self.iter_data(category, start, end))
+
+    def grab_year(self, year, category=None):
+        """
+        grabs all data for a given year
+
+        :param year: accepts INT from 0-9999
+        :param category: OPTIONAL accepts STR
+        :return: returns multi-dimensional iterable data type of LIST containing TUPLES
+        """
+        start, end = year_bounds(year)
+        return self.grab_date_range(start, end, category)
+
+    def grab_month(self, month, year, category=None):
+        """
+        grabs all data for a given month of a given year
+
+        :param month: accepts INT from 1-12
+        :param year: accepts INT from 0-9999
+        :param category: OPTIONAL accepts STR
+        :return: returns multi-dimensional iterable data type of LIST containing TUPLES
+        """
+        start, end = month_bounds(month, year)
+        return self.grab_date_range(start, end, category)
+
+    def grab_week_of_month(self, week, month, year, category=None):
+        """
+        grabs all data for a given week of a given month and year
+
+        :param week: accepts INT from 1-5
+        :param month: accepts INT from 1-12
+        :param year: accepts INT from 0-9999
+        :param category: OPTIONAL accepts STR
+        :return: returns multi-dimensional iterable data type of LIST containing TUPLES
+        """
+        bounds = week_of_month_bounds(week, month, year)
+        if bounds is None:
+            return []
+        return self.grab_date_range(bounds[0], bounds[1], category)
+
+    @serialized
+    def rebuild_rollups(self):
+        """
+        recomputes the rollup tables from the raw expenses, only needed if the rollups were ever modified by hand
+
+        :return: returns nothing, commits to database
+        """
+        for schema in self._schemas():
+            # the rollups of an archived partition were final when it was archived
+            if schema == "main" or int(schema[1:]) not in self.archived:
+                begin_write(self.user_db)
+                rebuild_rollups(self.user_db, schema)
+        # rollups which were wrong change the results without any expense changing
+        begin_write(self.c)
+        self.c.execute("""UPDATE DATA_VERSION SET VERSION = VERSION + 1""")
+        self.user_db.commit()
+
+    @serialized
+    def partition_expenses(self):
+        """
+        moves the expenses of the main database to the partitions of their years, one transaction per year, and
+        compacts the main database afterwards. Turns the partitioned layout on if it isn't yet. Ids don't change, so
+        the search index and the snapshot stay valid.
+
+        :return: returns a DICTIONARY of YEAR as INT: number of expenses moved as INT
+        """
+        if self.partitions is None:
+            os.makedirs(partition_directory(self.path), exist_ok=True)
+            self.partitions = {}
+        self.c.execute("""SELECT DISTINCT YEAR FROM main.EXPENSES""")
+        years = sorted(set(max(1, entry[0]) for entry in self.c.fetchall()))
+        self.attach_partitions(years)
+        self.c.execute("""SELECT 1 FROM main.sqlite_master WHERE name = 'EXPENSES_FTS'""")
+        search = self.c.fetchone() is not None
+        moved = {}
+        for year in years:
+            # year 0 is stored as day 0, which ordinal_year counts as year 1
+            first, last = (0 if year == 1 else day_ordinal(year_bounds(year)[0])), day_ordinal(year_bounds(year)[1])
+            try:
+                begin_write(self.c)
+                self.c.execute("""INSERT INTO {}.EXPENSES (ID, CENTS, CATEGORY_ID, NOTE, DAY)
+                                  SELECT ID, CENTS, CATEGORY_ID, NOTE, DAY FROM main.EXPENSES
+                                  WHERE DAY BETWEEN ? AND ?"""
+                               .format(self.partitions[year]), (first, last))
+                moved[year] = self.c.rowcount
+                # the delete trigger takes the rows out of the search index, they go back in under the same ids
+                self.c.execute("""DELETE FROM main.EXPENSES WHERE DAY BETWEEN ? AND ?""", (first, last))
+                if search:
+                    self.c.execute("""INSERT INTO EXPENSES_FTS (rowid, NOTE)
+                                      SELECT ID, NOTE FROM {}.EXPENSES WHERE DAY BETWEEN ? AND ?"""
+                                   .format(self.partitions[year]), (first, last))
+                self.user_db.commit()
+            except sqlite3.Error:
+                self.user_db.rollback()
+                raise
+        self._main_rows = False
+        vacuum_database(self.path)
+        self._date_index = None
+        return moved
+
+    @serialized
+    def archive_partition(self, year):
+        """
+        compacts the partition of a year and makes its file read-only, it is attached read-only from then on and can
+        be copied or backed up on its own. Making the file writable again brings the year back.
+
+        :param year: accepts INT from 1-9999
+        :return: returns nothing, raises ValueError if the database isn't partitioned or has no such partition
+        """
+        if self.partitions is None or year not in self.partitions:
+            raise ValueError("there is no partition for {}".format(year))
+        if year in self.archived:
+            return
+        path = partition_path(self.path, year)
+        self.c.execute("""DETACH DATABASE {}""".format(self.partitions.pop(year)))
+        vacuum_database(path)
+        os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        self.attach_partitions()
+
+    def rollup_totals(self, year=None, month=None, category=None):
+        """
+        reads the monthly rollups grouped by category, the cost depends on the number of categories and months in the
+        database and not on the number of expenses
+
+        :param year: OPTIONAL accepts INT from 0-9999
+        :param month: OPTIONAL accepts INT from 1-12, matched in every year if no year is given
+        :param category: OPTIONAL accepts STR
+        :return: DICTIONARY of CATEGORY as STR: LIST of [COUNT as INT, TOTAL as FLOAT]
+        """
+        conditions = []
+        params = []
+        for column, value in (("YEAR", year), ("MONTH", month), ("NAME", category)):
+            if value is not None:
+                conditions.append(column + " = ?")
+                params.append(value)
+        sql = """SELECT NAME, SUM(COUNT), SUM(TOTAL) / 100.0 FROM """ + self._source("ROLLUP_MONTHLY", year, year) + \
+            """ JOIN CATEGORIES ON CATEGORIES.ID = CATEGORY_ID"""
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        self.c.execute(sql + " GROUP BY CATEGORY_ID", params)
+        return {category: [count, total] for category, count, total in self.c.fetchall()}
+
+    def daily_totals(self, start, end, category=None, history=0):
+        """
+        reads the daily rollups of a range of days, the cost depends on the number of days and categories in the range
+        and not on the number of expenses
+
+        :param start: first day of the series, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: last day of the series, accepts DATE object or STR in YYYY-MM-DD format
+        :param category: OPTIONAL accepts STR
+        :param history: OPTIONAL number of days before start in INT also read, see DailyTotals
+        :return: returns a DailyTotals
+        """
+        first = datetime.date.fromordinal(max(1, day_ordinal(start) - history))
+        last = datetime.date.fromordinal(day_ordinal(end))
+        sql = """SELECT CAST(julianday(printf('%04d-%02d-%02d', YEAR, MONTH, DAY)) - 1721424.5 AS INTEGER), COUNT,
+                 TOTAL FROM """ + self._source("ROLLUP_DAILY", first.year, last.year) + \
+            """ WHERE (YEAR, MONTH, DAY) BETWEEN (?, ?, ?) AND (?, ?, ?)"""
+        params = [first.year, first.month, first.day, last.year, last.month, last.day]
+        if category is not None:
+            sql += " AND " + CATEGORY_CONDITION
+            params.append(category)
+        self.c.execute(sql, params)
+        return DailyTotals(start, end, self.c.fetchall(), history)
+
+    def trends(self, start, end, windows=TREND_WINDOWS, category=None):
+        """
+        computes moving totals and averages and the cumulative spending of a range of days from the running totals of
+        the daily rollups, the days before start are read so every window is full
+
+        :param start: first day of the series, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: last day of the series, accepts DATE object or STR in YYYY-MM-DD format
+        :param windows: OPTIONAL accepts iterable of window widths in days as INT
+        :param category: OPTIONAL accepts STR
+        :return: returns a DICTIONARY with "moving": DICTIONARY of WINDOW as INT: LIST of TrendPoint, "daily" and
+                "cumulative": LIST of TrendPoint
+        """
+        windows = sorted(set(windows))
+        totals = self.daily_totals(start, end, category, max(windows, default=1) - 1)
+        return dict(moving={window: totals.moving(window) for window in windows}, daily=totals.daily(),
+                    cumulative=totals.cumulative())
+
+    @cached
+    def monthly_changes(self, year=None, category=None):
+        """
+        computes the month over month and year over year change of every category from the monthly rollups
+
+        :param year: OPTIONAL accepts INT between 0-9999, every month in the database if no year is given
+        :param category: OPTIONAL accepts STR
+        :return: returns a LIST of MonthChange, see month_changes
+        """
+        conditions = []
+        params = []
+        if year is not None:
+            conditions.append("YEAR BETWEEN ? AND ?")
+            params += [year - 1, year]
+        if category is not None:
+            conditions.append("NAME = ?")
+            params.append(category)
+        sql = """SELECT NAME, YEAR, MONTH, TOTAL / 100.0 FROM """ + \
+            self._source("ROLLUP_MONTHLY", None if year is None else year - 1, year) + \
+            """ JOIN CATEGORIES ON CATEGORIES.ID = CATEGORY_ID"""
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        self.c.execute(sql, params)
+        # with a category the total of every category is the category itself, so it is left out
+        return [change for change in month_changes(self.c.fetchall())
+                if (year is None or change.year == year) and (category is None or change.category)]
+
+    def grab_columns(self):
+        """
+        returns the columnar snapshot of the whole table, loading it on first use. The snapshot is kept up to date by
+        the methods writing to the database. With snapshot=True it is the memory mapped snapshot file, refreshed with
+        the rows added since it was last used.
+
+        :return: returns an ExpenseColumns
+        """
+        if self._columns is None:
+            if self.snapshot:
+                self._columns = load_snapshot(self.c.connection, snapshot_path(self.path))
+            else:
+                self._columns = ExpenseColumns(self.iter_data())
+        return self._columns
+
+    def date_index(self):
+        """
+        returns the date sorted index of the whole table, built on first use and kept up to date by the methods
+        writing to the database
+
+        :return: returns a DateIndex
+        """
+        if self._date_index is None:
+            # a scan of the table in id order sorted by day is faster than reading it through EXPENSES_DAY_IDX, the
+            # sort is stable so expenses of the same day stay in id order
+            self.c.execute("""SELECT DAY, CENTS, """ + ROW_COLUMNS + """ FROM """ + EXPENSE_ROWS)
+            rows = self.c.fetchall()
+            rows.sort(key=lambda entry: entry[0])
+            self._date_index = DateIndex()
+            self._date_index.extend_sorted(rows)
+        return self._date_index
+
+    def refresh_snapshot(self):
+        """
+        writes the rows added since the last refresh to the snapshot of the database, see refresh_snapshot
+
+        :return: returns the number of rows added in INT
+        """
+        if self.snapshot:
+            self._columns = None
+        return refresh_snapshot(self.c.connection, snapshot_path(self.path))
 
-        :param category: accepts STR
-        :return: returns multi-dimensional iterable data type of LIST containing TUPLES
+    def grab_period(self, year=None, month=None, week=None, start=None, end=None, category=None):
         """
-        if category:
-            sql = """SELECT * FROM EXPENSES WHERE CATEGORY = '{}'""".format(category)
-        else:
-            sql = """SELECT * FROM EXPENSES"""
-        self.c.execute(sql)
-        result = self.c.fetchall()
-        return result
+        grabs the data of a year, month or week of the month, or of an arbitrary date range, using whichever of the
+        range queries fits the arguments
+
+        :param year: OPTIONAL accepts INT from 0-9999
+        :param month: OPTIONAL accepts INT from 1-12, needs year
+        :param week: OPTIONAL accepts INT from 1-5, needs month
+        :param start: OPTIONAL first day included, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: OPTIONAL last day included, accepts DATE object or STR in YYYY-MM-DD format
+        :param category: OPTIONAL accepts STR
+        :return: returns iterable data type of TUPLES, raises ValueError if the arguments don't fit together
+        """
+        if start is not None or end is not None:
+            return self.iter_data(category, start, end)
+        if year is None:
+            if month is not None or week is not None:
+                raise ValueError("a month or week needs a year")
+            return self.iter_data(category)
+        if week is not None:
+            if month is None:
+                raise ValueError("a week needs a month")
+            return self.grab_week_of_month(week, month, year, category)
+        if month is not None:
+            return self.grab_month(month, year, category)
+        return self.grab_year(year, category)
 
     def grab_categories(self):
         """
-        function that takes all table entries and returns a list of categories.
+        function that reads the category table and returns a list of categories.
 
         :return: returns a LIST with all the categories present in the database
         """
-        data = category_breakdown(self.grab_data())
+        # one index lookup per category leaves out the categories with no expenses left
+        self.c.execute("""SELECT NAME FROM CATEGORIES
+                          WHERE EXISTS (SELECT 1 FROM EXPENSES WHERE CATEGORY_ID = CATEGORIES.ID) ORDER BY ID""")
         categories = []
-        for entry in data:
-            categories.append(entry)
+        for entry in self.c.fetchall():
+            categories.append(entry[0])
         return categories
 
+    def search(self, text, start=None, end=None, category=None, limit=50):
+        """
+        Finds the expenses whose note, or whose category name, matches every term of a search, best matches first.
+        Uses the FTS5 index, or scans the notes with LIKE if the database has no index.
+
+        :param text: accepts STR, see search_terms
+        :param start: OPTIONAL first day included, accepts DATE object or STR in YYYY-MM-DD format
+        :param end: OPTIONAL last day included, accepts DATE object or STR in YYYY-MM-DD format
+        :param category: OPTIONAL accepts STR
+        :param limit: OPTIONAL most results returned in INT
+        :return: returns a LIST of TUPLES (AMOUNT, CATEGORY, NOTE, DATE)
+        """
+        terms = search_terms(text)
+        if not terms:
+            raise ValueError("nothing to search for")
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("DAY >= ?")
+            params.append(day_ordinal(start))
+        if end is not None:
+            conditions.append("DAY <= ?")
+            params.append(day_ordinal(end))
+        if category:
+            conditions.append(CATEGORY_CONDITION)
+            params.append(category)
+        self.c.execute("""SELECT 1 FROM sqlite_master WHERE name = 'EXPENSES_FTS'""")
+        if self.c.fetchone():
+            query = " ".join('"{}"{}'.format(term, "*" if prefix else "") for term, prefix in terms)
+            self.c.execute("""SELECT rowid FROM CATEGORIES_FTS WHERE CATEGORIES_FTS MATCH ?""", (query,))
+            category_ids = [entry[0] for entry in self.c.fetchall()]
+            hits = """SELECT rowid AS HIT, rank AS SCORE FROM EXPENSES_FTS WHERE EXPENSES_FTS MATCH ?"""
+            order = """ ORDER BY SCORE, DAY DESC LIMIT ?"""
+            if category_ids:
+                # notes ranked by bm25 come first, expenses matched by their category name after them
+                hits += """ UNION ALL SELECT ID, 0 FROM EXPENSES WHERE CATEGORY_ID IN ({})""" \
+                    .format(", ".join("?" * len(category_ids)))
+                order = """ GROUP BY HIT ORDER BY MIN(SCORE), DAY DESC LIMIT ?"""
+            if self.partitions is None:
+                sql = """SELECT """ + ROW_COLUMNS + """ FROM """ + EXPENSE_ROWS + """ JOIN (""" + hits + \
+                    """) ON HIT = EXPENSES.ID"""
+            else:
+                # the hits can't be looked up by id through a union of the partitions, so every partition is joined
+                # to them on its own
+                rows = " UNION ALL ".join("""SELECT PARTITION_ROWS.*, HIT, SCORE FROM HITS
+                                             JOIN {}.EXPENSES AS PARTITION_ROWS ON PARTITION_ROWS.ID = HIT"""
+                                          .format(schema)
+                                          for schema in self._schemas(*self._years(start, end)))
+                sql = """WITH HITS AS (""" + hits + """) SELECT """ + ROW_COLUMNS + """ FROM (""" + rows + \
+                    """) AS """ + EXPENSE_ROWS
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            sql += order
+            params = [query] + category_ids + params
+        else:
+            patterns = ["%" + term.replace("_", "\\_") + "%" for term, prefix in terms]
+            note_match = " AND ".join("""NOTE LIKE ? ESCAPE '\\'""" for _ in patterns)
+            name_match = " AND ".join("""NAME LIKE ? ESCAPE '\\'""" for _ in patterns)
+            conditions.insert(0, "(({}) OR ({}))".format(note_match, name_match))
+            params = patterns + patterns + params
+            sql = """SELECT """ + ROW_COLUMNS + """ FROM """ + self._expense_rows(start, end) + """ WHERE """ + \
+                " AND ".join(conditions) + """ ORDER BY DAY DESC LIMIT ?"""
+        self.c.execute(sql, params + [limit])
+        return self.c.fetchall()
+
+    @cached
     def yearly_avg(self, year=datetime.date.today().year):
         """
         Will calculate the yearly average transaction amount,
@@ -465,9 +4069,11 @@ class User:
         :param year: accepts INT from 0-9999
         :return: returns average as a FLOAT
         """
-        raw_dat = parse_by_year(year, self.grab_data())
-        return find_average(raw_dat)
+        if self.columnar:
+            return find_average(parse_by_year(year, self.grab_columns()))
+        return _rollup_average(self.rollup_totals(year=year))
 
+    @cached
     def monthly_avg(self, month=datetime.date.today().month):
         """
         Will calculate the monthly average transaction amount,
@@ -476,9 +4082,11 @@ class User:
         :param month: accepts INT from 1-12
         :return: returns average as a FLOAT
         """
-        raw_dat = parse_by_month(month, self.grab_data())
-        return find_average(raw_dat)
+        if self.columnar:
+            return find_average(parse_by_month(month, self.grab_columns()))
+        return _rollup_average(self.rollup_totals(month=month))
 
+    @cached
     def category_avg(self, category, data=None):
         """
         Will calculate the category average transaction amount,
@@ -489,11 +4097,14 @@ class User:
         :return: returns average as a FLOAT
         """
         if data is None:
-            data = self.grab_data()
+            if not self.columnar:
+                return _rollup_average(self.rollup_totals(category=category))
+            data = self.grab_columns()
 
         raw_dat = parse_by_category(category, data)
         return find_average(raw_dat)
 
+    @cached
     def monthly_category_percentages(self, category, month=datetime.date.today().month):
         """
         analyzes categories for a given month (if no month is specified then the current month is used) and determines
@@ -503,25 +4114,20 @@ class User:
         :param month: Optional accepts month as INT between 1-12
         :return: returns a DICTIONARY where KEY:VALUE = Category as STR: Percentage as FLOAT
         """
-        raw_dat = None
-        category_list = []
-        for word in category:
-            category_list.append(word)
-        total_amount_spent = summing_it(parse_by_month(month, self.grab_data()))
+        if self.columnar:
+            totals = category_totals(parse_by_month(month, self.grab_columns()))
+        else:
+            totals = self.rollup_totals(month=month)
+        total_amount_spent = sum(figures[1] for figures in totals.values())
         averages = {}
-        for entry in category_list:
-            sql = """SELECT * FROM EXPENSES WHERE CATEGORY = '{}'""".format(entry)
-            try:
-                self.c.execute(sql)
-                raw_dat = parse_by_month(month, self.c.fetchall())
-            except sqlite3.OperationalError or ConnectionError:
-                print("ERROR, You broke something, please try again.")
-            cat_total = summing_it(raw_dat)
+        for entry in category:
+            cat_total = totals[entry][1] if entry in totals else 0
             avg = round((cat_total / total_amount_spent) * 100, 2)
             av_add = {entry: avg}
             averages.update(av_add)
         return averages
 
+    @cached
     def yearly_category_percentages(self, category, year=datetime.date.today().year):
         """
         analyzes categories for a given year (if no year is specified then the current year is used) and determines
@@ -531,25 +4137,91 @@ class User:
         :param year: Optional accepts month as INT between 0-9999
         :return: returns a DICTIONARY where KEY:VALUE = Category as STR: Percentage as FLOAT
         """
-        raw_dat = None
-        category_list = []
-        for word in category:
-            category_list.append(word)
-        total_amount_spent = summing_it(parse_by_year(year, self.grab_data()))
+        if self.columnar:
+            totals = category_totals(parse_by_year(year, self.grab_columns()))
+        else:
+            totals = self.rollup_totals(year=year)
+        total_amount_spent = sum(figures[1] for figures in totals.values())
         averages = {}
-        for entry in category_list:
-            sql = """SELECT * FROM EXPENSES WHERE CATEGORY = '{}'""".format(entry)
-            try:
-                self.c.execute(sql)
-                raw_dat = parse_by_year(year, self.c.fetchall())
-            except sqlite3.OperationalError or ConnectionError:
-                print("ERROR, You broke something, please try again.")
-            cat_total = summing_it(raw_dat)
+        for entry in category:
+            cat_total = totals[entry][1] if entry in totals else 0
             avg = round((cat_total / total_amount_spent) * 100, 2)
             av_add = {entry: avg}
             averages.update(av_add)
         return averages
 
+    @cached
+    def category_percentages(self, year=None, month=None):
+        """
+        determines the percentage of spending in every category relative to the total amount spent in a period
+
+        :param year: OPTIONAL accepts INT between 0-9999
+        :param month: OPTIONAL accepts INT between 1-12, matched in every year if no year is given
+        :return: returns a DICTIONARY where KEY:VALUE = Category as STR: Percentage as FLOAT
+        """
+        totals = self.rollup_totals(year=year, month=month)
+        total_amount_spent = sum(figures[1] for figures in totals.values())
+        return {entry: round((totals[entry][1] / total_amount_spent) * 100, 2) for entry in sorted(totals)}
+
+    @cached
+    def period_statistics(self, year=None, month=None, category=None):
+        """
+        computes the spending statistics of every category of a period in one pass over a cursor stream
+
+        :param year: OPTIONAL accepts INT between 0-9999, every expense if no year is given
+        :param month: OPTIONAL accepts INT between 1-12, needs a year
+        :param category: OPTIONAL accepts STR
+        :return: returns a DICTIONARY of CATEGORY as STR: StreamingStats
+        """
+        if year is None:
+            if month is not None:
+                raise ValueError("a month needs a year")
+            return category_statistics(self.iter_data(category))
+        start, end = month_bounds(month, year) if month is not None else year_bounds(year)
+        return category_statistics(self.iter_data(category, start, end))
+
+    def parallel_statistics(self, year=None, month=None):
+        """
+        computes the same statistics as period_statistics with one query per category. On a concurrent user the
+        queries run at the same time on the threads of its ConnectionManager, each over its own read-only
+        connection, and expenses can be logged meanwhile. Otherwise they run one after the other.
+
+        :param year: OPTIONAL accepts INT between 0-9999, every expense if no year is given
+        :param month: OPTIONAL accepts INT between 1-12, needs a year
+        :return: returns a DICTIONARY of CATEGORY as STR: StreamingStats
+        """
+        if year is None and month is not None:
+            raise ValueError("a month needs a year")
+
+        def category_statistics_of(category):
+            return self.period_statistics(year, month, category)
+
+        categories = self.grab_categories()
+        if self.connections is None:
+            results = [category_statistics_of(category) for category in categories]
+        else:
+            results = self.connections.map(category_statistics_of, categories)
+        statistics = {}
+        for result in results:
+            statistics.update(result)
+        return statistics
+
+    @cached
+    def monthly_report_data(self, month=datetime.date.today().month, year=datetime.date.today().year):
+        """
+        Computes all the figures of the monthly report from the monthly rollups of the year.
+
+        :param month: accepts INT between 1-12
+        :param year: accepts INT between 0-9999
+        :return: returns a MonthlyReport
+        """
+        if self.columnar:
+            return build_monthly_report(month, year, self.grab_columns().where_year(year).grouped_totals())
+        self.c.execute("""SELECT NAME, MONTH, COUNT, TOTAL / 100.0 FROM """ +
+                       self._source("ROLLUP_MONTHLY", year, year) +
+                       """ JOIN CATEGORIES ON CATEGORIES.ID = CATEGORY_ID WHERE YEAR = ?""", (year,))
+        return build_monthly_report(month, year, self.c.fetchall())
+
     def monthly_report(self, month=datetime.date.today().month, year=datetime.date.today().year):
         """
         Prints out data about a month (uses current month if month is unspecified) including:
@@ -572,103 +4244,398 @@ class User:
         :param month: accepts INT between 1-12
         :return: returns STDOUT to console
         """
-        month_data = parse_by_month(month, self.grab_data())
-        year_data = parse_by_year(year, self.grab_data())
-        total_spent = 0
-        for entry in month_data:
-            total_spent += entry[0]
-        print()
-        print("The total amount spent this month is: $" + str(round(total_spent, 2)))
-        print()
-        time.sleep(1)
+        with PROFILER.stage("aggregate"):
+            report = self.monthly_report_data(month, year)
+        with PROFILER.stage("print"):
+            print()
+            print("The total amount spent this month is: $" + str(report.total))
+            print()
+            pause(1)
 
-        month_avg = user.monthly_avg(month)
-        print("Your average transaction amount for this month is: $" + str(month_avg))
-        print()
-        time.sleep(1)
+            month_avg = report.average
+            print("Your average transaction amount for this month is: $" + str(month_avg))
+            print()
+            pause(1)
 
-        year_avg = user.yearly_avg()
-        print("Your average transaction amount for the year is ${}".format(year_avg))
-        print()
-        time.sleep(1)
+            year_avg = report.year_average
+            print("Your average transaction amount for the year is ${}".format(year_avg))
+            print()
+            pause(1)
+
+            if month_avg > year_avg:
+                diff = round(month_avg - year_avg, 2)
+                print("Your average monthly transaction of ${} is ${} above your yearly average of ${}"
+                      .format(month_avg, diff, year_avg))
+                print()
+            elif month_avg < year_avg:
+                diff = round(year_avg - month_avg, 2)
+                print("Your average monthly transaction of ${} is ${} below your yearly average of ${}"
+                      .format(month_avg, diff, year_avg))
+                print()
+            pause(1)
+
+            print("Total transactions for the month in each category:")
+            for entry in report.categories:
+                print(entry + ": " + str(report.categories[entry].count))
+            pause(1)
 
-        if month_avg > year_avg:
-            diff = round(month_avg - year_avg, 2)
-            print("Your average monthly transaction of ${} is ${} above your yearly average of ${}"
-                  .format(month_avg, diff, year_avg))
             print()
-        elif month_avg < year_avg:
-            diff = round(year_avg - month_avg, 2)
-            print("Your average monthly transaction of ${} is ${} below your yearly average of ${}"
-                  .format(month_avg, diff, year_avg))
+            print("Total amount spent for the month by category:")
+            for entry in report.categories:
+                print(entry + ": $" + str(report.categories[entry].total))
+            pause(1)
+
             print()
-        time.sleep(1)
+            print("Monthly spending as a percentage of each category: ")
+            for entry in report.categories:
+                print(entry + ": " + str(report.categories[entry].percentage) + "%")
+            pause(1)
 
-        cat_dict = category_breakdown(month_data)
-        print("Total transactions for the month in each category:")
-        for entry in cat_dict:
-            print(entry + ": " + str(cat_dict[entry]))
-        time.sleep(1)
+            print()
+            print("Average monthly transaction amount per category: ")
+            month_compare = []
+            for entry in report.categories:
+                cat_avg = report.categories[entry].month_average
+                print("{}: ${}".format(entry, cat_avg))
+                month_compare.append([entry, cat_avg])
+            pause(1)
 
-        print()
-        print("Total amount spent for the month by category:")
-        for entry in cat_dict:
-            dat1 = self.grab_data(entry)
-            list_cat1 = parse_by_month(month, dat1)
-            cat_sum = summing_it(list_cat1)
-            print(entry + ": $" + str(cat_sum))
-        time.sleep(1)
+            print()
+            print("Average yearly transaction amount per category: ")
+            year_compare = []
+            for entry in report.categories:
+                cat_avg = report.categories[entry].year_average
+                print("{}: ${}".format(entry, cat_avg))
+                year_compare.append([entry, cat_avg])
+            pause(1)
 
-        print()
-        print("Monthly spending as a percentage of each category: ")
-        check = self.monthly_category_percentages(cat_dict, month)
-        for entry in check:
-            print(entry + ": " + str(check[entry]) + "%")
-        time.sleep(1)
+            print()
+            diff_data = compare_month_year_diff_averages(month_compare, year_compare)
+            for entry in diff_data:
+                print("Your average monthly transaction for {} is ${} {} your yearly average"
+                      .format(entry[0], entry[1], entry[2]))
+                pause(1)
+
+        with PROFILER.stage("statistics"):
+            statistics = self.period_statistics(year, month)
+        with PROFILER.stage("print"):
+            print()
+            print("Spending statistics per category for the month: ")
+            overall = StreamingStats()
+            for entry in statistics:
+                overall.merge(statistics[entry])
+                print("{}: median ${median}, 90th percentile ${p90}, 99th percentile ${p99}, smallest ${min}, "
+                      "largest ${max}, standard deviation ${std}".format(entry, **statistics[entry].summary()))
+            pause(1)
 
-        print()
-        print("Average monthly transaction amount per category: ")
-        month_compare = []
-        for entry in cat_dict:
-            cat_avg = self.category_avg(entry, month_data)
-            print("{}: ${}".format(entry, cat_avg))
-            month_compare.append([entry, cat_avg])
-        time.sleep(1)
+            print()
+            print("Number of transactions for the month by amount: ")
+            for bucket, count in overall.summary()["histogram"].items():
+                print("${}: {}".format(bucket, count))
+            pause(1)
 
-        print()
-        print("Average yearly transaction amount per category: ")
-        year_compare = []
-        for entry in cat_dict:
-            cat_avg = self.category_avg(entry, year_data)
-            print("{}: ${}".format(entry, cat_avg))
-            year_compare.append([entry, cat_avg])
-        time.sleep(1)
+    def near_duplicates(self, days=NEAR_DUPLICATE_DAYS, category=None):
+        """
+        finds the expenses which could have been logged more than once, those with the same amount at most days apart
+        whatever their category and note, in one pass over the expenses sorted by amount and date, see
+        near_duplicate_groups
 
-        print()
-        diff_data = compare_month_year_diff_averages(month_compare, year_compare)
-        for entry in diff_data:
-            print("Your average monthly transaction for {} is ${} {} your yearly average"
-                  .format(entry[0], entry[1], entry[2]))
-            time.sleep(1)
+        :param days: OPTIONAL largest gap in days between neighbours of a group in INT
+        :param category: OPTIONAL accepts STR, only the expenses of this category are looked at
+        :return: returns a LIST of groups, each a LIST of TUPLES (ID, AMOUNT, CATEGORY, NOTE, DATE) in date order
+        """
+        sql = """SELECT CENTS, DAY, EXPENSES.ID, """ + ROW_COLUMNS + """ FROM """ + EXPENSE_ROWS
+        params = []
+        if category:
+            sql += """ WHERE """ + CATEGORY_CONDITION
+            params.append(category)
+        sql += """ ORDER BY CENTS, DAY, EXPENSES.ID"""
+        cursor = self.c.connection.cursor()
+        try:
+            cursor.execute(sql, params)
+
+            def rows():
+                while True:
+                    chunk = cursor.fetchmany(FETCH_SIZE)
+                    if not chunk:
+                        return
+                    yield from chunk
 
+            return [[entry[2:] for entry in group] for group in near_duplicate_groups(rows(), days)]
+        finally:
+            cursor.close()
+
+    @serialized
+    def delete_expenses(self, ids):
+        """
+        deletes expenses by id in one transaction
+
+        :param ids: accepts iterable of expense ids as INT
+        :return: returns the number of expenses deleted in INT, expenses of archived partitions can't be deleted and
+                are left alone
+        """
+        ids = sorted(set(ids))
+        deleted = 0
+        try:
+            begin_write(self.c)
+            self.c.execute("""SELECT 1 FROM main.sqlite_master WHERE name = 'EXPENSES_FTS'""")
+            search_index = self.c.fetchone() is not None
+            for schema in self._schemas():
+                if schema != "main" and int(schema[1:]) in self.archived:
+                    continue
+                for first in range(0, len(ids), 500):
+                    chunk = ids[first:first + 500]
+                    condition = """ID IN ({})""".format(", ".join("?" * len(chunk)))
+                    if schema != "main" and search_index:
+                        # the triggers of a partition can't reach the search index in the main database
+                        self.c.execute("""INSERT INTO EXPENSES_FTS (EXPENSES_FTS, rowid, NOTE)
+                                          SELECT 'delete', ID, NOTE FROM {}.EXPENSES WHERE {}"""
+                                       .format(schema, condition), chunk)
+                    self.c.execute("""DELETE FROM {}.EXPENSES WHERE {}""".format(schema, condition), chunk)
+                    deleted += self.c.rowcount
+            if self.partitions is not None and deleted:
+                self.c.execute("""UPDATE main.DATA_VERSION SET VERSION = VERSION + 1""")
+            self.user_db.commit()
+        except sqlite3.Error:
+            self.user_db.rollback()
+            raise
+        if deleted:
+            # rebuilt on next use, a snapshot notices the deleted rows and is rewritten
+            self._columns = None
+            self._date_index = None
+        return deleted
+
+    def remove_duplicates(self):
+        """
+        deletes every expense which repeats an earlier one exactly, the same day, amount, category and
+        normalize_note note, keeping the one logged first
+
+        :return: returns the number of expenses deleted in INT
+        """
+        repeated = []
+        for group in self.near_duplicates(0):
+            first = set()
+            for expense_id, amount, category, note, date in sorted(group):
+                key = (category, normalize_note(note))
+                if key in first:
+                    repeated.append(expense_id)
+                first.add(key)
+        return self.delete_expenses(repeated)
+
+    @serialized
     def fix_wrong_category(self, category_to_fix, new_category):
         """
-        function which updates a category based on user choice
+        function which updates a category based on user choice. Renaming changes the one row of the category table,
+        the expenses are only updated when the category is merged into one which already exists, and the budgets the
+        merge pushes this year's spending past are left in budget_alerts. A merge also combines the anomaly norms of
+        the two categories.
 
         :param category_to_fix:
         :param new_category:
-        :return:
+        :return: returns True if the change was committed to the database, False otherwise
         """
-        sql = """UPDATE EXPENSES SET CATEGORY = '{}' WHERE CATEGORY = '{}'"""\
-            .format(new_category.capitalize(), category_to_fix)
+        self.budget_alerts = []
         try:
-            self.c.execute(sql)
+            begin_write(self.c)
+            self.c.execute("""SELECT NAME, ID FROM CATEGORIES WHERE NAME IN (?, ?)""",
+                           (category_to_fix, new_category.capitalize()))
+            category_ids = dict(self.c.fetchall())
+            old_id = category_ids.get(category_to_fix)
+            new_id = category_ids.get(new_category.capitalize())
+            if old_id is not None and new_id is None:
+                self.c.execute("""UPDATE CATEGORIES SET NAME = ? WHERE ID = ?""", (new_category.capitalize(), old_id))
+            elif old_id is not None and new_id != old_id:
+                # the spending moved to the new category this year, for its budget check
+                year = datetime.date.today().year
+                self.c.execute("""SELECT MONTH, TOTAL FROM """ + self._source("ROLLUP_MONTHLY", year, year) +
+                               """ WHERE YEAR = ? AND CATEGORY_ID = ?""", (year, old_id))
+                added = {(new_id, year, month): total for month, total in self.c.fetchall()}
+                for schema in self._schemas():
+                    if schema != "main" and int(schema[1:]) in self.archived:
+                        # an archived partition is read-only, merging fails only if it holds the category
+                        self.c.execute("""SELECT EXISTS (SELECT 1 FROM {}.EXPENSES WHERE CATEGORY_ID = ?)"""
+                                       .format(schema), (old_id,))
+                        if not self.c.fetchone()[0]:
+                            continue
+                    self.c.execute("""UPDATE {}.EXPENSES SET CATEGORY_ID = ? WHERE CATEGORY_ID = ?""".format(schema),
+                                   (new_id, old_id))
+                # the merged category keeps its own budgets, the other budgets of the old category move to it
+                self.c.execute("""UPDATE OR IGNORE BUDGETS SET CATEGORY_ID = ? WHERE CATEGORY_ID = ?""",
+                               (new_id, old_id))
+                self.c.execute("""DELETE FROM BUDGETS WHERE CATEGORY_ID = ?""", (old_id,))
+                norms = self._read_norms([old_id, new_id])
+                if old_id in norms:
+                    norm = norms.get(new_id, SpendingNorm())
+                    norm.merge(norms[old_id])
+                    self.c.execute("""INSERT OR REPLACE INTO ANOMALY_STATE VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                                   (new_id,) + norm.row())
+                    self.c.execute("""DELETE FROM ANOMALY_STATE WHERE CATEGORY_ID = ?""", (old_id,))
+                self.c.execute("""DELETE FROM CATEGORIES WHERE ID = ?""", (old_id,))
+                self.budget_alerts = self._budget_changes(added)
+                invalidate_snapshot(snapshot_path(self.path))
             self.user_db.commit()
+        except sqlite3.Error:
+            self.user_db.rollback()
+            if self.interactive:
+                print("ERROR, You broke something, please try again.")
+            return False
+        if self.snapshot:
+            self._columns = None
+        elif self._columns is not None:
+            self._columns.rename_category(category_to_fix, new_category.capitalize())
+        self._date_index = None
+        if self.interactive:
             print("Success!")
-            time.sleep(.5)
+            print_budget_alerts(self.budget_alerts)
+            pause(.5)
             print()
-        except sqlite3.OperationalError:
-            print("ERROR, You broke something, please try again.")
+        return True
+
+
+# tells the WriteBehindQueue thread to commit what it holds and stop
+_CLOSE_QUEUE = object()
+
+
+class WriteBehindQueue:
+    """
+    Write-behind logging of expenses. put() only queues an expense, a background thread with its own connection
+    drains the queue and inserts every expense it finds in one transaction, so a high rate of logging costs one
+    commit per group instead of one fsync per expense. A group is committed once it holds max_batch expenses or
+    max_delay seconds after its first expense was taken, whichever comes first.
+
+    An expense is durable once flush() returns after it was queued. close() commits everything queued and stops the
+    thread, it is also run at interpreter exit so a normal shutdown loses nothing. Expenses of a group which failed
+    to commit are kept in failed and the error is raised by the next flush() or close().
+    """
+
+    def __init__(self, path, max_batch=500, max_delay=0.005, duplicates="flag"):
+        """
+        :param path: user name or path of the database in STR, see database_path
+        :param max_batch: OPTIONAL most expenses per transaction in INT
+        :param max_delay: OPTIONAL most seconds an expense waits for others to share its commit in FLOAT
+        :param duplicates: OPTIONAL one of DUPLICATE_POLICIES in STR, applied to every group committed
+        """
+        self.path = path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.duplicate_policy = duplicates
+        # number of expenses and transactions committed
+        self.committed = 0
+        self.commits = 0
+        self.failed = []
+        # LIST of Duplicate found in the groups committed, index being the position in the group
+        self.duplicates = []
+        # LIST of Anomaly found in the groups committed
+        self.anomalies = []
+        self.closed = False
+        self._error = None
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="write-behind " + str(path), daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        atexit.register(self.close)
+
+    def _run(self):
+        """
+        body of the background thread, opens the connection and commits groups until closed
+        """
+        writer = User(self.path, interactive=False, duplicates=self.duplicate_policy)
+        if not writer.started:
+            self._error = sqlite3.OperationalError("could not open the database")
+            self._ready.set()
+            return
+        self._ready.set()
+        stop = False
+        while not stop:
+            batch = []
+            flushed = []
+            item = self._queue.get()
+            deadline = time.perf_counter() + self.max_delay
+            while True:
+                if item is _CLOSE_QUEUE:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    # flush() is waiting, commits right away
+                    flushed.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    writer._insert_expenses(batch)
+                    self.committed += len(batch) - sum(duplicate.rejected for duplicate in writer.duplicates)
+                    self.commits += 1
+                    self.duplicates.extend(writer.duplicates)
+                    self.anomalies.extend(writer.anomalies)
+                except Exception as e:
+                    # the thread keeps going, so flush() never waits on a thread which died
+                    self.failed.extend(batch)
+                    self._error = e
+            for event in flushed:
+                event.set()
+        writer.user_db.close()
+
+    def put(self, amount, category, note="", date=None):
+        """
+        queues an expense, it is committed by the background thread
+
+        :param amount: Dollar amount in INT/FLOAT
+        :param category: Expense category in STR
+        :param note: Optional message in STR
+        :param date: OPTIONAL accepts DATE object or STR in YYYY-MM-DD format, defaults to today
+        :return: returns nothing, raises ValueError if the amount or date can't be stored or the queue is closed
+        """
+        if self.closed:
+            raise ValueError("the write-behind queue is closed")
+        date = date or datetime.date.today()
+        # a bad value fails here rather than failing the whole group it is committed with
+        to_cents(amount)
+        day_ordinal(date)
+        self._queue.put((amount, category, note, date))
+
+    def flush(self):
+        """
+        waits until every expense queued before the call is committed
+
+        :return: returns nothing, raises the error of a group which failed to commit since the last flush
+        """
+        if not self.closed:
+            event = threading.Event()
+            self._queue.put(event)
+            event.wait()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        """
+        commits every queued expense and stops the background thread, closing twice does nothing
+
+        :return: returns nothing, raises like flush
+        """
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_CLOSE_QUEUE)
+        self._thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def menu_function1():
@@ -722,8 +4689,7 @@ def menu_function5():
 
 def menu_function6():
     chosen_category = category_display_and_choice()
-    display_data = user.grab_data(chosen_category)
-    final_data_display(display_data)
+    final_data_display(user.stream(chosen_category))
 
 
 def menu_function7():
@@ -784,21 +4750,23 @@ def menu_function8():
             print("Please select an appropriate value.")
     if user_choice.lower() == "y":
         year = user_input_year()
-        data1 = category_breakdown(parse_by_year(year, user.grab_data()))
+        start, end = year_bounds(year)
+        data1 = user.stream(start=start, end=end).breakdown()
         display_data = user.yearly_category_percentages(data1, year)
         print()
         for entry in display_data:
             print("{}: {}%".format(entry, display_data[entry]))
-            time.sleep(.5)
+            pause(.5)
     elif user_choice.lower() == "m":
         month = user_input_month()
         year = user_input_year()
-        data1 = category_breakdown(parse_by_month(month, parse_by_year(year, user.grab_data())))
+        start, end = month_bounds(month, year)
+        data1 = user.stream(start=start, end=end).breakdown()
         display_data = user.monthly_category_percentages(data1, month)
         print()
         for entry in display_data:
             print("{}: {}%".format(entry, display_data[entry]))
-            time.sleep(.5)
+            pause(.5)
 
 
 def menu_function9():
@@ -812,7 +4780,7 @@ def menu_function9():
     for entry in categories:
         print(str(counter) + ". {}".format(entry))
         counter += 1
-    time.sleep(1)
+    pause(1)
 
 
 def menu_function10():
@@ -827,11 +4795,757 @@ def menu_function10():
     user.fix_wrong_category(category_to_fix, category_fix)
 
 
+def menu_function12():
+    """
+    menu function which imports expenses in bulk from a CSV or similar file
+
+    :return: returns nothing, displays the import summary with print via STDOUT
+    """
+    path = input("Please enter the path of the file to import: ")
+    if not os.path.exists(path):
+        print("I'm sorry Dave, I can't find that file.")
+        pause(1)
+        return
+    result = user.bulk_import(path)
+    print_import_result(result, path + ".rejects.csv")
+    pause(1)
+
+
+def menu_function13():
+    """
+    menu function which searches the notes and categories of the expenses
+
+    :return: returns nothing, displays the matches with print via STDOUT
+    """
+    print('Words ending in * match the start of a word, e.g. dent*, and "quoted words" match a phrase.')
+    text = input("Please enter what to search for: ")
+    start = input("Only search from the date [YYYY-MM-DD, leave empty for no limit]: ") or None
+    end = input("Only search until the date [YYYY-MM-DD, leave empty for no limit]: ") or None
+    try:
+        results = user.search(text, start, end)
+    except ValueError:
+        print("I'm sorry Dave, I can't search for that.")
+        pause(1)
+        return
+    if len(results) == 0:
+        print()
+        print("I'm sorry Dave, There doesn't appear to be any entries matching your search.")
+        pause(.5)
+    final_data_display(results)
+
+
+def menu_function14():
+    """
+    menu function which shows the expenses, total and average of a range of dates, of the last number of days or of
+    a fiscal year or quarter
+
+    :return: returns nothing, displays data with print via STDOUT
+    """
+    print("1. A range of dates")
+    print("2. The last number of days")
+    print("3. A fiscal year or quarter")
+    while True:
+        choice = input("Please select an option [1, 2, 3]: ")
+        if choice in ("1", "2", "3"):
+            break
+        print("Please select an appropriate value.")
+    if choice == "1":
+        print("The first day of the range:")
+        year = user_input_year(1)
+        month = user_input_month()
+        start = datetime.date(year, month, user_input_day(month, year))
+        print("The last day of the range:")
+        year = user_input_year(1)
+        month = user_input_month()
+        end = datetime.date(year, month, user_input_day(month, year))
+    elif choice == "2":
+        while True:
+            try:
+                days = int(input("Please choose a number of days: "))
+                if days > 0:
+                    break
+                print("Please select an appropriate value.")
+            except ValueError:
+                print("Please select an appropriate value.")
+        start, end = last_days_bounds(days)
+    else:
+        year = user_input_year(1)
+        while True:
+            quarter = input("Please choose a quarter [1-4, leave empty for the whole year]: ")
+            if quarter in ("", "1", "2", "3", "4"):
+                break
+            print("Please select an appropriate value.")
+        if quarter:
+            start, end = fiscal_quarter_bounds(int(quarter), year)
+        else:
+            start, end = fiscal_year_bounds(year)
+
+    index = user.date_index()
+    count = index.count(start, end)
+    if count == 0:
+        print()
+        print("I'm sorry Dave, There doesn't appear to be any entries for the chosen date range.")
+        pause(.5)
+        return
+    final_data_display(index.between(start, end))
+    print("From {} to {} you had {} expenses totaling ${} with an average of ${}"
+          .format(start, end, count, index.total(start, end), index.average(start, end)))
+    pause(1)
+
+
+def describe_change(change):
+    """
+    :param change: accepts a percentage in FLOAT, or None
+    :return: returns the change in words in STR
+    """
+    if change is None:
+        return "nothing spent to compare against"
+    if change > 0:
+        return "up {}%".format(change)
+    if change < 0:
+        return "down {}%".format(-change)
+    return "unchanged"
+
+
+def menu_function15():
+    """
+    menu function which shows the month over month and year over year changes of a year, the spending of every
+    category in its last month and the moving totals and averages up to its last day
+
+    :return: returns nothing, displays data with print via STDOUT
+    """
+    year = user_input_year()
+    changes = user.monthly_changes(year)
+    if len(changes) == 0:
+        print()
+        print("I'm sorry Dave, There doesn't appear to be any entries for the chosen year.")
+        pause(.5)
+        return
+    print()
+    print("Spending by month, against the month before and the same month a year before:")
+    spent = 0
+    for change in changes:
+        if change.category == "":
+            spent += change.total
+            print("{}: ${}, {} from the month before, {} from a year before, ${} so far this year"
+                  .format(calendar.month_name[change.month], change.total, describe_change(change.month_change),
+                          describe_change(change.year_change), round(spent, 2)))
+    pause(1)
+
+    last_month = max(change.month for change in changes)
+    print()
+    print("Spending by category in {}:".format(calendar.month_name[last_month]))
+    for change in changes:
+        if change.category and change.month == last_month:
+            print("{}: ${}, {} from the month before, {} from a year before"
+                  .format(change.category, change.total, describe_change(change.month_change),
+                          describe_change(change.year_change)))
+    pause(1)
+
+    end = min(datetime.date.today(), datetime.date(year, 12, 31))
+    trends = user.trends(end, end)
+    print()
+    print("Moving totals up to {}:".format(end))
+    for window, series in trends["moving"].items():
+        point = series[-1]
+        print("The last {} days: ${} over {} expenses, ${} a day and ${} an expense on average"
+              .format(window, point.total, point.count, point.daily_average, point.average))
+    pause(1)
+
+
+def menu_function16():
+    """
+    menu function which sets or removes the budget of a category and shows every category against its budgets
+
+    :return: returns nothing, displays the budgets with print via STDOUT
+    """
+    category = input("Please enter the category to budget for [leave empty to only view the budgets]: ")
+    if category:
+        period = ""
+        while period not in ("month", "year"):
+            period = input("Is this a monthly or a yearly budget? [month/year]: ").lower()
+        while True:
+            amount = input("Please enter the amount [leave empty to remove the budget]: ")
+            try:
+                amount = round(float(amount), 2) if amount else None
+                break
+            except ValueError:
+                print("Hey!, That's not a Number!")
+        try:
+            user.set_budget(category, amount, period)
+        except sqlite3.Error:
+            print("ERROR, You broke something, please try again.")
+            pause(1.5)
+            return
+        print("Success!")
+    print()
+    today = datetime.date.today()
+    print("Budgets for {} {}:".format(calendar.month_name[today.month], today.year))
+    for status in user.budget_status():
+        if status.budget is None:
+            print("{}: ${} spent this month, no budget".format(status.category, status.spent))
+        else:
+            print("{}: ${} of ${} spent this {} ({}%), ${} left"
+                  .format(status.category, status.spent, status.budget, status.period, status.percentage,
+                          status.remaining))
+    pause(1)
+
+
+def menu_function17():
+    """
+    menu function which lists the expenses which may have been logged more than once and removes the exact repeats
+
+    :return: returns nothing, displays the possible duplicates with print via STDOUT
+    """
+    while True:
+        days = input("How many days apart can a repeated expense be? [leave empty for {}]: "
+                     .format(NEAR_DUPLICATE_DAYS))
+        try:
+            days = int(days) if days else NEAR_DUPLICATE_DAYS
+            if days >= 0:
+                break
+        except ValueError:
+            pass
+        print("Hey!, That's not a Number!")
+    groups = user.near_duplicates(days)
+    if len(groups) == 0:
+        print()
+        print("Nothing looks like it was logged twice.")
+        pause(.5)
+        return
+    for number, group in enumerate(groups, 1):
+        print()
+        print("Possible duplicates {}:".format(number))
+        for expense_id, amount, category, note, date in group:
+            print("${} for {} on {}{}".format(amount, category, date, " ({})".format(note) if note else ""))
+    pause(1)
+    print()
+    if input("Remove the exact repeats, keeping the first of each? [y/n]: ").lower().startswith("y"):
+        print("Removed {} expenses.".format(user.remove_duplicates()))
+        pause(.5)
+
+
+def describe_budget(status):
+    """
+    :param status: accepts a BudgetStatus with a budget
+    :return: returns the name of the budget in words in STR, e.g. "March 2021 Food budget"
+    """
+    if status.month is None:
+        return "{} {} budget".format(status.year, status.category)
+    return "{} {} {} budget".format(calendar.month_name[status.month], status.year, status.category)
+
+
+def print_budget_alerts(statuses):
+    """
+    function for displaying what is left of the budgets a write touched and the thresholds it went past
+
+    :param statuses: accepts a LIST of BudgetStatus
+    :return: returns nothing, displays via print
+    """
+    for status in statuses:
+        if status.crossed and status.crossed[-1] >= 100:
+            print("Heads up, you are ${} over your ${} {}.".format(round(-status.remaining, 2), status.budget,
+                                                                  describe_budget(status)))
+        elif status.crossed:
+            print("Heads up, you have used {}% of your ${} {}.".format(status.crossed[-1], status.budget,
+                                                                      describe_budget(status)))
+        if status.remaining >= 0:
+            print("You have ${} left of your {}.".format(round(status.remaining, 2), describe_budget(status)))
+
+
+def describe_anomaly(anomaly):
+    """
+    :param anomaly: accepts an Anomaly
+    :return: returns the anomaly as a sentence in STR
+    """
+    if anomaly.kind == "amount":
+        return "${} is a lot for {}, it usually costs about ${}".format(anomaly.amount, anomaly.category,
+                                                                        anomaly.expected)
+    return "${} on {} in the week of {} is {} times a usual week of ${}".format(
+        anomaly.amount, anomaly.category, anomaly.date, anomaly.score, anomaly.expected)
+
+
+def print_anomalies(anomalies):
+    """
+    function for displaying the unusual expenses and weeks of a write
+
+    :param anomalies: accepts a LIST of Anomaly
+    :return: returns nothing, displays via print
+    """
+    for anomaly in anomalies:
+        print("Heads up, {}.".format(describe_anomaly(anomaly)))
+
+
+def print_duplicates(duplicates):
+    """
+    function for displaying the expenses of a write which were already logged
+
+    :param duplicates: accepts a LIST of Duplicate
+    :return: returns nothing, displays via print
+    """
+    for duplicate in duplicates:
+        print("Heads up, you already logged ${} for {} on {}{}{}".format(
+            duplicate.amount, duplicate.category, duplicate.date,
+            " ({})".format(duplicate.note) if duplicate.note else "",
+            ", so it wasn't saved again." if duplicate.rejected else "."))
+
+
+def print_import_result(result, reject_path):
+    """
+    function for displaying the summary of a bulk import
+
+    :param result: accepts an ImportResult
+    :param reject_path: path of the reject file in STR
+    :return: returns nothing, displays via print
+    """
+    print("Imported {} expenses in {} seconds ({} rows/second)."
+          .format(result.imported, result.seconds, result.rows_per_second))
+    if result.duplicates:
+        print("{} rows were already logged.".format(result.duplicates))
+    if result.rejected:
+        print("{} rows were rejected, see {}".format(result.rejected, reject_path))
+
+
+# columns written by the command line for expenses, report categories and category statistics
+EXPENSE_COLUMNS = ["amount", "category", "note", "date"]
+REPORT_COLUMNS = ["category", "count", "total", "percentage", "month_average", "year_average"]
+STATISTICS_COLUMNS = ["category", "count", "total", "mean", "std", "min", "max", "median", "p90", "p99"]
+
+
+def write_records(records, columns, output_format, file=None):
+    """
+    writes records for the command line one at a time, so large results are never held in memory
+
+    :param records: accepts iterable of DICTIONARIES keyed by columns
+    :param columns: accepts LIST of column names in STR
+    :param output_format: "json" or "csv" in STR
+    :param file: OPTIONAL file object, defaults to STDOUT
+    :return: returns nothing
+    """
+    file = file or sys.stdout
+    if output_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=columns, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(records)
+        return
+    file.write("[")
+    separator = "\n"
+    for record in records:
+        file.write(separator + json.dumps(record))
+        separator = ",\n"
+    file.write("\n]\n")
+
+
+def expense_records(data):
+    """
+    :param data: accepts multi-dimensional iterable data type of database dumps
+    :return: yields a DICTIONARY keyed by EXPENSE_COLUMNS for every entry
+    """
+    for entry in data:
+        yield dict(zip(EXPENSE_COLUMNS, entry))
+
+
+def report_as_dict(report):
+    """
+    :param report: accepts a MonthlyReport
+    :return: returns the report as a DICTIONARY which can be written as JSON
+    """
+    result = report._asdict()
+    result["categories"] = {entry: figures._asdict() for entry, figures in report.categories.items()}
+    return result
+
+
+def report_records(report):
+    """
+    :param report: accepts a MonthlyReport
+    :return: yields a DICTIONARY keyed by REPORT_COLUMNS for the whole month followed by one for every category
+    """
+    yield dict(category="", count=report.count, total=report.total, percentage=100.0 if report.count else 0.0,
+               month_average=report.average, year_average=report.year_average)
+    for entry, figures in report.categories.items():
+        record = figures._asdict()
+        record["category"] = entry
+        yield record
+
+
+def statistics_records(statistics, output_format):
+    """
+    :param statistics: accepts DICTIONARY of CATEGORY as STR: StreamingStats
+    :param output_format: "json" or "csv" in STR, the histogram is nested in JSON and one column per bucket in CSV
+    :return: yields a DICTIONARY keyed by STATISTICS_COLUMNS and histogram for every category
+    """
+    for entry in statistics:
+        record = dict(category=entry, **statistics[entry].summary())
+        if output_format == "csv":
+            record.update(record.pop("histogram"))
+        yield record
+
+
+def build_parser():
+    """
+    :return: returns the argparse parser of the non-interactive command line
+    """
+    parser = argparse.ArgumentParser(prog="Assignment1.py", description="Expense tracker. Run without arguments "
+                                                                        "for the interactive menu.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("user", help="user name, or the path of a .db file")
+    common.add_argument("--format", choices=["json", "csv"], default="json", help="output format")
+    common.add_argument("--duplicates", choices=DUPLICATE_POLICIES, default="flag",
+                        help="what happens to an expense which was already logged: saved anyway, saved with a warning "
+                             "(the default) or not saved")
+    common.add_argument("--cache", action="store_true",
+                        help="keep the analytics results in a cache file next to the database between runs")
+    common.add_argument("--profile", nargs="?", const="-", metavar="PATH",
+                        help="profile the queries and analytics of the command, written as JSON to PATH or as a "
+                             "summary to STDERR")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = commands.add_parser("add", parents=[common], help="log an expense")
+    add_parser.add_argument("amount", help="dollar amount")
+    add_parser.add_argument("category", help="expense category")
+    add_parser.add_argument("--note", default="", help="optional note")
+    add_parser.add_argument("--date", help="YYYY-MM-DD, defaults to today")
+
+    import_parser = commands.add_parser("import", parents=[common],
+                                        help="import expenses in bulk from a CSV or similar file")
+    import_parser.add_argument("path", help="file to import")
+    import_parser.add_argument("--batch-size", type=int, default=1000, help="rows per transaction")
+    import_parser.add_argument("--rejects", help="file malformed rows are written to")
+    import_parser.add_argument("--delimiter", help="field separator, guessed from the file if not given")
+
+    view_parser = commands.add_parser("view", parents=[common], help="list expenses")
+    view_parser.add_argument("--year", type=int, help="year [0-9999]")
+    view_parser.add_argument("--month", type=int, choices=range(1, 13), metavar="[1-12]", help="month, needs --year")
+    view_parser.add_argument("--week", type=int, choices=range(1, 6), metavar="[1-5]",
+                             help="week of the month, needs --month")
+    view_parser.add_argument("--from", dest="start", help="first day YYYY-MM-DD")
+    view_parser.add_argument("--to", dest="end", help="last day YYYY-MM-DD")
+    view_parser.add_argument("--category", help="only this category")
+
+    report_parser = commands.add_parser("report", parents=[common], help="monthly report")
+    report_parser.add_argument("--year", type=int, default=datetime.date.today().year, help="defaults to this year")
+    report_parser.add_argument("--month", type=int, choices=range(1, 13), metavar="[1-12]",
+                               default=datetime.date.today().month, help="defaults to this month")
+
+    percentages_parser = commands.add_parser("percentages", parents=[common],
+                                             help="spending percentage of every category")
+    percentages_parser.add_argument("--year", type=int, default=datetime.date.today().year,
+                                    help="defaults to this year")
+    percentages_parser.add_argument("--month", type=int, choices=range(1, 13), metavar="[1-12]",
+                                    help="only this month of the year")
+
+    search_parser = commands.add_parser("search", parents=[common], help="search the notes and categories")
+    search_parser.add_argument("text", help='words to find, dent* matches the start of a word and "root canal" a '
+                                            'phrase')
+    search_parser.add_argument("--from", dest="start", help="first day YYYY-MM-DD")
+    search_parser.add_argument("--to", dest="end", help="last day YYYY-MM-DD")
+    search_parser.add_argument("--category", help="only this category")
+    search_parser.add_argument("--limit", type=int, default=50, help="most results, defaults to 50")
+
+    range_parser = commands.add_parser("range", parents=[common],
+                                       help="count, total and average of a date range, the last days or a fiscal "
+                                            "period")
+    period = range_parser.add_mutually_exclusive_group(required=True)
+    period.add_argument("--from", dest="start", help="first day YYYY-MM-DD, with --to")
+    period.add_argument("--last", type=int, metavar="DAYS", help="the last DAYS days, today included")
+    period.add_argument("--fiscal-year", type=int, metavar="YEAR", help="the fiscal year ending in YEAR")
+    range_parser.add_argument("--to", dest="end", help="last day YYYY-MM-DD, defaults to today")
+    range_parser.add_argument("--quarter", type=int, choices=range(1, 5), metavar="[1-4]",
+                              help="only this quarter of --fiscal-year")
+    range_parser.add_argument("--fiscal-start", type=int, choices=range(1, 13), metavar="[1-12]",
+                              default=FISCAL_YEAR_START, help="first month of the fiscal year")
+    range_parser.add_argument("--list", action="store_true", help="list the expenses instead of the totals")
+
+    statistics_parser = commands.add_parser("statistics", parents=[common],
+                                            help="median, percentiles, spread and histogram of every category")
+    statistics_parser.add_argument("--year", type=int, help="year [0-9999], every expense if not given")
+    statistics_parser.add_argument("--month", type=int, choices=range(1, 13), metavar="[1-12]",
+                                   help="month, needs --year")
+    statistics_parser.add_argument("--category", help="only this category")
+
+    trends_parser = commands.add_parser("trends", parents=[common],
+                                        help="moving totals and averages and cumulative spending of every day of a "
+                                             "range")
+    trends_parser.add_argument("--from", dest="start", help="first day YYYY-MM-DD, defaults to 89 days before --to")
+    trends_parser.add_argument("--to", dest="end", help="last day YYYY-MM-DD, defaults to today")
+    trends_parser.add_argument("--window", type=int, action="append", metavar="DAYS",
+                               help="moving window width, can be repeated, defaults to {}"
+                               .format(", ".join(str(window) for window in TREND_WINDOWS)))
+    trends_parser.add_argument("--category", help="only this category")
+
+    changes_parser = commands.add_parser("changes", parents=[common],
+                                         help="month over month and year over year change of every category")
+    changes_parser.add_argument("--year", type=int, help="year [0-9999], every month if not given")
+    changes_parser.add_argument("--category", help="only this category")
+
+    budget_parser = commands.add_parser("budget", parents=[common], help="set or remove the budget of a category")
+    budget_parser.add_argument("category", help="expense category")
+    budget_parser.add_argument("amount", nargs="?", help="dollar amount, leave out with --remove")
+    budget_parser.add_argument("--period", choices=["month", "year"], default="month", help="defaults to month")
+    budget_parser.add_argument("--remove", action="store_true", help="remove the budget instead")
+
+    budgets_parser = commands.add_parser("budgets", parents=[common],
+                                         help="every category against its monthly and yearly budgets")
+    budgets_parser.add_argument("--year", type=int, help="year [0-9999], defaults to this year")
+    budgets_parser.add_argument("--month", type=int, choices=range(1, 13), metavar="[1-12]",
+                                help="month, defaults to this month")
+
+    dedupe_parser = commands.add_parser("dedupe", parents=[common],
+                                        help="list the groups of expenses which look like they were logged twice")
+    dedupe_parser.add_argument("--days", type=int, default=NEAR_DUPLICATE_DAYS,
+                               help="how many days apart the expenses of a group can be, defaults to {}"
+                               .format(NEAR_DUPLICATE_DAYS))
+    dedupe_parser.add_argument("--category", help="only this category")
+    dedupe_parser.add_argument("--remove", action="store_true",
+                               help="delete the exact repeats instead, keeping the first of each")
+
+    commands.add_parser("categories", parents=[common], help="list the categories")
+
+    recategorize_parser = commands.add_parser("recategorize", parents=[common], help="rename or merge a category")
+    recategorize_parser.add_argument("old", help="category to change")
+    recategorize_parser.add_argument("new", help="category to change it to")
+
+    migrate_parser = commands.add_parser("migrate", parents=[common],
+                                         help="upgrade a database file to the current layout in place")
+    migrate_parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE, help="rows per transaction")
+
+    commands.add_parser("rebuild-rollups", parents=[common], help="recompute the daily and monthly rollup tables")
+
+    commands.add_parser("backfill-anomalies", parents=[common],
+                        help="rebuild the spending norms unusual expenses are flagged against from every expense")
+
+    commands.add_parser("snapshot", parents=[common],
+                        help="write the rows added since the last snapshot to the memory mapped analytics snapshot")
+
+    commands.add_parser("partition", parents=[common],
+                        help="move the expenses into one attached file per year, turning the partitioned layout on")
+
+    archive_parser = commands.add_parser("archive", parents=[common],
+                                         help="compact the partition of a year and make it read-only")
+    archive_parser.add_argument("year", type=int, help="year of the partition")
+    return parser
+
+
+def cli(argv):
+    """
+    non-interactive entry point for scripts, cron jobs and pipelines. Output is written as JSON or CSV to STDOUT,
+    errors to STDERR, and nothing waits between lines.
+
+    :param argv: accepts LIST of command line argument STR
+    :return: returns the exit status as INT
+    """
+    global PACING
+    PACING = False
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.profile:
+        return run_command(parser, args)
+    PROFILER.enabled = True
+    PROFILER.reset()
+    try:
+        with PROFILER.stage(args.command):
+            return run_command(parser, args)
+    finally:
+        PROFILER.write(args.profile)
+
+
+def run_command(parser, args):
+    """
+    runs one command of the non-interactive command line
+
+    :param parser: accepts the parser from build_parser, used to report bad arguments
+    :param args: accepts the parsed arguments
+    :return: returns the exit status as INT
+    """
+    if args.command == "migrate":
+        conn = sqlite3.connect(database_path(args.user),
+                               factory=ProfiledConnection if PROFILER.enabled else sqlite3.Connection)
+        previous = upgrade_database(conn, args.batch_size)
+        conn.close()
+        write_records([dict(previous_version=previous, version=SCHEMA_VERSION)], ["previous_version", "version"],
+                      args.format)
+        return 0
+    cli_user = User(args.user, interactive=False, persistent_cache=args.cache, duplicates=args.duplicates)
+    if not cli_user.started:
+        return 1
+    try:
+        return run_user_command(parser, args, cli_user)
+    finally:
+        cli_user.save_cache()
+
+
+def run_user_command(parser, args, cli_user):
+    """
+    runs one command of the non-interactive command line which works on a user database
+
+    :param parser: accepts the parser from build_parser, used to report bad arguments
+    :param args: accepts the parsed arguments
+    :param cli_user: accepts the User of the database
+    :return: returns the exit status as INT
+    """
+    if args.command == "add":
+        try:
+            amount, category, note, date = normalize_expense(args.amount, args.category, args.note,
+                                                             args.date or datetime.date.today())
+        except ValueError as e:
+            parser.error(str(e))
+        date = datetime.date.fromisoformat(date)
+        saved = cli_user.log_previous_expenses(amount, category, date.day, date.month, date.year, note)
+        if cli_user.duplicates and cli_user.duplicates[0].rejected:
+            print("ERROR, the expense was already logged as expense {}.".format(cli_user.duplicates[0].duplicate_of),
+                  file=sys.stderr)
+            return 1
+        if not saved:
+            print("ERROR, the expense could not be saved.", file=sys.stderr)
+            return 1
+        for duplicate in cli_user.duplicates:
+            print("WARNING, the expense was already logged as expense {}.".format(duplicate.duplicate_of),
+                  file=sys.stderr)
+        for status in cli_user.budget_alerts:
+            for threshold in status.crossed:
+                print("WARNING, {}% of the {} is spent.".format(threshold, describe_budget(status)),
+                      file=sys.stderr)
+        for anomaly in cli_user.anomalies:
+            print("WARNING, {}.".format(describe_anomaly(anomaly)), file=sys.stderr)
+        write_records(expense_records([(amount, category, note, str(date))]), EXPENSE_COLUMNS, args.format)
+    elif args.command == "import":
+        reject_path = args.rejects or args.path + ".rejects.csv"
+        result = cli_user.bulk_import(args.path, args.batch_size, reject_path, args.delimiter)
+        record = result._asdict()
+        record["reject_path"] = reject_path if result.rejected else ""
+        write_records([record], list(record), args.format)
+    elif args.command == "view":
+        try:
+            data = cli_user.grab_period(args.year, args.month, args.week, args.start, args.end, args.category)
+        except ValueError as e:
+            parser.error(str(e))
+        write_records(expense_records(data), EXPENSE_COLUMNS, args.format)
+    elif args.command == "report":
+        report = cli_user.monthly_report_data(args.month, args.year)
+        if args.format == "json":
+            json.dump(report_as_dict(report), sys.stdout, indent=2)
+            print()
+        else:
+            write_records(report_records(report), REPORT_COLUMNS, args.format)
+    elif args.command == "percentages":
+        percentages = cli_user.category_percentages(args.year, args.month)
+        write_records((dict(category=entry, percentage=percentages[entry]) for entry in percentages),
+                      ["category", "percentage"], args.format)
+    elif args.command == "search":
+        try:
+            data = cli_user.search(args.text, args.start, args.end, args.category, args.limit)
+        except ValueError as e:
+            parser.error(str(e))
+        write_records(expense_records(data), EXPENSE_COLUMNS, args.format)
+    elif args.command == "range":
+        if args.last is not None:
+            if args.last < 1:
+                parser.error("--last needs at least 1 day")
+            start, end = last_days_bounds(args.last)
+        elif args.fiscal_year is not None:
+            if args.quarter:
+                start, end = fiscal_quarter_bounds(args.quarter, args.fiscal_year, args.fiscal_start)
+            else:
+                start, end = fiscal_year_bounds(args.fiscal_year, args.fiscal_start)
+        else:
+            start, end = args.start, args.end or str(datetime.date.today())
+        index = cli_user.date_index()
+        try:
+            if args.list:
+                write_records(expense_records(index.between(start, end)), EXPENSE_COLUMNS, args.format)
+                return 0
+            count = index.count(start, end)
+        except ValueError as e:
+            parser.error(str(e))
+        write_records([dict(start=str(start), end=str(end), count=count, total=index.total(start, end),
+                            average=index.average(start, end) if count else 0.0)],
+                      ["start", "end", "count", "total", "average"], args.format)
+    elif args.command == "statistics":
+        try:
+            statistics = cli_user.period_statistics(args.year, args.month, args.category)
+        except ValueError as e:
+            parser.error(str(e))
+        columns = STATISTICS_COLUMNS + list(StreamingStats().summary()["histogram"])
+        write_records(statistics_records(statistics, args.format), columns, args.format)
+    elif args.command == "trends":
+        try:
+            end = datetime.date.fromisoformat(args.end) if args.end else datetime.date.today()
+            start = datetime.date.fromisoformat(args.start) if args.start else end - datetime.timedelta(days=89)
+        except ValueError as e:
+            parser.error(str(e))
+        windows = args.window or TREND_WINDOWS
+        if min(windows) < 1:
+            parser.error("--window needs at least 1 day")
+        trends = cli_user.trends(start, end, windows, args.category)
+        series = [("{}d".format(window), points) for window, points in trends["moving"].items()]
+        series.append(("cumulative", trends["cumulative"]))
+        write_records((dict(series=name, **point._asdict()) for name, points in series for point in points),
+                      ["series"] + list(TrendPoint._fields), args.format)
+    elif args.command == "changes":
+        write_records((change._asdict() for change in cli_user.monthly_changes(args.year, args.category)),
+                      list(MonthChange._fields), args.format)
+    elif args.command == "budget":
+        if args.remove == (args.amount is not None):
+            parser.error("give either an amount or --remove")
+        try:
+            amount = None if args.remove else round(float(args.amount), 2)
+        except ValueError:
+            parser.error("the amount must be a number")
+        cli_user.set_budget(args.category, amount, args.period)
+        write_records([dict(category=args.category.capitalize(), period=args.period, budget=amount)],
+                      ["category", "period", "budget"], args.format)
+    elif args.command == "budgets":
+        write_records((status._asdict() for status in cli_user.budget_status(args.year, args.month)),
+                      list(BudgetStatus._fields), args.format)
+    elif args.command == "dedupe":
+        if args.days < 0:
+            parser.error("--days can't be negative")
+        if args.remove:
+            write_records([dict(removed=cli_user.remove_duplicates())], ["removed"], args.format)
+        else:
+            write_records((dict(group=number, id=expense_id, amount=amount, category=category, note=note, date=date)
+                           for number, group in enumerate(cli_user.near_duplicates(args.days, args.category), 1)
+                           for expense_id, amount, category, note, date in group),
+                          ["group", "id", "amount", "category", "note", "date"], args.format)
+    elif args.command == "categories":
+        write_records((dict(category=entry) for entry in cli_user.grab_categories()), ["category"], args.format)
+    elif args.command == "recategorize":
+        matches = [entry for entry in cli_user.grab_categories() if entry.lower() == args.old.lower()]
+        if not matches:
+            print("ERROR, there is no category called {}.".format(args.old), file=sys.stderr)
+            return 1
+        if not cli_user.fix_wrong_category(matches[0], args.new):
+            print("ERROR, the category could not be changed.", file=sys.stderr)
+            return 1
+        write_records([dict(category=matches[0], new_category=args.new.capitalize())], ["category", "new_category"],
+                      args.format)
+    elif args.command == "rebuild-rollups":
+        cli_user.rebuild_rollups()
+    elif args.command == "backfill-anomalies":
+        write_records([dict(replayed=cli_user.backfill_anomalies())], ["replayed"], args.format)
+    elif args.command == "snapshot":
+        added = cli_user.refresh_snapshot()
+        write_records([dict(path=snapshot_path(cli_user.path), added=added)], ["path", "added"], args.format)
+    elif args.command == "partition":
+        moved = cli_user.partition_expenses()
+        write_records((dict(year=year, moved=moved[year], path=partition_path(cli_user.path, year)) for year in moved),
+                      ["year", "moved", "path"], args.format)
+    elif args.command == "archive":
+        try:
+            cli_user.archive_partition(args.year)
+        except ValueError as e:
+            print("ERROR, {}.".format(e), file=sys.stderr)
+            return 1
+        write_records([dict(year=args.year, path=partition_path(cli_user.path, args.year))], ["year", "path"],
+                      args.format)
+    return 0
+
+
 def main():
     print("EXPENSE TRACKER")
     print()
     print("A Program By: Brandon Bertagnolli")
-    time.sleep(1)
+    pause(1)
     print()
     print()
     print()
@@ -848,6 +5562,13 @@ def main():
         print("8. View spending category percentages by month or year")
         print("9. View a list of all the categories currently in the database")
         print("10. Fix a mislabeled category")
+        # options added later are numbered after the original ones, Quit keeps 11 so old habits still work
+        print("12. Import expenses from a file")
+        print("13. Search expense notes")
+        print("14. View totals for a date range, the last days or a fiscal period")
+        print("15. View spending trends")
+        print("16. Set a budget or view budget status")
+        print("17. Find duplicate expenses")
         print("11. Quit ")
         print()
         user_input = input("Please select an option [1, 2, 3 etc]: ")
@@ -874,13 +5595,34 @@ def main():
             menu_function10()
         elif user_input == "11" or user_input == "q":
             break
+        elif user_input == "12":
+            menu_function12()
+        elif user_input == "13":
+            menu_function13()
+        elif user_input == "14":
+            menu_function14()
+        elif user_input == "15":
+            menu_function15()
+        elif user_input == "16":
+            menu_function16()
+        elif user_input == "17":
+            menu_function17()
         else:
             print()
             print("I didn't get that.\nPlease select an appropriate option.")
-            time.sleep(1)
+            pause(1)
 
 
 if __name__ == "__main__":
+    if PROFILER.enabled:
+        atexit.register(PROFILER.write, "-" if os.environ["EXPENSE_PROFILE"] == "1" else os.environ["EXPENSE_PROFILE"])
+    if len(sys.argv) > 1:
+        try:
+            sys.exit(cli(sys.argv[1:]))
+        except BrokenPipeError:
+            # the output was piped into a command which stopped reading, e.g. head
+            sys.stderr.close()
+            sys.exit(1)
     while not User.started:
         user = User(input("Please enter your name: "))
         if user.started:
@@ -0,0 +1,135 @@
+"""
+Month-end reports for every user database in a directory, computed in parallel over a pool of processes sized to
+the machine's cores. Each user's monthly report, yearly category percentages and spending statistics are written to
+their own file in the output directory. A user whose database can't be read is reported and skipped, the rest of the
+batch goes on. The statistics sketches of every user are merged into _all-<year>-<month>.json.
+
+    python batch_reports.py --dir . --out reports --year 2021 --month 3
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+import Assignment1
+
+# outcome of one user's report, error is empty unless it failed. statistics is a DICTIONARY of CATEGORY as STR:
+# StreamingStats.as_dict() of the month, which is how the statistics travel back from the worker processes
+UserResult = namedtuple("UserResult", ["user", "output", "seconds", "error", "statistics"])
+
+# outcome of a whole batch
+BatchResult = namedtuple("BatchResult", ["users", "failed", "seconds"])
+
+
+def discover_databases(directory):
+    """
+    :param directory: directory holding the user databases in STR
+    :return: returns a sorted LIST of the paths of the .db files in the directory
+    """
+    return sorted(os.path.join(directory, entry) for entry in os.listdir(directory)
+                  if entry.endswith(".db") and os.path.isfile(os.path.join(directory, entry)))
+
+
+def report_user(path, output_dir, month, year, output_format="json", cache=False):
+    """
+    computes the monthly report, category percentages and spending statistics of one user database and writes them
+    to a file, runs in a worker process
+
+    :param path: path of the user's database in STR
+    :param output_dir: directory the report is written to in STR
+    :param month: accepts INT between 1-12
+    :param year: accepts INT between 0-9999
+    :param output_format: OPTIONAL "json" or "csv" in STR
+    :param cache: OPTIONAL BOOLEAN, when True the results are kept in the cache file of the database, so the next
+            batch over unchanged databases starts warm
+    :return: returns a UserResult
+    """
+    Assignment1.PACING = False
+    name = os.path.splitext(os.path.basename(path))[0]
+    started = time.perf_counter()
+    user = None
+    try:
+        user = Assignment1.User(path, interactive=False, persistent_cache=cache)
+        if not user.started:
+            raise RuntimeError("could not open the database")
+        report = user.monthly_report_data(month, year)
+        statistics = user.period_statistics(year, month)
+        output = os.path.join(output_dir, "{}-{}-{:02d}.{}".format(name, year, month, output_format))
+        with open(output, "w", newline="") as file:
+            if output_format == "csv":
+                Assignment1.write_records(Assignment1.report_records(report), Assignment1.REPORT_COLUMNS, "csv", file)
+            else:
+                json.dump(dict(user=name, month=month, year=year, report=Assignment1.report_as_dict(report),
+                               year_percentages=user.category_percentages(year),
+                               statistics={entry: figures.summary() for entry, figures in statistics.items()}),
+                          file, indent=2)
+        return UserResult(name, output, time.perf_counter() - started, "",
+                          {entry: figures.as_dict() for entry, figures in statistics.items()})
+    except Exception as e:
+        return UserResult(name, "", time.perf_counter() - started, "{}: {}".format(type(e).__name__, e), {})
+    finally:
+        if user is not None and user.started:
+            user.save_cache()
+            user.user_db.close()
+
+
+def run_batch(directory, output_dir, month, year, workers=None, output_format="json", cache=False):
+    """
+    reports every user database of a directory over a process pool, printing failures to STDERR as they happen
+
+    :param directory: directory holding the user databases in STR
+    :param output_dir: directory the reports are written to in STR, created if missing
+    :param month: accepts INT between 1-12
+    :param year: accepts INT between 0-9999
+    :param workers: OPTIONAL number of processes in INT, defaults to the number of cores
+    :param output_format: OPTIONAL "json" or "csv" in STR
+    :param cache: OPTIONAL BOOLEAN, when True the users' results caches are loaded and saved, see report_user
+    :return: returns a BatchResult
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = discover_databases(directory)
+    failed = 0
+    statistics = {}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(report_user, path, output_dir, month, year, output_format, cache): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker process itself died, e.g. it was killed
+                result = UserResult(os.path.basename(futures[future]), "", 0.0, "{}: {}".format(type(e).__name__, e),
+                                    {})
+            if result.error:
+                failed += 1
+                print("ERROR, the report of {} failed: {}".format(result.user, result.error), file=sys.stderr)
+            for entry, values in result.statistics.items():
+                statistics.setdefault(entry, Assignment1.StreamingStats()).merge(
+                    Assignment1.StreamingStats.from_dict(values))
+    with open(os.path.join(output_dir, "_all-{}-{:02d}.json".format(year, month)), "w") as file:
+        json.dump(dict(users=len(paths) - failed, month=month, year=year,
+                       statistics={entry: figures.summary() for entry, figures in statistics.items()}), file, indent=2)
+    return BatchResult(len(paths), failed, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    today = datetime.date.today()
+    parser = argparse.ArgumentParser(description="Monthly reports for every user database in a directory")
+    parser.add_argument("--dir", default=".", help="directory holding the user databases")
+    parser.add_argument("--out", default="reports", help="directory the reports are written to")
+    parser.add_argument("--year", type=int, default=today.year, help="defaults to this year")
+    parser.add_argument("--month", type=int, choices=range(1, 13), metavar="[1-12]", default=today.month,
+                        help="defaults to this month")
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to the number of cores")
+    parser.add_argument("--format", choices=["json", "csv"], default="json", help="report file format")
+    parser.add_argument("--cache", action="store_true", help="keep every user's results in a cache file between runs")
+    args = parser.parse_args()
+    batch = run_batch(args.dir, args.out, args.month, args.year, args.workers, args.format, args.cache)
+    print("{} reports in {:.2f}s ({:.1f} users/sec), {} failed".format(
+        batch.users - batch.failed, batch.seconds, batch.users / batch.seconds if batch.seconds else 0, batch.failed))
+    sys.exit(1 if batch.failed else 0)
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the expense tracker analytics.
+
+    python -m benchmarks run --rows 1000000 --output before.json
+    python -m benchmarks compare before.json after.json
+"""
@@ -0,0 +1,122 @@
+"""
+python -m benchmarks run      populates a synthetic database, times every scenario and writes the results as JSON
+python -m benchmarks compare  prints two or more result files side by side
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+
+import Assignment1
+
+from benchmarks import scenarios, synthetic
+
+
+def run(args):
+    """
+    :return: returns the exit status as INT
+    """
+    directory = None
+    if args.db:
+        path = args.db
+    else:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "bench.db")
+    existing = os.path.exists(path)
+    # the cache would answer every repeat of an analytics scenario, the .cached scenarios turn it on themselves
+    user = Assignment1.User(path, interactive=False, cache_size=0)
+    if not existing:
+        started = time.perf_counter()
+        rows = synthetic.populate(user, args.rows, args.categories, args.start, args.days, args.seed)
+        print("populated {} rows in {:.1f}s".format(rows, time.perf_counter() - started), file=sys.stderr)
+    # analytics are asked about a month in the middle of the generated span
+    middle = datetime.date.fromordinal(args.start.toordinal() + args.days // 2)
+    context = scenarios.Context(user, middle.year, middle.month, import_rows=args.import_rows or min(args.rows, 100000),
+                                categories=args.categories, log_rows=args.log_rows)
+
+    def progress(name, timings):
+        print("{:40} {:10.4f}s".format(name, timings["median"]), file=sys.stderr)
+
+    results = scenarios.run_scenarios(context, args.repeat, args.only, progress)
+    document = dict(label=args.label or time.strftime("%Y-%m-%d %H:%M:%S"), python=platform.python_version(),
+                    sqlite=sqlite3.sqlite_version, numpy=Assignment1.numpy is not None, rows=args.rows,
+                    categories=args.categories, days=args.days, seed=args.seed, repeat=args.repeat, results=results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(document, file, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    user.user_db.close()
+    if directory is not None:
+        directory.cleanup()
+    return 0
+
+
+def compare(args):
+    """
+    :return: returns the exit status as INT
+    """
+    documents = []
+    for path in args.results:
+        with open(path) as file:
+            documents.append(json.load(file))
+    names = []
+    for document in documents:
+        for name in document["results"]:
+            if name not in names:
+                names.append(name)
+    labels = [document.get("label", path) for document, path in zip(documents, args.results)]
+    header = "{:40}".format("scenario") + "".join("{:>14}".format(label[:13]) for label in labels)
+    if len(documents) > 1:
+        header += "{:>10}".format("change")
+    print(header)
+    print("-" * len(header))
+    for name in names:
+        timings = [document["results"].get(name, {}).get(args.statistic) for document in documents]
+        line = "{:40}".format(name) + "".join("{:>13.4f}s".format(value) if value is not None else "{:>14}".format("-")
+                                              for value in timings)
+        if len(documents) > 1 and timings[0] and timings[-1] is not None:
+            line += "{:>9.2f}x".format(timings[-1] / timings[0])
+        print(line)
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Expense tracker benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="time every scenario on a synthetic database")
+    run_parser.add_argument("--rows", type=int, default=100000, help="number of synthetic expenses")
+    run_parser.add_argument("--categories", type=int, default=12, help="number of distinct categories")
+    run_parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date(2015, 1, 1),
+                            help="first date YYYY-MM-DD")
+    run_parser.add_argument("--days", type=int, default=3650, help="number of days the dates are spread over")
+    run_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    run_parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario")
+    run_parser.add_argument("--import-rows", type=int, default=0,
+                            help="rows for the bulk import scenario, defaults to --rows capped at 100000")
+    run_parser.add_argument("--log-rows", type=int, default=2000,
+                            help="expenses logged one at a time by the logging scenarios")
+    run_parser.add_argument("--only", help="only run scenarios whose name contains this")
+    run_parser.add_argument("--db", help="database file to use, populated if it doesn't exist yet")
+    run_parser.add_argument("--label", help="name of this run in comparisons")
+    run_parser.add_argument("--output", help="JSON file the results are written to, defaults to STDOUT")
+
+    compare_parser = commands.add_parser("compare", help="print result files side by side")
+    compare_parser.add_argument("results", nargs="+", help="JSON result files, the first one is the baseline")
+    compare_parser.add_argument("--statistic", choices=["min", "median", "max"], default="median")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
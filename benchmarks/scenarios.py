@@ -0,0 +1,365 @@
+"""
+Timed scenarios for the public functions and User methods of Assignment1. Every scenario is a function taking a
+Context, registered in SCENARIOS in the order they run.
+"""
+import contextlib
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import Assignment1
+
+from benchmarks import synthetic
+
+SCENARIOS = []
+
+
+def scenario(name):
+    """
+    decorator registering a scenario under name
+
+    :param name: scenario name in STR
+    :return: returns the decorator
+    """
+    def register(function):
+        SCENARIOS.append((name, function))
+        return function
+    return register
+
+
+class Context:
+    """
+    what the scenarios run against: a populated user database and the period the analytics are asked about
+    """
+
+    def __init__(self, user, year, month, week=2, import_rows=100000, categories=12, log_rows=2000):
+        self.user = user
+        self.year = year
+        self.month = month
+        self.week = week
+        self.import_rows = import_rows
+        self.log_rows = log_rows
+        self.categories = categories
+        self.category = synthetic.category_names(categories)[0]
+        self._rows = None
+        self._columns = None
+
+    @property
+    def rows(self):
+        """
+        :return: returns the full database dump, loaded once and shared by the in-memory scenarios
+        """
+        if self._rows is None:
+            self._rows = self.user.grab_data()
+        return self._rows
+
+    @property
+    def columns(self):
+        """
+        :return: returns an ExpenseColumns snapshot of the database, built once
+        """
+        if self._columns is None:
+            self._columns = Assignment1.ExpenseColumns(self.user.iter_data())
+        return self._columns
+
+
+@scenario("parse_by_year")
+def _parse_by_year(context):
+    Assignment1.parse_by_year(context.year, context.rows)
+
+
+@scenario("parse_by_month")
+def _parse_by_month(context):
+    Assignment1.parse_by_month(context.month, context.rows)
+
+
+@scenario("parse_by_week_of_month")
+def _parse_by_week_of_month(context):
+    Assignment1.parse_by_week_of_month(context.week, context.rows)
+
+
+@scenario("parse_by_category")
+def _parse_by_category(context):
+    Assignment1.parse_by_category(context.category, context.rows)
+
+
+@scenario("category_breakdown")
+def _category_breakdown(context):
+    Assignment1.category_breakdown(context.rows)
+
+
+@scenario("find_average")
+def _find_average(context):
+    Assignment1.find_average(context.rows)
+
+
+@scenario("summing_it")
+def _summing_it(context):
+    Assignment1.summing_it(context.rows)
+
+
+@scenario("category_statistics")
+def _category_statistics(context):
+    Assignment1.category_statistics(context.rows)
+
+
+@scenario("columns.parse_by_year")
+def _columns_parse_by_year(context):
+    Assignment1.parse_by_year(context.year, context.columns)
+
+
+@scenario("columns.category_breakdown")
+def _columns_category_breakdown(context):
+    Assignment1.category_breakdown(context.columns)
+
+
+@scenario("User.grab_data")
+def _grab_data(context):
+    context.user.grab_data()
+
+
+@scenario("User.grab_columns")
+def _grab_columns(context):
+    context.user._columns = None
+    context.user.grab_columns()
+    context.user._columns = None
+
+
+@scenario("refresh_snapshot")
+def _refresh_snapshot(context):
+    directory = Assignment1.snapshot_path(context.user.path)
+    Assignment1.invalidate_snapshot(directory)
+    Assignment1.refresh_snapshot(context.user.user_db, directory)
+
+
+@scenario("load_snapshot.year.grouped_totals")
+def _load_snapshot(context):
+    columns = Assignment1.load_snapshot(context.user.user_db, Assignment1.snapshot_path(context.user.path))
+    columns.where_year(context.year).grouped_totals()
+
+
+@scenario("User.date_index")
+def _date_index(context):
+    context.user._date_index = None
+    context.user.date_index()
+
+
+@scenario("date_index.month.total")
+def _date_index_total(context):
+    start, end = Assignment1.month_bounds(context.month, context.year)
+    index = context.user.date_index()
+    index.count(start, end)
+    index.total(start, end)
+
+
+@scenario("User.trends.year")
+def _trends(context):
+    context.user.trends(*Assignment1.year_bounds(context.year))
+
+
+@scenario("User.monthly_changes")
+def _monthly_changes(context):
+    context.user.monthly_changes(context.year)
+
+
+@scenario("User.stream.year.month.sum")
+def _stream(context):
+    context.user.stream().year(context.year).month(context.month).sum()
+
+
+@scenario("User.grab_year")
+def _grab_year(context):
+    context.user.grab_year(context.year)
+
+
+@scenario("User.grab_month")
+def _grab_month(context):
+    context.user.grab_month(context.month, context.year)
+
+
+@scenario("User.grab_week_of_month")
+def _grab_week_of_month(context):
+    context.user.grab_week_of_month(context.week, context.month, context.year)
+
+
+@scenario("User.grab_categories")
+def _grab_categories(context):
+    context.user.grab_categories()
+
+
+@scenario("User.yearly_avg")
+def _yearly_avg(context):
+    context.user.yearly_avg(context.year)
+
+
+@scenario("User.monthly_avg")
+def _monthly_avg(context):
+    context.user.monthly_avg(context.month)
+
+
+@scenario("User.category_avg")
+def _category_avg(context):
+    context.user.category_avg(context.category)
+
+
+@scenario("User.monthly_category_percentages")
+def _monthly_category_percentages(context):
+    context.user.monthly_category_percentages(synthetic.category_names(context.categories), context.month)
+
+
+@scenario("User.yearly_category_percentages")
+def _yearly_category_percentages(context):
+    context.user.yearly_category_percentages(synthetic.category_names(context.categories), context.year)
+
+
+@scenario("User.monthly_report_data")
+def _monthly_report_data(context):
+    context.user.monthly_report_data(context.month, context.year)
+
+
+@scenario("User.period_statistics.month")
+def _period_statistics(context):
+    context.user.period_statistics(context.year, context.month)
+
+
+def _cached(context, method, *args):
+    """
+    times a cache hit of a User method, the first call filling the cache isn't measured
+
+    :return: returns the seconds the second call took in FLOAT
+    """
+    context.user.cache = Assignment1.ResultCache()
+    try:
+        method(*args)
+        started = time.perf_counter()
+        method(*args)
+        return time.perf_counter() - started
+    finally:
+        context.user.cache = None
+
+
+@scenario("User.monthly_report_data.cached")
+def _monthly_report_data_cached(context):
+    return _cached(context, context.user.monthly_report_data, context.month, context.year)
+
+
+@scenario("User.period_statistics.month.cached")
+def _period_statistics_cached(context):
+    return _cached(context, context.user.period_statistics, context.year, context.month)
+
+
+@scenario("User.monthly_report")
+def _monthly_report(context):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        context.user.monthly_report(context.month, context.year)
+
+
+@scenario("User.bulk_import")
+def _bulk_import(context):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "import.csv")
+        synthetic.write_csv(path, context.import_rows, context.categories)
+        user = Assignment1.User(os.path.join(directory, "import.db"), interactive=False)
+        started = time.perf_counter()
+        user.bulk_import(path, batch_size=10000)
+        elapsed = time.perf_counter() - started
+        user.user_db.close()
+    return elapsed
+
+
+def _log_expenses(context, write_behind):
+    """
+    logs context.log_rows expenses one call at a time into a new database
+
+    :return: returns the seconds until every expense is committed
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        user = Assignment1.User(os.path.join(directory, "log.db"), interactive=False, write_behind=write_behind)
+        names = synthetic.category_names(context.categories)
+        started = time.perf_counter()
+        for number in range(context.log_rows):
+            user.log_current_expenses(number % 100 + 0.5, names[number % len(names)], "logged")
+        user.flush()
+        elapsed = time.perf_counter() - started
+        if user.writer is not None:
+            user.writer.close()
+        user.user_db.close()
+    return elapsed
+
+
+@scenario("User.log_current_expenses")
+def _log_current_expenses(context):
+    return _log_expenses(context, False)
+
+
+@scenario("User.log_current_expenses.write_behind")
+def _log_current_expenses_write_behind(context):
+    return _log_expenses(context, True)
+
+
+@scenario("User.parallel_statistics.while_logging")
+def _parallel_statistics_while_logging(context):
+    """
+    reports the statistics of every category of a concurrent user, one thread per category query, while another
+    thread keeps logging expenses into it. Fails unless expenses were committed while the report was running.
+
+    :return: returns the seconds the report took
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        user = Assignment1.User(os.path.join(directory, "concurrent.db"), interactive=False, cache_size=0,
+                                concurrent=True)
+        synthetic.populate(user, context.import_rows, context.categories)
+        names = synthetic.category_names(context.categories)
+        stop = threading.Event()
+        committed = []
+
+        def log():
+            while not stop.is_set():
+                user.log_current_expenses(5.5, names[len(committed) % len(names)], "logged")
+                committed.append(time.perf_counter())
+
+        thread = threading.Thread(target=log)
+        thread.start()
+        try:
+            while not committed:
+                time.sleep(0.001)
+            started = time.perf_counter()
+            user.parallel_statistics()
+            finished = time.perf_counter()
+        finally:
+            stop.set()
+            thread.join()
+            user.connections.close()
+            user.user_db.close()
+    if not any(started <= moment <= finished for moment in committed):
+        raise AssertionError("no expense was committed while the report was running")
+    return finished - started
+
+
+def run_scenarios(context, repeat=3, only=None, progress=None):
+    """
+    times every scenario. A scenario returning a number reports its own timing, used when it needs setup which
+    shouldn't be measured.
+
+    :param context: accepts a Context
+    :param repeat: OPTIONAL number of timed runs of each scenario in INT
+    :param only: OPTIONAL substring, only scenarios whose name contains it are run
+    :param progress: OPTIONAL function called with the name and timings of each finished scenario
+    :return: returns a DICTIONARY of scenario name: DICTIONARY of min, median and max seconds as FLOAT
+    """
+    Assignment1.PACING = False
+    results = {}
+    for name, function in SCENARIOS:
+        if only and only not in name:
+            continue
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            reported = function(context)
+            timings.append(reported if reported is not None else time.perf_counter() - started)
+        results[name] = dict(min=min(timings), median=statistics.median(timings), max=max(timings))
+        if progress is not None:
+            progress(name, results[name])
+    return results
@@ -0,0 +1,73 @@
+"""
+Deterministic synthetic expense data. The same arguments always produce the same rows, so timings from
+different versions of the code are measured on identical databases.
+"""
+import datetime
+import random
+
+NOTES = ["", "", "", "lunch", "groceries", "fuel", "dentist", "rent", "gift", "coffee", "train ticket",
+         "online order", "pharmacy", "cinema", "repair"]
+
+
+def category_names(categories):
+    """
+    :param categories: number of categories in INT
+    :return: returns a LIST of category names in STR
+    """
+    return ["Category{:03d}".format(number) for number in range(categories)]
+
+
+def synthetic_expenses(rows, categories=12, start=datetime.date(2015, 1, 1), days=3650, seed=0):
+    """
+    Generator of synthetic expenses, lazily so tens of millions of rows never sit in memory. Category popularity is
+    skewed so some categories are much larger than others, and amounts are log-normally distributed.
+
+    :param rows: number of expenses in INT
+    :param categories: OPTIONAL number of distinct categories in INT
+    :param start: OPTIONAL first date in DATE
+    :param days: OPTIONAL number of days the dates are spread over in INT
+    :param seed: OPTIONAL random seed in INT
+    :return: yields TUPLES of (AMOUNT as FLOAT, CATEGORY as STR, NOTE as STR, DATE as DATE)
+    """
+    rng = random.Random(seed)
+    names = category_names(categories)
+    weights = [1.0 / (rank + 1) for rank in range(categories)]
+    first = start.toordinal()
+    for _ in range(rows):
+        yield (round(min(rng.lognormvariate(3, 1), 99999), 2),
+               rng.choices(names, weights)[0],
+               rng.choice(NOTES),
+               datetime.date.fromordinal(first + rng.randrange(days)))
+
+
+def populate(user, rows, categories=12, start=datetime.date(2015, 1, 1), days=3650, seed=0, batch_size=50000):
+    """
+    fills a user's database with synthetic expenses, batch_size rows per transaction
+
+    :param user: accepts an Assignment1.User
+    :return: returns the number of rows inserted in INT
+    """
+    batch = []
+    inserted = 0
+    for entry in synthetic_expenses(rows, categories, start, days, seed):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            user._insert_expenses(batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        user._insert_expenses(batch)
+        inserted += len(batch)
+    return inserted
+
+
+def write_csv(path, rows, categories=12, start=datetime.date(2015, 1, 1), days=3650, seed=0):
+    """
+    writes synthetic expenses as an AMOUNT, CATEGORY, NOTE, DATE file accepted by User.bulk_import
+
+    :param path: file to write in STR
+    :return: returns nothing
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        for amount, category, note, date in synthetic_expenses(rows, categories, start, days, seed):
+            file.write("{},{},{},{}\n".format(amount, category, note, date))
@@ -0,0 +1,360 @@
+"""
+Local HTTP/JSON service on top of the User operations in Assignment1, so several people can log and query
+expenses at the same time.
+
+Requests are parsed on an asyncio event loop and the blocking database work runs in a thread executor. Every user
+database gets a bounded pool of connections in WAL mode, so reads keep going while another request is writing.
+
+    python expense_server.py --dir . --port 8080
+
+    GET  /users/<name>/expenses?year=&month=&week=&from=&to=&category=
+    POST /users/<name>/expenses          {"amount": 12.5, "category": "food", "note": "", "date": "2020-01-31"}
+                                         answers with the budgets of the category the expense counts against,
+                                         the ids of the expenses it repeats and the anomalies it raised. A repeat
+                                         refused by --duplicates reject answers 409, a database still locked by
+                                         other writers after a few retries answers 503
+    GET  /users/<name>/report?year=&month=
+    GET  /users/<name>/percentages?year=&month=
+    GET  /users/<name>/categories
+    GET  /users/<name>/search?q=&from=&to=&category=&limit=
+    POST /users/<name>/recategorize      {"category": "Fod", "new_category": "food"}
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+import Assignment1
+
+# user names map to file names, so only plain names are accepted
+USER_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# largest request body accepted, in bytes
+MAX_BODY = 64 * 1024
+
+# times a write still locked out by other connections after busy_timeout is tried again before answering 503
+BUSY_RETRIES = 3
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    """
+    raised by the request handlers to answer with an error status
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ConnectionPool:
+    """
+    Bounded pool of User objects for one database file, each holding its own SQLite connection. The database is
+    switched to WAL so readers don't block the writer, and a User is only used by one thread at a time.
+    """
+
+    def __init__(self, path, size, duplicates="flag"):
+        """
+        :param path: path of the database file in STR
+        :param size: number of connections in INT
+        :param duplicates: OPTIONAL one of Assignment1.DUPLICATE_POLICIES in STR, passed on to every User
+        """
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            user = Assignment1.User(path, interactive=False, check_same_thread=False, duplicates=duplicates)
+            if not user.started:
+                raise HTTPError(500, "could not open the database")
+            user.user_db.execute("""PRAGMA journal_mode = WAL""")
+            # waits for the write lock instead of failing right away when another connection is writing
+            user.user_db.execute("""PRAGMA busy_timeout = 5000""")
+            self._idle.put(user)
+
+    def acquire(self):
+        """
+        :return: returns an idle User, waiting for one to be released if they are all in use
+        """
+        return self._idle.get()
+
+    def release(self, user):
+        """
+        :param user: accepts a User taken with acquire
+        :return: returns nothing
+        """
+        self._idle.put(user)
+
+    def close(self):
+        """
+        closes every connection of the pool
+
+        :return: returns nothing
+        """
+        for _ in range(self.size):
+            self._idle.get().user_db.close()
+
+
+def _int_param(params, name, minimum, maximum):
+    """
+    :param params: accepts DICTIONARY from parse_qs
+    :param name: query parameter name in STR
+    :param minimum: smallest accepted value in INT
+    :param maximum: largest accepted value in INT
+    :return: returns the parameter in INT, or None if absent
+    """
+    if name not in params:
+        return None
+    try:
+        value = int(params[name][0])
+    except ValueError:
+        raise HTTPError(400, "{} must be a number".format(name))
+    if not minimum <= value <= maximum:
+        raise HTTPError(400, "{} must be between {} and {}".format(name, minimum, maximum))
+    return value
+
+
+def _busy(error):
+    """
+    :param error: accepts the write_error of a User
+    :return: returns True if the write failed because other connections held the database lock
+    """
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+
+class ExpenseServer:
+    """
+    asyncio HTTP/1.1 server routing requests to pooled User objects
+    """
+
+    def __init__(self, directory=".", pool_size=4, workers=None, duplicates="flag"):
+        """
+        :param directory: directory holding the user databases in STR
+        :param pool_size: OPTIONAL connections per user database in INT
+        :param workers: OPTIONAL threads running database work in INT, defaults to pool_size * 4
+        :param duplicates: OPTIONAL one of Assignment1.DUPLICATE_POLICIES in STR, what posting an expense which was
+                already logged does
+        """
+        self.directory = directory
+        self.pool_size = pool_size
+        self.duplicate_policy = duplicates
+        self.executor = ThreadPoolExecutor(max_workers=workers or pool_size * 4)
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._server = None
+
+    def pool(self, name):
+        """
+        :param name: user name in STR
+        :return: returns the ConnectionPool of the user's database, opening it on first use
+        """
+        if not USER_NAME.match(name):
+            raise HTTPError(400, "invalid user name")
+        with self._pools_lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                path = os.path.join(self.directory, Assignment1.database_path(name))
+                pool = self._pools[name] = ConnectionPool(path, self.pool_size, self.duplicate_policy)
+            return pool
+
+    def dispatch(self, method, path, params, body):
+        """
+        runs a request against the database, called in the executor
+
+        :param method: HTTP method in STR
+        :param path: request path in STR
+        :param params: accepts DICTIONARY from parse_qs
+        :param body: decoded JSON body, or None
+        :return: returns a TUPLE of (status as INT, JSON serializable response)
+        """
+        parts = path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "users":
+            raise HTTPError(404, "no such resource")
+        resource = parts[2]
+        pool = self.pool(parts[1])
+        user = pool.acquire()
+        try:
+            if resource == "expenses" and method == "GET":
+                try:
+                    data = user.grab_period(_int_param(params, "year", 0, 9999), _int_param(params, "month", 1, 12),
+                                            _int_param(params, "week", 1, 5), params.get("from", [None])[0],
+                                            params.get("to", [None])[0], params.get("category", [None])[0])
+                    return 200, list(Assignment1.expense_records(data))
+                except ValueError as e:
+                    raise HTTPError(400, str(e))
+            if resource == "expenses" and method == "POST":
+                if not isinstance(body, dict):
+                    raise HTTPError(400, "expected a JSON object")
+                try:
+                    amount, category, note, date = Assignment1.normalize_expense(
+                        body.get("amount"), body.get("category"), body.get("note", ""),
+                        body.get("date") or datetime.date.today())
+                except ValueError as e:
+                    raise HTTPError(400, str(e))
+                date = datetime.date.fromisoformat(date)
+                for attempt in range(BUSY_RETRIES + 1):
+                    saved = user.log_previous_expenses(amount, category, date.day, date.month, date.year, note)
+                    if saved or not _busy(user.write_error):
+                        break
+                    time.sleep(0.05 * (attempt + 1))
+                duplicates = [duplicate.duplicate_of for duplicate in user.duplicates]
+                if not saved and user.write_error is None and any(dup.rejected for dup in user.duplicates):
+                    raise HTTPError(409, "the expense repeats expense {}".format(duplicates[0]))
+                if not saved and _busy(user.write_error):
+                    raise HTTPError(503, "the database is busy, please try again")
+                if not saved:
+                    raise HTTPError(500, "the expense could not be saved")
+                return 201, dict(amount=amount, category=category, note=note, date=str(date),
+                                 budgets=[status._asdict() for status in user.budget_alerts], duplicate_of=duplicates,
+                                 anomalies=[anomaly._asdict() for anomaly in user.anomalies])
+            if resource == "report" and method == "GET":
+                today = datetime.date.today()
+                report = user.monthly_report_data(_int_param(params, "month", 1, 12) or today.month,
+                                                  _int_param(params, "year", 0, 9999) or today.year)
+                return 200, Assignment1.report_as_dict(report)
+            if resource == "percentages" and method == "GET":
+                return 200, user.category_percentages(_int_param(params, "year", 0, 9999),
+                                                      _int_param(params, "month", 1, 12))
+            if resource == "search" and method == "GET":
+                try:
+                    data = user.search(params.get("q", [""])[0], params.get("from", [None])[0],
+                                       params.get("to", [None])[0], params.get("category", [None])[0],
+                                       _int_param(params, "limit", 1, 1000) or 50)
+                    return 200, list(Assignment1.expense_records(data))
+                except ValueError as e:
+                    raise HTTPError(400, str(e))
+            if resource == "categories" and method == "GET":
+                return 200, user.grab_categories()
+            if resource == "recategorize" and method == "POST":
+                if not isinstance(body, dict) or not body.get("category") or not body.get("new_category"):
+                    raise HTTPError(400, "expected category and new_category")
+                if body["category"] not in user.grab_categories():
+                    raise HTTPError(404, "no such category")
+                if not user.fix_wrong_category(body["category"], body["new_category"]):
+                    raise HTTPError(500, "the category could not be changed")
+                return 200, dict(category=body["category"], new_category=body["new_category"].capitalize())
+            if resource in ("expenses", "report", "percentages", "search", "categories", "recategorize"):
+                raise HTTPError(405, "method not allowed")
+            raise HTTPError(404, "no such resource")
+        finally:
+            pool.release(user)
+
+    async def handle(self, reader, writer):
+        """
+        serves the requests of one client connection, keeping it open between requests unless asked to close
+
+        :param reader: asyncio StreamReader
+        :param writer: asyncio StreamWriter
+        :return: returns nothing
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY:
+                        raise HTTPError(413, "request body too large")
+                    body = None
+                    if length:
+                        try:
+                            body = json.loads(await reader.readexactly(length))
+                        except ValueError:
+                            raise HTTPError(400, "the body is not valid JSON")
+                    url = urlsplit(target)
+                    status, result = await loop.run_in_executor(self.executor, self.dispatch, method, url.path,
+                                                                parse_qs(url.query), body)
+                except HTTPError as e:
+                    status, result = e.status, dict(error=e.message)
+                except Exception as e:
+                    status, result = 500, dict(error=str(e))
+                payload = json.dumps(result).encode()
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                             "Connection: {}\r\n\r\n".format(status, REASONS[status], len(payload),
+                                                             "keep-alive" if keep_alive else "close").encode()
+                             + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """
+        starts listening, use port 0 to pick any free port
+
+        :param host: address to listen on in STR
+        :param port: port to listen on in INT
+        :return: returns the port listened on in INT
+        """
+        self._server = await asyncio.start_server(self.handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        stops listening and closes every pooled connection
+
+        :return: returns nothing
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown()
+        for pool in self._pools.values():
+            pool.close()
+
+
+async def serve(directory, host, port, pool_size, duplicates="flag"):
+    """
+    runs the server until interrupted
+
+    :return: returns nothing
+    """
+    server = ExpenseServer(directory, pool_size, duplicates=duplicates)
+    port = await server.start(host, port)
+    print("Serving expenses from {} on http://{}:{}/".format(os.path.abspath(directory), host, port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON API for the expense tracker")
+    parser.add_argument("--dir", default=".", help="directory holding the user databases")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--pool-size", type=int, default=4, help="SQLite connections per user database")
+    parser.add_argument("--duplicates", choices=Assignment1.DUPLICATE_POLICIES, default="flag",
+                        help="what posting an expense which was already logged does")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.dir, args.host, args.port, args.pool_size, args.duplicates))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,136 @@
+"""
+Load test for expense_server.py. Opens a number of keep-alive client connections which send a mix of expense
+logging, range views, reports and percentage requests, then prints the p50/p99 latency and requests/second.
+Exits with status 1 if any request was answered with an error.
+
+    python load_test.py --serve /tmp/loadtest --users 4 --concurrency 32 --requests 5000
+    python load_test.py --port 8080 --users 4 --concurrency 32 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import expense_server
+
+CATEGORIES = ["Food", "Gas", "Rent", "Fun", "Travel", "Health"]
+
+
+def percentile(values, fraction):
+    """
+    nearest rank percentile
+
+    :param values: accepts sorted LIST of numbers
+    :param fraction: accepts FLOAT between 0 and 1
+    :return: returns the percentile, or 0 if values is empty
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def next_request(rng, users):
+    """
+    picks the next request of the mix: 30% logging, 40% month views, 20% reports and 10% percentages
+
+    :param rng: accepts random.Random
+    :param users: LIST of user names
+    :return: returns a TUPLE of (method, path, body or None)
+    """
+    user = rng.choice(users)
+    year = rng.randint(2019, 2021)
+    month = rng.randint(1, 12)
+    choice = rng.random()
+    if choice < 0.3:
+        body = dict(amount=round(rng.uniform(1, 200), 2), category=rng.choice(CATEGORIES), note="load test",
+                    date="{}-{:02d}-{:02d}".format(year, month, rng.randint(1, 28)))
+        return "POST", "/users/{}/expenses".format(user), body
+    if choice < 0.7:
+        return "GET", "/users/{}/expenses?year={}&month={}".format(user, year, month), None
+    if choice < 0.9:
+        return "GET", "/users/{}/report?year={}&month={}".format(user, year, month), None
+    return "GET", "/users/{}/percentages?year={}".format(user, year), None
+
+
+async def client(host, port, users, deadline, remaining, latencies, errors, seed):
+    """
+    sends requests over one keep-alive connection until the deadline passes or no requests remain
+
+    :return: returns nothing, appends to latencies and errors
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline and remaining[0] > 0:
+            remaining[0] -= 1
+            method, path, body = next_request(rng, users)
+            payload = json.dumps(body).encode() if body is not None else b""
+            started = time.perf_counter()
+            writer.write("{} {} HTTP/1.1\r\nHost: {}\r\nContent-Length: {}\r\n\r\n"
+                         .format(method, path, host, len(payload)).encode() + payload)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    """
+    runs the load test, starting an in-process server first if --serve was given
+
+    :return: returns the LIST of error statuses received, prints the results
+    """
+    server = None
+    port = args.port
+    if args.serve:
+        server = expense_server.ExpenseServer(args.serve, args.pool_size)
+        port = await server.start(args.host, 0)
+    users = ["loadtest{}".format(number) for number in range(args.users)]
+    latencies = []
+    errors = []
+    remaining = [args.requests if args.requests else float("inf")]
+    started = time.perf_counter()
+    deadline = started + (args.duration if args.duration else float("inf"))
+    try:
+        await asyncio.gather(*(client(args.host, port, users, deadline, remaining, latencies, errors, seed)
+                               for seed in range(args.concurrency)))
+    finally:
+        if server is not None:
+            await server.close()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print("requests:     {}".format(len(latencies)))
+    print("errors:       {}".format(len(errors)))
+    for status in sorted(set(errors)):
+        print("  {} {}: {}".format(status, expense_server.REASONS.get(status, ""), errors.count(status)))
+    print("requests/sec: {:.1f}".format(len(latencies) / elapsed if elapsed else 0))
+    print("p50 latency:  {:.2f} ms".format(percentile(latencies, 0.50) * 1000))
+    print("p99 latency:  {:.2f} ms".format(percentile(latencies, 0.99) * 1000))
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the expense tracker HTTP API")
+    parser.add_argument("--host", default="127.0.0.1", help="server address")
+    parser.add_argument("--port", type=int, default=8080, help="server port")
+    parser.add_argument("--serve", metavar="DIR", help="start a server in this process using the databases in DIR")
+    parser.add_argument("--pool-size", type=int, default=4, help="connections per database with --serve")
+    parser.add_argument("--users", type=int, default=4, help="number of user databases to spread requests over")
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous client connections")
+    parser.add_argument("--requests", type=int, default=2000, help="total requests, 0 for no limit")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run for, 0 for no limit")
+    sys.exit(1 if asyncio.run(run(parser.parse_args())) else 0)
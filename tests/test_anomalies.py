@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+import Assignment1
+
+# a Monday, weeks of the norms start on Monday
+FIRST_DAY = datetime.date(2021, 3, 1)
+
+
+@pytest.fixture
+def user(tmp_path):
+    user = Assignment1.User(str(tmp_path / "anomalies.db"), interactive=False, cache_size=0)
+    yield user
+    user.user_db.close()
+
+
+def log(user, amount, category, date, note=""):
+    assert user.log_previous_expenses(amount, category, date.day, date.month, date.year, note)
+    return user.anomalies
+
+
+def test_outlier_is_flagged_and_typical_expense_is_not(user):
+    for number in range(Assignment1.ANOMALY_MIN_COUNT):
+        assert log(user, 10 + number % 3, "Food", FIRST_DAY + datetime.timedelta(days=number)) == []
+    assert log(user, 12, "Food", FIRST_DAY + datetime.timedelta(days=10)) == []
+    anomaly, = log(user, 200, "Food", FIRST_DAY + datetime.timedelta(days=11), "party")
+    assert (anomaly.kind, anomaly.category, anomaly.amount, anomaly.date) == ("amount", "Food", 200.0, "2021-03-12")
+    assert anomaly.expected == pytest.approx(11, abs=0.1)
+    assert anomaly.score > Assignment1.ANOMALY_Z
+    # other categories have norms of their own
+    assert log(user, 200, "Rent", FIRST_DAY + datetime.timedelta(days=12)) == []
+
+
+def test_nothing_is_flagged_before_the_category_has_a_norm(user):
+    for number in range(Assignment1.ANOMALY_MIN_COUNT - 1):
+        log(user, 10, "Food", FIRST_DAY + datetime.timedelta(days=number))
+    assert log(user, 1000, "Food", FIRST_DAY + datetime.timedelta(days=9)) == []
+
+
+def test_weekly_spike_is_flagged_once(user):
+    weeks = Assignment1.ANOMALY_MIN_WEEKS + 2
+    for week in range(weeks):
+        for day in (0, 3):
+            assert log(user, 10, "Fun", FIRST_DAY + datetime.timedelta(weeks=week, days=day)) == []
+    spike_week = FIRST_DAY + datetime.timedelta(weeks=weeks)
+    # four typical expenses take the week to twice its average of $20, the fifth goes past it
+    for day in range(4):
+        assert log(user, 10, "Fun", spike_week + datetime.timedelta(days=day)) == []
+    anomaly, = log(user, 10, "Fun", spike_week + datetime.timedelta(days=4))
+    assert (anomaly.kind, anomaly.amount, anomaly.expected) == ("week", 50.0, 20.0)
+    assert anomaly.score == 2.5
+    assert log(user, 10, "Fun", spike_week + datetime.timedelta(days=5)) == []
+
+
+def test_backfill_rebuilds_the_same_state(user):
+    for number in range(30):
+        log(user, 5 + number % 7, "Food", FIRST_DAY + datetime.timedelta(days=number * 2))
+    state = user.user_db.execute("""SELECT * FROM ANOMALY_STATE ORDER BY 1""").fetchall()
+    user.user_db.execute("""DELETE FROM ANOMALY_STATE""")
+    user.user_db.commit()
+    assert user.backfill_anomalies() == 30
+    rebuilt = user.user_db.execute("""SELECT * FROM ANOMALY_STATE ORDER BY 1""").fetchall()
+    assert rebuilt == [pytest.approx(row) for row in state]
+    assert log(user, 500, "Food", FIRST_DAY + datetime.timedelta(days=61))[0].kind == "amount"
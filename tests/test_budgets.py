@@ -0,0 +1,61 @@
+import pytest
+
+import Assignment1
+
+
+@pytest.fixture(params=[False, True], ids=["single", "partitioned"])
+def user(tmp_path, request):
+    user = Assignment1.User(str(tmp_path / "budgets.db"), interactive=False, cache_size=0, partitioned=request.param)
+    yield user
+    user.user_db.close()
+
+
+def statuses(user, year, month):
+    return {(status.category, status.period): status for status in user.budget_status(year, month)}
+
+
+def test_thresholds_are_reported_by_the_write_crossing_them(user):
+    user.set_budget("food", 100)
+    assert user.log_previous_expenses(60, "Food", 1, 3, 2021)
+    assert [(status.spent, status.remaining, status.crossed) for status in user.budget_alerts] == [(60.0, 40.0, [50])]
+    assert user.log_previous_expenses(39.99, "Food", 2, 3, 2021)
+    alert, = user.budget_alerts
+    assert (alert.percentage, alert.remaining, alert.crossed) == (99.99, 0.01, [80])
+    assert user.log_previous_expenses(0.01, "Food", 3, 3, 2021)
+    alert, = user.budget_alerts
+    assert (alert.spent, alert.remaining, alert.percentage, alert.crossed) == (100.0, 0.0, 100.0, [100])
+    assert user.log_previous_expenses(5, "Food", 4, 3, 2021)
+    assert user.budget_alerts[0].crossed == []
+    assert user.budget_alerts[0].remaining == -5.0
+
+
+def test_one_write_can_cross_every_threshold(user):
+    user.set_budget("rent", 900)
+    assert user.log_previous_expenses(900, "Rent", 1, 3, 2021)
+    assert user.budget_alerts[0].crossed == [50, 80, 100]
+    assert user.log_previous_expenses(10, "Food", 1, 3, 2021)
+    assert user.budget_alerts == []
+
+
+def test_spending_is_counted_in_its_own_month_and_year(user):
+    user.set_budget("food", 100)
+    user.set_budget("food", 1000, "year")
+    for amount, day, month, year in [(30, 28, 2, 2021), (40, 1, 3, 2021), (20, 31, 3, 2021), (50, 1, 4, 2021),
+                                     (70, 31, 12, 2020), (80, 1, 1, 2022)]:
+        assert user.log_previous_expenses(amount, "Food", day, month, year)
+    assert user.log_previous_expenses(15, "Gas", 15, 3, 2021)
+    march = statuses(user, 2021, 3)
+    assert (march["Food", "month"].spent, march["Food", "month"].remaining) == (60.0, 40.0)
+    assert (march["Food", "year"].spent, march["Food", "year"].month) == (140.0, None)
+    assert (march["Gas", "month"].spent, march["Gas", "month"].budget) == (15.0, None)
+    assert statuses(user, 2021, 5)["Food", "month"].spent == 0.0
+
+
+def test_removed_budget_is_no_longer_checked(user):
+    user.set_budget("food", 100)
+    user.set_budget("food", None)
+    assert user.log_previous_expenses(500, "Food", 1, 3, 2021)
+    assert user.budget_alerts == []
+    assert statuses(user, 2021, 3)["Food", "month"].budget is None
+    with pytest.raises(ValueError):
+        user.set_budget("food", 100, "week")
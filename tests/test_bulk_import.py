@@ -0,0 +1,79 @@
+import csv
+import os
+
+import Assignment1
+
+
+def write_file(path, lines):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return str(path)
+
+
+def read_rejects(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.reader(file))
+
+
+def open_user(tmp_path, duplicates="flag"):
+    return Assignment1.User(str(tmp_path / "import.db"), interactive=False, cache_size=0, duplicates=duplicates)
+
+
+def test_malformed_rows_are_rejected_without_stopping_the_import(tmp_path):
+    path = write_file(tmp_path / "expenses.csv", [
+        "date,category,amount,note",
+        "2021-03-01,food,12.50,lunch",
+        "2021-03-02,gas,twelve,",
+        "2021-03-03,,4.00,no category",
+        "03/04/2021,rent,900,",
+        "2021-13-05,fun,5,bad month",
+        "2021-03-06,fun",
+        "2021/03/07,fun,7.25,movie",
+    ])
+    user = open_user(tmp_path)
+    try:
+        result = user.bulk_import(path, batch_size=2)
+        assert (result.imported, result.rejected) == (3, 4)
+        assert sorted(user.grab_period(2021, 3)) == [(7.25, "Fun", "movie", "2021-03-07"),
+                                                     (12.5, "Food", "lunch", "2021-03-01"),
+                                                     (900.0, "Rent", "", "2021-03-04")]
+    finally:
+        user.user_db.close()
+    rejects = read_rejects(path + ".rejects.csv")
+    assert [row[0] for row in rejects] == ["3", "4", "6", "7"]
+    assert rejects[0][-1] == "amount 'twelve' is not a number"
+    assert rejects[1][-1] == "category is empty"
+    assert rejects[2][-1] == "date '2021-13-05' is not a valid date"
+    assert rejects[3] == ["7", "2021-03-06", "fun", "expected AMOUNT, CATEGORY, NOTE, DATE but got 2 fields"]
+
+
+def test_clean_file_writes_no_reject_file(tmp_path):
+    path = write_file(tmp_path / "expenses.tsv", ["12.5\tfood\tlunch\t2021-03-01", "3\tgas\t\t2021-03-02"])
+    reject_path = str(tmp_path / "rejects.csv")
+    user = open_user(tmp_path)
+    try:
+        result = user.bulk_import(path, reject_path=reject_path)
+    finally:
+        user.user_db.close()
+    assert (result.imported, result.rejected) == (2, 0)
+    assert not os.path.exists(reject_path)
+
+
+def test_duplicates_are_rejected_under_the_reject_policy(tmp_path):
+    user = open_user(tmp_path, "reject")
+    try:
+        assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "lunch")
+        path = write_file(tmp_path / "expenses.csv", [
+            "12.50,food,Lunch ,2021-03-01",
+            "3,gas,,2021-03-02",
+            "3,gas,,2021-03-02",
+            "4,fun,,2021-03-03",
+        ])
+        result = user.bulk_import(path, batch_size=10)
+        assert (result.imported, result.rejected, result.duplicates) == (2, 2, 2)
+        assert len(user.grab_period(2021, 3)) == 3
+    finally:
+        user.user_db.close()
+    reasons = {row[0]: row[-1] for row in read_rejects(path + ".rejects.csv")}
+    assert reasons["1"].startswith("duplicate of expense ")
+    assert reasons["3"] == "duplicate of an earlier row"
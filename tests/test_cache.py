@@ -0,0 +1,65 @@
+import json
+import pickle
+
+import Assignment1
+
+
+def open_user(path):
+    return Assignment1.User(str(path), interactive=False, persistent_cache=True)
+
+
+def analytics(user):
+    return dict(report=user.monthly_report_data(3, 2021), changes=user.monthly_changes(2021),
+                percentages=user.category_percentages(2021), average=user.yearly_avg(2021),
+                statistics={category: stats.summary() for category, stats in user.period_statistics(2021).items()})
+
+
+def test_saved_results_are_served_by_the_next_run(tmp_path):
+    path = tmp_path / "cached.db"
+    user = open_user(path)
+    for day, amount, category in [(1, 12.5, "Food"), (2, 40, "Gas"), (15, 7.25, "Food"), (3, 900, "Rent")]:
+        assert user.log_previous_expenses(amount, category, day, 3, 2021)
+    assert user.log_previous_expenses(20, "Food", 4, 2, 2021)
+    first = analytics(user)
+    user.save_cache()
+    user.user_db.close()
+    with open(Assignment1.cache_path(str(path)), encoding="utf-8") as file:
+        assert json.load(file)["results"]
+
+    user = open_user(path)
+    try:
+        assert analytics(user) == first
+        assert (user.cache.hits, user.cache.misses) == (5, 0)
+        assert isinstance(user.monthly_report_data(3, 2021), Assignment1.MonthlyReport)
+    finally:
+        user.user_db.close()
+
+
+def test_unreadable_cache_files_load_empty(tmp_path):
+    path = str(tmp_path / "results.cache")
+    contents = [pickle.dumps(dict(version=1, results=[])), b"{\"version\": 1, \"results\": [", b"[]",
+                json.dumps(dict(version=1, results=[[{"tuple": ["yearly_avg", 2021]}, {"namedtuple": ["User", []]}]]))
+                .encode(),
+                json.dumps(dict(version=1, results=[[{"tuple": ["yearly_avg", 2021]}, {"pickle": "x"}]])).encode()]
+    for content in contents:
+        with open(path, "wb") as file:
+            file.write(content)
+        cache = Assignment1.ResultCache.load(path)
+        assert len(cache) == 0
+        assert cache.version is None
+    assert len(Assignment1.ResultCache.load(str(tmp_path / "missing.cache"))) == 0
+
+
+def test_data_handed_in_is_not_cached(tmp_path):
+    user = Assignment1.User(str(tmp_path / "cached.db"), interactive=False)
+    try:
+        assert user.log_previous_expenses(10, "Food", 1, 3, 2021)
+        data = [(float(amount), "Food", "", "2021-03-01") for amount in range(1, 1001)]
+        assert user.category_avg("Food", data) == 500.5
+        assert user.category_avg("Food", tuple(data[:10])) == 5.5
+        assert (len(user.cache), user.cache.misses) == (0, 0)
+        assert user.category_avg("Food") == 10.0
+        assert user.category_avg("Food") == 10.0
+        assert (len(user.cache), user.cache.hits) == (1, 1)
+    finally:
+        user.user_db.close()
@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+import Assignment1
+
+
+@pytest.fixture
+def user(tmp_path):
+    user = Assignment1.User(str(tmp_path / "concurrent.db"), interactive=False, cache_size=0, concurrent=True)
+    yield user
+    user.connections.close()
+    user.user_db.close()
+
+
+def count(statistics):
+    return sum(stats.count for stats in statistics.values())
+
+
+def test_reads_run_while_a_write_is_open(user):
+    assert user.log_previous_expenses(10, "Food", 1, 3, 2021)
+    assert user.log_previous_expenses(20, "Gas", 2, 3, 2021)
+    writing = threading.Event()
+    done_reading = threading.Event()
+
+    def write():
+        with user.connections.writing() as conn:
+            conn.execute("""BEGIN IMMEDIATE""")
+            conn.execute("""DELETE FROM EXPENSES""")
+            writing.set()
+            # keeps the write transaction open until the report ran, failing instead of hanging if it blocked
+            done_reading.wait(10)
+            conn.execute("""ROLLBACK""")
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        assert writing.wait(10)
+        statistics = user.parallel_statistics(2021)
+        rows = user.grab_period(2021, 3)
+        finished_while_writing = thread.is_alive()
+    finally:
+        done_reading.set()
+        thread.join()
+    assert finished_while_writing
+    assert count(statistics) == 2
+    assert len(rows) == 2
+
+
+def test_writes_commit_while_a_read_is_open(user):
+    assert user.log_previous_expenses(10, "Food", 1, 3, 2021)
+    reader = user.connections.reader()
+    reader.execute("""BEGIN""")
+    assert reader.execute("""SELECT COUNT(*) FROM EXPENSES""").fetchone()[0] == 1
+    saved = []
+    thread = threading.Thread(target=lambda: saved.append(user.log_previous_expenses(20, "Gas", 2, 3, 2021)))
+    thread.start()
+    thread.join(10)
+    try:
+        assert saved == [True]
+        # the open read transaction keeps its snapshot
+        assert reader.execute("""SELECT COUNT(*) FROM EXPENSES""").fetchone()[0] == 1
+    finally:
+        reader.execute("""COMMIT""")
+    assert reader.execute("""SELECT COUNT(*) FROM EXPENSES""").fetchone()[0] == 2
+
+
+def test_threads_logging_through_one_user(user):
+    threads, per_thread = 8, 25
+    results = []
+
+    def log(number):
+        for index in range(per_thread):
+            results.append(user.log_previous_expenses(number + 1, "Category{}".format(number), index % 28 + 1, 3,
+                                                      2021, "thread {}".format(number)))
+
+    workers = [threading.Thread(target=log, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert results == [True] * threads * per_thread
+    statistics = user.parallel_statistics(2021, 3)
+    assert count(statistics) == threads * per_thread
+    assert sorted(statistics) == sorted("Category{}".format(number) for number in range(threads))
+
+
+def test_cache_ignores_uncommitted_writes_of_other_threads(tmp_path):
+    user = Assignment1.User(str(tmp_path / "cached.db"), interactive=False, concurrent=True)
+    try:
+        assert user.log_previous_expenses(10, "Food", 1, 3, 2021)
+        assert user.yearly_avg(2021) == 10.0
+        writing = threading.Event()
+        done_reading = threading.Event()
+
+        def write():
+            with user.connections.writing() as conn:
+                conn.execute("""BEGIN IMMEDIATE""")
+                conn.execute("""UPDATE EXPENSES SET CENTS = CENTS * 10""")
+                writing.set()
+                done_reading.wait(10)
+                conn.commit()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        try:
+            assert writing.wait(10)
+            # computed over the reader's snapshot from before the update
+            assert user.yearly_avg(2021) == 10.0
+        finally:
+            done_reading.set()
+            thread.join()
+        assert user.yearly_avg(2021) == 100.0
+        assert user.cache.hits > 0
+    finally:
+        user.connections.close()
+        user.user_db.close()
@@ -0,0 +1,86 @@
+import pytest
+
+import Assignment1
+
+
+@pytest.fixture
+def open_user(tmp_path):
+    users = []
+
+    def open_user(duplicates="flag"):
+        user = Assignment1.User(str(tmp_path / "dedupe.db"), interactive=False, cache_size=0, duplicates=duplicates)
+        users.append(user)
+        return user
+
+    yield open_user
+    for user in users:
+        user.user_db.close()
+
+
+def test_flag_saves_the_repeat_and_reports_it(open_user):
+    user = open_user("flag")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "Lunch")
+    assert user.duplicates == []
+    assert user.log_previous_expenses(12.5, "food", 1, 3, 2021, "  lunch ")
+    assert len(user.duplicates) == 1
+    duplicate = user.duplicates[0]
+    assert (duplicate.amount, duplicate.category, duplicate.date, duplicate.rejected) == (12.5, "Food", "2021-03-01",
+                                                                                         False)
+    assert duplicate.duplicate_of is not None
+    assert len(user.grab_period(2021, 3)) == 2
+
+
+def test_reject_does_not_save_the_repeat(open_user):
+    user = open_user("reject")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "lunch")
+    assert not user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "LUNCH")
+    assert [duplicate.rejected for duplicate in user.duplicates] == [True]
+    assert user.write_error is None
+    assert len(user.grab_period(2021, 3)) == 1
+
+
+def test_allow_saves_without_screening(open_user):
+    user = open_user("allow")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "lunch")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "lunch")
+    assert user.duplicates == []
+    assert len(user.grab_period(2021, 3)) == 2
+
+
+def test_different_note_category_or_day_is_not_a_duplicate(open_user):
+    user = open_user("reject")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "lunch")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "dinner")
+    assert user.log_previous_expenses(12.5, "Gas", 1, 3, 2021, "lunch")
+    assert user.log_previous_expenses(12.5, "Food", 2, 3, 2021, "lunch")
+    assert user.duplicates == []
+
+
+def test_near_duplicates_groups_same_amounts_days_apart(open_user):
+    user = open_user("allow")
+    for day, amount, category in [(1, 20, "Food"), (3, 20, "Gas"), (6, 20, "Food"), (20, 20, "Food"),
+                                  (2, 7.5, "Fun"), (2, 7.5, "Fun"), (15, 9, "Rent")]:
+        assert user.log_previous_expenses(amount, category, day, 3, 2021)
+    groups = user.near_duplicates()
+    assert sorted([(amount, date) for _, amount, _, _, date in group] for group in groups) == [
+        [(7.5, "2021-03-02"), (7.5, "2021-03-02")],
+        [(20.0, "2021-03-01"), (20.0, "2021-03-03"), (20.0, "2021-03-06")],
+    ]
+    # the 20s are chained through the Gas expense between them, without it and with a smaller gap they stay apart
+    assert len(user.near_duplicates(1)) == 1
+    assert user.near_duplicates(category="Food") == []
+    assert [len(group) for group in user.near_duplicates(5, category="Food")] == [2]
+
+
+def test_remove_duplicates_keeps_the_first(open_user):
+    user = open_user("allow")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "lunch")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "Lunch")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "lunch ")
+    assert user.log_previous_expenses(12.5, "Food", 1, 3, 2021, "dinner")
+    assert user.log_previous_expenses(12.5, "Gas", 1, 3, 2021, "lunch")
+    first_id = user.near_duplicates(0)[0][0][0]
+    assert user.remove_duplicates() == 2
+    assert sorted(note for _, _, note, _ in user.grab_period(2021, 3)) == ["dinner", "lunch", "lunch"]
+    assert first_id in [expense[0] for group in user.near_duplicates(0) for expense in group]
+    assert user.remove_duplicates() == 0
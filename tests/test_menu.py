@@ -0,0 +1,16 @@
+import Assignment1
+
+
+def test_date_range_menu_asks_again_for_year_zero(tmp_path, monkeypatch, capsys):
+    user = Assignment1.User(str(tmp_path / "menu.db"), interactive=False)
+    try:
+        assert user.log_previous_expenses(12.5, "Food", 3, 3, 2021, "lunch")
+        monkeypatch.setattr(Assignment1, "user", user, raising=False)
+        answers = iter(["1", "0", "2021", "3", "1", "0", "2021", "3", "5"])
+        monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+        Assignment1.menu_function14()
+    finally:
+        user.user_db.close()
+    output = capsys.readouterr().out
+    assert output.count("Please select an appropriate value.") == 2
+    assert "From 2021-03-01 to 2021-03-05 you had 1 expenses totaling $12.5" in output
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+import Assignment1
+
+# rows as the original layout stored them, AMOUNT in dollars and DATE as text
+V1_ROWS = [(12.5, "Food", "lunch", "2020-01-31"), (3, "Gas", "", "2020-02-01"), (40.25, "Food", "dinner", "2021-07-04"),
+           (0.1, "Fun", "gum", "2021-07-04"), (7.35, "Rent", "", "2021-12-31")]
+
+
+def create_v1(path, rows=V1_ROWS):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE EXPENSES (AMOUNT integer, CATEGORY text, NOTE text, DATE date)""")
+    conn.executemany("""INSERT INTO EXPENSES VALUES (?, ?, ?, ?)""", rows)
+    conn.commit()
+    return conn
+
+
+def test_v1_is_migrated_to_the_current_layout(tmp_path):
+    conn = create_v1(str(tmp_path / "old.db"))
+    assert Assignment1.schema_version(conn) == 1
+    # a batch smaller than the table, so the copy takes several transactions
+    assert Assignment1.upgrade_database(conn, batch_size=2) == 1
+    assert conn.execute("""PRAGMA user_version""").fetchone()[0] == Assignment1.SCHEMA_VERSION
+    assert conn.execute("""SELECT CENTS FROM EXPENSES ORDER BY ID""").fetchall() == [(1250,), (300,), (4025,), (10,),
+                                                                                     (735,)]
+    assert [name for name, in conn.execute("""SELECT NAME FROM CATEGORIES ORDER BY ID""")] == ["Food", "Gas", "Fun",
+                                                                                             "Rent"]
+    assert Assignment1.upgrade_database(conn) == Assignment1.SCHEMA_VERSION
+    conn.close()
+
+
+def test_migrated_database_reads_like_the_original(tmp_path):
+    path = str(tmp_path / "old.db")
+    create_v1(path).close()
+    user = Assignment1.User(path, interactive=False, cache_size=0)
+    try:
+        assert sorted(user.grab_period()) == sorted((float(amount), category, note, date)
+                                                    for amount, category, note, date in V1_ROWS)
+        assert sorted(user.grab_period(2021, 7)) == [(0.1, "Fun", "gum", "2021-07-04"),
+                                                     (40.25, "Food", "dinner", "2021-07-04")]
+        report = user.category_percentages(2021)
+        assert set(report) == {"Food", "Fun", "Rent"}
+        assert user.log_previous_expenses(1.5, "Food", 5, 7, 2021)
+        assert len(user.grab_period(2021, 7)) == 3
+    finally:
+        user.user_db.close()
+
+
+def test_unreadable_v1_row_stops_the_migration(tmp_path):
+    conn = create_v1(str(tmp_path / "old.db"), V1_ROWS + [(1, "Food", "", "yesterday")])
+    with pytest.raises(ValueError):
+        Assignment1.upgrade_database(conn)
+    # the original table is left as it was
+    assert conn.execute("""SELECT COUNT(*) FROM EXPENSES""").fetchone()[0] == len(V1_ROWS) + 1
+    assert Assignment1.schema_version(conn) == 1
+    conn.close()
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+import Assignment1
+
+# expenses around new year, so queries cross the boundary between two partitions
+EXPENSES = [(12.5, "Food", "lunch", 30, 12, 2020), (40, "Gas", "", 31, 12, 2020), (7.25, "Food", "coffee", 1, 1, 2021),
+            (900, "Rent", "january", 1, 1, 2021), (3.5, "Food", "gum", 15, 1, 2021), (60, "Gas", "", 14, 6, 2019)]
+
+
+@pytest.fixture
+def users(tmp_path):
+    opened = []
+
+    def open_user(name, **options):
+        user = Assignment1.User(str(tmp_path / name), interactive=False, cache_size=0, **options)
+        opened.append(user)
+        return user
+
+    yield open_user
+    for user in opened:
+        user.user_db.close()
+
+
+def log(user):
+    for amount, category, note, day, month, year in EXPENSES:
+        assert user.log_previous_expenses(amount, category, day, month, year, note)
+
+
+def figures(user):
+    return dict(
+        everything=sorted(user.grab_period()), year=sorted(user.grab_period(2021)),
+        month=sorted(user.grab_period(2020, 12)),
+        range=sorted(user.grab_period(start="2020-12-31", end="2021-01-01")),
+        category=sorted(user.grab_period(start="2020-01-01", end="2021-12-31", category="Food")),
+        percentages=[user.category_percentages(), user.category_percentages(2020), user.category_percentages(2021, 1)],
+        report=user.monthly_report_data(1, 2021), statistics=user.period_statistics(2021)["Food"].summary())
+
+
+def test_partitioned_and_single_file_agree(users, tmp_path):
+    single = users("single.db")
+    partitioned = users("partitioned.db", partitioned=True)
+    log(single)
+    log(partitioned)
+    assert sorted(partitioned.partitions) == [2019, 2020, 2021]
+    assert sorted(os.listdir(Assignment1.partition_directory(partitioned.path))) == [
+        os.path.basename(Assignment1.partition_path(partitioned.path, year)) for year in (2019, 2020, 2021)]
+    expected = figures(single)
+    assert len(expected["range"]) == 3
+    assert figures(partitioned) == expected
+
+
+def test_partitioning_an_existing_database_keeps_its_figures(users):
+    user = users("existing.db")
+    log(user)
+    expected = figures(user)
+    assert user.partition_expenses() == {2019: 1, 2020: 2, 2021: 3}
+    assert figures(user) == expected
+    assert user.user_db.execute("""SELECT COUNT(*) FROM main.EXPENSES""").fetchone()[0] == 0
+    # a database whose partition directory exists is opened partitioned
+    reopened = users("existing.db")
+    assert sorted(reopened.partitions) == [2019, 2020, 2021]
+    assert figures(reopened) == expected
+
+
+def test_archived_partition_is_read_only_but_still_read(users):
+    user = users("archived.db", partitioned=True)
+    log(user)
+    expected = figures(user)
+    user.archive_partition(2020)
+    assert 2020 in user.archived
+    assert not os.stat(Assignment1.partition_path(user.path, 2020)).st_mode & 0o200
+    assert figures(user) == expected
+    assert user.log_previous_expenses(1, "Food", 2, 1, 2021, "more")
+    assert len(user.grab_period(2021)) == 4
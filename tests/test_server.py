@@ -0,0 +1,74 @@
+import asyncio
+import json
+import sqlite3
+
+import expense_server
+
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write("{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\nConnection: close\r\n\r\n"
+                 .format(method, path, len(payload)).encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(content)
+
+
+def serve(directory, requests, **options):
+    async def run():
+        server = expense_server.ExpenseServer(str(directory), **options)
+        port = await server.start("127.0.0.1", 0)
+        try:
+            return await requests(port)
+        finally:
+            await server.close()
+    return asyncio.run(run())
+
+
+def test_concurrent_posts_are_all_saved(tmp_path):
+    expenses = [dict(amount=index + 1, category="Food", note="lunch {}".format(index),
+                     date="2021-03-{:02d}".format(index % 28 + 1)) for index in range(64)]
+
+    async def requests(port):
+        posted = await asyncio.gather(*(request(port, "POST", "/users/alice/expenses", expense)
+                                        for expense in expenses))
+        listed = await request(port, "GET", "/users/alice/expenses?year=2021&month=3")
+        return posted, listed
+
+    posted, (status, listed) = serve(tmp_path, requests, pool_size=4)
+    assert [status for status, _ in posted] == [201] * len(expenses)
+    assert status == 200
+    assert sorted(expense["note"] for expense in listed) == sorted(expense["note"] for expense in expenses)
+
+
+def test_rejected_duplicate_answers_conflict(tmp_path):
+    expense = dict(amount=12.5, category="Food", note="lunch", date="2021-03-04")
+
+    async def requests(port):
+        first = await request(port, "POST", "/users/alice/expenses", expense)
+        second = await request(port, "POST", "/users/alice/expenses", expense)
+        return first, second
+
+    (first, _), (second, body) = serve(tmp_path, requests, duplicates="reject")
+    assert first == 201
+    assert second == 409
+    assert "error" in body
+
+
+def test_locked_database_answers_service_unavailable(tmp_path, monkeypatch):
+    monkeypatch.setattr(expense_server.time, "sleep", lambda seconds: None)
+
+    def locked(self, *args, **kwargs):
+        self.write_error = sqlite3.OperationalError("database is locked")
+        return False
+
+    monkeypatch.setattr(expense_server.Assignment1.User, "log_previous_expenses", locked)
+
+    async def requests(port):
+        return await request(port, "POST", "/users/alice/expenses", dict(amount=1, category="Food"))
+
+    status, _ = serve(tmp_path, requests)
+    assert status == 503